@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+ReAct过程事件
+在agent推理-调用工具循环中产生结构化事件（推理轮次开始/结束、工具调用开始/结束、子任务开始/结束、进入最终回答），
+通过回调实时推送给调用方，并分发给全局监听器（如运行指标）
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, Optional, List, Callable
+
+logger = logging.getLogger(__name__)
+
+# 事件类型
+REASONING_START = "reasoning_start"
+REASONING_END = "reasoning_end"
+TOOL_START = "tool_start"
+TOOL_END = "tool_end"
+ANSWER_START = "answer_start"
+# 多基金问题拆分的子任务开始/结束
+SUBTASK_START = "subtask_start"
+SUBTASK_END = "subtask_end"
+
+# 全局事件监听器，同步调用，不应执行耗时操作
+_listeners: List[Callable[["AgentEvent"], None]] = []
+
+
+def add_listener(listener: Callable[["AgentEvent"], None]) -> None:
+    """注册全局事件监听器，所有问题的事件都会分发给它"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+@dataclass
+class AgentEvent:
+    """ReAct过程中的一个事件"""
+
+    type: str
+    data: Dict[str, Any]
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class EventStream:
+    """单个问题处理过程中的事件流"""
+
+    def __init__(self, callback=None):
+        """
+        Args:
+            callback: 异步回调 callback(event: AgentEvent)，为None时只分发给全局监听器
+        """
+        self.callback = callback
+        self.round = 0
+        self.reasoning_started_at = None
+
+    async def emit(self, event_type: str, **data) -> None:
+        """发送事件，回调出错不影响agent运行"""
+        event = AgentEvent(event_type, data)
+        for listener in _listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.warning(f"ReAct事件监听器出错: {str(e)}")
+        if self.callback is None:
+            return
+        try:
+            await self.callback(event)
+        except Exception as e:
+            logger.warning(f"发送ReAct事件失败: {str(e)}")
+
+
+_current_stream: ContextVar[Optional[EventStream]] = ContextVar("agent_event_stream", default=None)
+
+
+def current_stream() -> Optional[EventStream]:
+    """当前问题的事件流，不在问题处理过程中时返回None"""
+    return _current_stream.get()
+
+
+@contextmanager
+def detached_events():
+    """在上下文内不属于任何问题的事件流（如后台预取），工具调用事件不会推送给当前问题的回调"""
+    token = _current_stream.set(None)
+    try:
+        yield
+    finally:
+        _current_stream.reset(token)
+
+
+@contextmanager
+def stream_events(callback=None):
+    """在上下文内产生ReAct事件，callback为None时事件只分发给全局监听器"""
+    stream = EventStream(callback)
+    token = _current_stream.set(stream)
+    try:
+        yield stream
+    finally:
+        _current_stream.reset(token)
+
+
+async def pre_reasoning_hook(agent, kwargs):
+    """pre_reasoning 钩子：推理轮次开始"""
+    stream = current_stream()
+    if stream is not None:
+        stream.round += 1
+        stream.reasoning_started_at = time.perf_counter()
+        await stream.emit(REASONING_START, round=stream.round)
+    return None
+
+
+async def post_reasoning_hook(agent, kwargs, output):
+    """post_reasoning 钩子：推理轮次结束，没有工具调用时进入最终回答"""
+    stream = current_stream()
+    if stream is None or output is None:
+        return None
+    tool_calls = [block["name"] for block in output.get_content_blocks("tool_use")]
+    duration_ms = (time.perf_counter() - stream.reasoning_started_at) * 1000
+    await stream.emit(
+        REASONING_END,
+        round=stream.round,
+        duration_ms=round(duration_ms, 1),
+        tool_calls=tool_calls,
+    )
+    if not tool_calls:
+        await stream.emit(ANSWER_START, round=stream.round)
+    return None
+
+
+def install_tool_events(toolkit) -> None:
+    """为MCP工具套上事件层，记录每次调用的参数、耗时和返回大小，重复调用不会重复包装"""
+    for name, tool in toolkit.tools.items():
+        layers = getattr(tool.original_func, "__tool_layers__", set())
+        if tool.mcp_name is None or "events" in layers:
+            continue
+        tool.original_func = _wrap(name, tool.original_func)
+
+
+def _wrap(tool_name, func):
+    async def call_tool(**kwargs):
+        # 不属于任何问题的调用（定时预取、推测预取、基金列表刷新）只分发给全局监听器，仍计入运行指标
+        stream = current_stream() or EventStream()
+        await stream.emit(TOOL_START, name=tool_name, args=kwargs, round=stream.round)
+        start = time.perf_counter()
+        try:
+            response = await func(**kwargs)
+        except Exception as e:
+            await stream.emit(
+                TOOL_END,
+                name=tool_name,
+                duration_ms=round((time.perf_counter() - start) * 1000, 1),
+                bytes=0,
+                error=str(e),
+            )
+            raise
+        size = len(json.dumps(response.content, ensure_ascii=False).encode("utf-8"))
+        await stream.emit(
+            TOOL_END,
+            name=tool_name,
+            duration_ms=round((time.perf_counter() - start) * 1000, 1),
+            bytes=size,
+            error=None,
+        )
+        return response
+
+    call_tool.__tool_layers__ = getattr(func, "__tool_layers__", set()) | {"events"}
+    return call_tool
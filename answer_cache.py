@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+问答结果缓存
+按 规范化问题 + 当前交易日 缓存最终回答，重复提问时直接返回
+"""
+
+import datetime
+import json
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from fund_resolver import get_fund_resolver
+
+# NFKC 之外仍需统一的中文标点
+_PUNCTUATION_MAP = str.maketrans({
+    "。": ".",
+    "、": ",",
+    "“": '"',
+    "”": '"',
+    "‘": "'",
+    "’": "'",
+    "【": "[",
+    "】": "]",
+    "《": "<",
+    "》": ">",
+})
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[.,!?;~]+$")
+
+
+def normalize_question(question: str, fund_aliases: Optional[Dict[str, str]] = None, resolver=None) -> str:
+    """
+    规范化问题文本：全角转半角、统一标点、去除空白和结尾标点，并将基金名称替换为基金代码
+
+    Args:
+        question: 原始问题
+        fund_aliases: 基金名称/简称 -> 基金代码 的映射
+        resolver: 基金名称识别索引（FundResolver），提供时按索引识别别名之外的基金名称
+    """
+    text = unicodedata.normalize("NFKC", question).translate(_PUNCTUATION_MAP)
+    text = _WHITESPACE.sub("", text).lower()
+    text = _TRAILING_PUNCTUATION.sub("", text)
+    # 优先替换较长的名称，避免简称截断全称
+    for name in sorted(fund_aliases or {}, key=len, reverse=True):
+        normalized_name = _WHITESPACE.sub("", unicodedata.normalize("NFKC", name)).lower()
+        if normalized_name:
+            text = text.replace(normalized_name, fund_aliases[name])
+    if resolver is not None:
+        text = resolver.replace_mentions(text)
+    return text
+
+
+def current_trading_date(now: datetime.datetime, nav_publish_time: str = "21:00") -> datetime.date:
+    """
+    当前数据对应的交易日：当天净值发布前视为上一个交易日，周末视为上周五
+    """
+    hour, minute = (int(x) for x in nav_publish_time.split(":"))
+    date = now.date()
+    if now.time() < datetime.time(hour, minute):
+        date -= datetime.timedelta(days=1)
+    while date.weekday() >= 5:
+        date -= datetime.timedelta(days=1)
+    return date
+
+
+class AnswerCache:
+    """问答结果LRU缓存，按条目数和总字节数限制大小"""
+
+    def __init__(
+        self,
+        max_entries=500,
+        max_bytes=20 * 1024 * 1024,
+        nav_publish_time="21:00",
+        fund_aliases=None,
+        resolver=None,
+    ):
+        """
+        Args:
+            max_entries: 最多缓存的回答数
+            max_bytes: 缓存回答的总大小上限（字节）
+            nav_publish_time: 每日净值发布时间，发布后切换到新的交易日
+            fund_aliases: 基金名称/简称 -> 基金代码 的映射，用于规范化问题
+            resolver: 基金名称识别索引，用于规范化问题
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nav_publish_time = nav_publish_time
+        self.fund_aliases = fund_aliases or {}
+        self.resolver = resolver
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config) -> Optional["AnswerCache"]:
+        """根据 config["answer_cache"] 创建缓存，未启用时返回None"""
+        cache_config = (config or {}).get("answer_cache", {})
+        if not cache_config.get("enabled", True):
+            return None
+        return cls(
+            max_entries=cache_config.get("max_entries", 500),
+            max_bytes=cache_config.get("max_bytes", 20 * 1024 * 1024),
+            nav_publish_time=(config or {}).get("tool_cache", {}).get("nav_publish_time", "21:00"),
+            fund_aliases=cache_config.get("fund_aliases"),
+            resolver=get_fund_resolver(config),
+        )
+
+    def make_key(self, question: str) -> str:
+        trading_date = current_trading_date(datetime.datetime.now(), self.nav_publish_time)
+        return f"{trading_date.isoformat()}:{normalize_question(question, self.fund_aliases, self.resolver)}"
+
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存
+
+        Returns:
+            dict: {"answer", "cached_at"}，未命中时返回None
+        """
+        key = self.make_key(question)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, question: str, answer) -> None:
+        """写入缓存，超出大小限制时淘汰最久未使用的回答"""
+        key = self.make_key(question)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old["size"]
+
+        text = answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False)
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = {
+            "answer": answer,
+            "cached_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "size": size,
+        }
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["size"]
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+批量问答
+将一批问题通过预热的基金管理助手并发处理，按完成顺序逐条返回结果，单个问题失败不影响整批。
+供 POST /batch 接口和命令行批量模式共用；Web服务中每个问题都要先从问题调度器获取名额，
+与WebSocket提问共用预热池的并发上限
+
+命令行用法：
+    python batch.py questions.jsonl --concurrency 4 --output results.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Dict, Any, List, AsyncIterator
+
+from qieman_mcp import main, load_config, ERROR_PREFIX
+from fund_manager_pool import FundManagerPool
+
+logger = logging.getLogger(__name__)
+
+
+def parse_questions(items) -> List[Dict[str, Any]]:
+    """
+    规范化问题列表，每项为问题字符串或 {"id", "question"} 对象，未指定id时使用序号
+
+    Raises:
+        ValueError: 问题格式错误
+    """
+    questions = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict) or not str(item.get("question", "")).strip():
+            raise ValueError(f"第{index + 1}个问题格式错误: {item!r}")
+        questions.append({
+            "id": item.get("id", index),
+            "question": str(item["question"]).strip(),
+        })
+    return questions
+
+
+def parse_jsonl(text: str) -> List[Dict[str, Any]]:
+    """解析JSONL文本，每行一个问题（JSON字符串或对象），忽略空行"""
+    items = []
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第{line_no}行不是合法的JSON: {str(e)}")
+    return parse_questions(items)
+
+
+async def run_batch(
+    questions: List[Dict[str, Any]],
+    config,
+    pool: FundManagerPool,
+    concurrency: int = 4,
+    answer_cache=None,
+    force_refresh: bool = False,
+    scheduler=None,
+    client_id: str = "batch",
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    并发处理一批问题，按完成顺序逐条产出结果，最后产出汇总
+
+    Args:
+        questions: parse_questions 规范化后的问题列表
+        config: 配置参数
+        pool: 预热的基金管理助手池
+        concurrency: 同时处理的问题数
+        answer_cache: 问答缓存，提供时优先使用缓存并写入新结果
+        force_refresh: 为True时忽略问答缓存
+        scheduler: 问题调度器，提供时每个问题（未命中缓存）先获取处理名额
+        client_id: 在调度器中排队使用的客户端标识
+
+    Yields:
+        dict: {"type": "item", ...} 单个问题的结果；最后一条为 {"type": "summary", ...}
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    start = time.perf_counter()
+
+    async def run_one(item):
+        async with semaphore:
+            item_start = time.perf_counter()
+            result = {"type": "item", "id": item["id"], "question": item["question"]}
+            cached = None
+            if answer_cache is not None and not force_refresh:
+                cached = answer_cache.get(item["question"])
+            if cached is not None:
+                result.update(status="ok", response=cached["answer"], cached_at=cached["cached_at"])
+            else:
+                try:
+                    if scheduler is not None:
+                        async with scheduler.slot(client_id, reject_when_full=False):
+                            response = await main(item["question"], None, config, pool=pool)
+                    else:
+                        response = await main(item["question"], None, config, pool=pool)
+                except Exception as e:
+                    response = f"{ERROR_PREFIX}: {str(e)}"
+                if str(response).startswith(ERROR_PREFIX):
+                    result.update(status="error", error=response)
+                else:
+                    result.update(status="ok", response=response)
+                    if answer_cache is not None:
+                        answer_cache.put(item["question"], response)
+            result["duration_ms"] = round((time.perf_counter() - item_start) * 1000, 1)
+            return result
+
+    tasks = [asyncio.ensure_future(run_one(item)) for item in questions]
+    succeeded = failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result["status"] == "ok":
+                succeeded += 1
+            else:
+                failed += 1
+            yield result
+    finally:
+        # 调用方提前退出（如客户端断开）时取消未完成的问题
+        for task in tasks:
+            task.cancel()
+        # 等待取消完成，问题占用的调度名额和管理器归还后再返回
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    elapsed = time.perf_counter() - start
+    yield {
+        "type": "summary",
+        "total": len(questions),
+        "succeeded": succeeded,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_qpm": round(len(questions) / elapsed * 60, 2) if elapsed else 0.0,
+    }
+
+
+async def run_cli(args) -> None:
+    config = load_config()
+    with open(args.input, "r", encoding="utf-8") as f:
+        questions = parse_jsonl(f.read())
+
+    concurrency = args.concurrency or config.get("batch", {}).get("concurrency", 4)
+    # 池的大小不小于并发数，避免问题等待管理器
+    pool_config = dict(config.get("pool", {}))
+    pool_config["size"] = max(pool_config.get("size", 2), concurrency)
+    pool = FundManagerPool.from_config({**config, "pool": pool_config})
+    await pool.start()
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        async for result in run_batch(questions, config, pool, concurrency=concurrency):
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            if result["type"] == "item":
+                logger.info(f"[{result['status']}] {result['id']} {result['duration_ms']}ms")
+            else:
+                logger.info(
+                    f"批量处理完成：共 {result['total']} 个问题，成功 {result['succeeded']}，"
+                    f"失败 {result['failed']}，耗时 {result['elapsed_s']}s，"
+                    f"吞吐 {result['throughput_qpm']} 个/分钟"
+                )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        await pool.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="批量处理基金问题")
+    parser.add_argument("input", help="问题文件（JSONL），每行一个问题字符串或 {\"id\", \"question\"} 对象")
+    parser.add_argument("--concurrency", type=int, help="同时处理的问题数，默认使用配置 batch.concurrency")
+    parser.add_argument("--output", help="结果输出文件（JSONL），默认输出到标准输出")
+    asyncio.run(run_cli(parser.parse_args()))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试公用函数：百分位统计、峰值内存
+"""
+
+import os
+import sys
+
+
+def percentile(values, p):
+    """计算百分位数（线性插值）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def latency_summary(values_ms):
+    """汇总一组耗时（毫秒）：次数、平均、p50/p95/p99、最大"""
+    return {
+        "count": len(values_ms),
+        "mean_ms": round(sum(values_ms) / len(values_ms), 1) if values_ms else 0.0,
+        "p50_ms": round(percentile(values_ms, 50), 1),
+        "p95_ms": round(percentile(values_ms, 95), 1),
+        "p99_ms": round(percentile(values_ms, 99), 1),
+        "max_ms": round(max(values_ms), 1) if values_ms else 0.0,
+    }
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    if sys.platform == "darwin":
+        return round(usage / 1024 / 1024, 1)
+    return round(usage / 1024, 1)
+
+
+def project_root():
+    """项目根目录，基准脚本通过它导入项目模块"""
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
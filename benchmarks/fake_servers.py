@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试用的本地替身服务
+- 模拟qieman-mcp的SSE服务：提供几只基金的固定数据，可配置调用延迟
+- 模拟OpenAI兼容的对话接口：按脚本依次返回工具调用，最后流式返回回答，可配置首字延迟和输出速度
+
+用法：
+    python benchmarks/fake_servers.py --mcp-port 18101 --llm-port 18102 --mcp-latency 200 --tool-rounds 2
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import uuid
+import zlib
+from datetime import date, timedelta
+
+import uvicorn
+from aiohttp import web
+from mcp.server.fastmcp import FastMCP
+
+FUNDS = [
+    {"fundCode": "005827", "fundName": "易方达蓝筹精选混合", "manager": "张坤", "scale": 412.3},
+    {"fundCode": "003095", "fundName": "中欧医疗健康混合A", "manager": "葛兰", "scale": 186.5},
+    {"fundCode": "161725", "fundName": "招商中证白酒指数", "manager": "侯昊", "scale": 523.8},
+    {"fundCode": "110011", "fundName": "易方达优质精选混合", "manager": "张坤", "scale": 98.7},
+    {"fundCode": "260108", "fundName": "景顺长城新兴成长混合", "manager": "刘彦春", "scale": 231.4},
+    {"fundCode": "000001", "fundName": "华夏成长混合", "manager": "郑晓辉", "scale": 35.2},
+]
+
+# 每轮推理调用的工具，超过轮数时循环使用
+TOOL_SCRIPT = [
+    ["SearchFunds"],
+    ["GetFundDetail", "GetFundNavHistory"],
+    ["GetFundHolders", "GetFundNavHistory"],
+]
+
+
+def find_fund(text):
+    """从问题中找出基金，找不到时按问题文本固定选择一只"""
+    for fund in FUNDS:
+        if fund["fundCode"] in text or fund["fundName"][:4] in text:
+            return fund
+    return FUNDS[zlib.crc32(text.encode("utf-8")) % len(FUNDS)]
+
+
+def trading_days(days):
+    """截至昨天的最近 days 个工作日（YYYY-MM-DD，按日期升序），与真实净值数据的日期格式一致"""
+    result = []
+    day = date.today()
+    while len(result) < days:
+        day -= timedelta(days=1)
+        if day.weekday() < 5:
+            result.append(day.isoformat())
+    return result[::-1]
+
+
+def create_mcp_server(port, latency_ms, jitter_ms):
+    server = FastMCP("fake-qieman", host="127.0.0.1", port=port, log_level="WARNING")
+
+    async def delay():
+        await asyncio.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+
+    def by_code(fund_code):
+        for fund in FUNDS:
+            if fund["fundCode"] == fund_code:
+                return fund
+        return find_fund(fund_code)
+
+    @server.tool()
+    async def SearchFunds(keyword: str) -> str:
+        """按基金名称或代码搜索基金"""
+        await delay()
+        matches = [f for f in FUNDS if keyword in f["fundName"] or keyword in f["fundCode"]] or [find_fund(keyword)]
+        return json.dumps([{"fundCode": f["fundCode"], "fundName": f["fundName"]} for f in matches], ensure_ascii=False)
+
+    @server.tool()
+    async def GetFundDetail(fundCode: str) -> str:
+        """查询基金基本信息：名称、基金经理、规模"""
+        await delay()
+        return json.dumps(by_code(fundCode), ensure_ascii=False)
+
+    @server.tool()
+    async def GetFundNavHistory(fundCode: str, days: int = 60) -> str:
+        """查询基金历史净值"""
+        await delay()
+        rng = random.Random(fundCode)
+        nav = 1.0 + rng.random()
+        rows = []
+        for nav_date in trading_days(days):
+            nav *= 1 + rng.uniform(-0.02, 0.021)
+            rows.append({"navDate": nav_date, "nav": round(nav, 4), "accNav": round(nav + 1, 4)})
+        return json.dumps({"fundCode": fundCode, "navList": rows})
+
+    @server.tool()
+    async def GetFundHolders(fundCode: str) -> str:
+        """查询基金持有人结构"""
+        await delay()
+        return json.dumps({"fundCode": fundCode, "institution": 12.5, "individual": 86.1, "employee": 1.4})
+
+    return server
+
+
+def create_llm_app(ttft_ms, chunk_delay_ms, tool_rounds, parallel_tools, answer_chars):
+    async def chat(request):
+        body = await request.json()
+        messages = body["messages"]
+        question = next((m["content"] for m in messages if m.get("role") == "user"), "")
+        if isinstance(question, list):
+            question = "".join(block.get("text", "") for block in question if isinstance(block, dict))
+        fund = find_fund(question)
+        done_rounds = sum(1 for m in messages if m.get("role") == "assistant" and m.get("tool_calls"))
+
+        completion_id = "chatcmpl-" + uuid.uuid4().hex[:12]
+        if done_rounds < tool_rounds and body.get("tools"):
+            names = TOOL_SCRIPT[done_rounds % len(TOOL_SCRIPT)][:parallel_tools]
+            tool_calls = []
+            for index, name in enumerate(names):
+                args = {"keyword": fund["fundName"]} if name == "SearchFunds" else {"fundCode": fund["fundCode"]}
+                tool_calls.append({
+                    "index": index,
+                    "id": "call_" + uuid.uuid4().hex[:12],
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)},
+                })
+            deltas = [{"role": "assistant", "content": "先查询相关数据。", "tool_calls": tool_calls}]
+        else:
+            text = f"## {fund['fundName']}（{fund['fundCode']}）分析\n\n" + "基金经理、规模和净值走势整体稳健。" * 50
+            text = text[:answer_chars]
+            deltas = [{"role": "assistant", "content": text[i:i + 8]} for i in range(0, len(text), 8)]
+
+        chunks = [
+            {"id": completion_id, "object": "chat.completion.chunk", "created": 0, "model": body.get("model", "fake"),
+             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            for delta in deltas
+        ]
+        chunks.append({
+            "id": completion_id, "object": "chat.completion.chunk", "created": 0, "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": len(deltas) * 4, "total_tokens": 1000 + len(deltas) * 4},
+        })
+
+        await asyncio.sleep(ttft_ms / 1000)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for chunk in chunks:
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await asyncio.sleep(chunk_delay_ms / 1000)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat)
+    return app
+
+
+async def serve(args):
+    runner = web.AppRunner(create_llm_app(
+        args.llm_ttft, args.llm_chunk_delay, args.tool_rounds, args.parallel_tools, args.answer_chars,
+    ), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.llm_port).start()
+
+    mcp_server = create_mcp_server(args.mcp_port, args.mcp_latency, args.mcp_jitter)
+    config = uvicorn.Config(mcp_server.sse_app(), host="127.0.0.1", port=args.mcp_port, log_level="warning")
+    await uvicorn.Server(config).serve()
+
+
+def add_arguments(parser):
+    """替身服务的命令行参数，基准脚本启动替身服务时复用"""
+    parser.add_argument("--mcp-port", type=int, default=18101, help="MCP服务端口")
+    parser.add_argument("--llm-port", type=int, default=18102, help="模型服务端口")
+    parser.add_argument("--mcp-latency", type=float, default=200, help="MCP工具调用延迟（毫秒）")
+    parser.add_argument("--mcp-jitter", type=float, default=50, help="MCP工具调用延迟抖动（毫秒）")
+    parser.add_argument("--llm-ttft", type=float, default=500, help="模型首字延迟（毫秒）")
+    parser.add_argument("--llm-chunk-delay", type=float, default=20, help="模型每段输出间隔（毫秒）")
+    parser.add_argument("--tool-rounds", type=int, default=2, help="每个问题调用工具的推理轮数")
+    parser.add_argument("--parallel-tools", type=int, default=2, help="每轮最多并行调用的工具数")
+    parser.add_argument("--answer-chars", type=int, default=400, help="最终回答长度（字符）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="基准测试用的本地MCP和模型替身服务")
+    add_arguments(parser)
+    asyncio.run(serve(parser.parse_args()))
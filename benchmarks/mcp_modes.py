@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+MCP工具调用延迟基准：对比 stateless（每次调用新建连接）和 pooled（长连接会话池）两种模式
+
+用法：
+    python benchmarks/mcp_modes.py --tool SearchFunds --args '{"keyword": "易方达"}' --calls 50
+    python benchmarks/mcp_modes.py --url http://127.0.0.1:18001/sse --concurrency 4 --output mcp_modes.json
+
+直接调用MCP工具函数，不经过工具结果缓存和并发合并层
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from common import latency_summary, project_root
+
+sys.path.insert(0, project_root())
+
+from agentscope.mcp import HttpStatelessClient
+
+from mcp_session_pool import McpSessionPool, PooledMcpToolFunction
+
+
+def summarize(mode, latencies, errors, elapsed, first_call):
+    """汇总单个模式的延迟统计（毫秒）"""
+    summary = latency_summary([x * 1000 for x in latencies])
+    return {
+        "mode": mode,
+        "calls": len(latencies) + errors,
+        "errors": errors,
+        "first_call_ms": round(first_call * 1000, 1),
+        **{k: v for k, v in summary.items() if k != "count"},
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+async def run_calls(func, arguments, calls, concurrency):
+    """以指定并发数调用工具函数，返回 (各次耗时, 失败次数, 总耗时)"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await func(**arguments)
+            except Exception as e:
+                errors += 1
+                print(f"调用失败: {e}", file=sys.stderr)
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def bench_stateless(url, tool_name, arguments, calls, concurrency):
+    client = HttpStatelessClient(name="qieman_mcp", transport="sse", url=url)
+    func = await client.get_callable_function(tool_name)
+    start = time.perf_counter()
+    await func(**arguments)
+    first_call = time.perf_counter() - start
+    latencies, errors, elapsed = await run_calls(func, arguments, calls, concurrency)
+    return summarize("stateless", latencies, errors, elapsed, first_call)
+
+
+async def bench_pooled(url, tool_name, arguments, calls, concurrency, pool_size):
+    pool = McpSessionPool(url=url, size=pool_size)
+    try:
+        tools = {tool.name: tool for tool in await pool.list_tools()}
+        func = PooledMcpToolFunction(mcp_name="qieman_mcp", tool=tools[tool_name], pool=pool)
+        # 首次调用：list_tools 已建立一个会话，这里记录的是会话复用后的首次调用
+        start = time.perf_counter()
+        await func(**arguments)
+        first_call = time.perf_counter() - start
+        latencies, errors, elapsed = await run_calls(func, arguments, calls, concurrency)
+        result = summarize("pooled", latencies, errors, elapsed, first_call)
+        result["pool"] = pool.stats()
+        return result
+    finally:
+        await pool.close()
+
+
+async def run(args):
+    url = args.url
+    if url is None:
+        with open(args.config, "r", encoding="utf-8") as f:
+            url = json.load(f)["mcp"]["url"]
+    arguments = json.loads(args.args)
+
+    results = [
+        await bench_stateless(url, args.tool, arguments, args.calls, args.concurrency),
+        await bench_pooled(url, args.tool, arguments, args.calls, args.concurrency, args.pool_size),
+    ]
+
+    print(f"工具: {args.tool}  调用次数: {args.calls}  并发: {args.concurrency}")
+    print(f"{'模式':<10}{'首次':>9}{'平均':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'最大':>9}{'次/秒':>9}{'失败':>6}")
+    for r in results:
+        print(
+            f"{r['mode']:<10}{r['first_call_ms']:>9}{r['mean_ms']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+            f"{r['p99_ms']:>9}{r['max_ms']:>9}{r['throughput']:>9}{r['errors']:>6}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"tool": args.tool, "arguments": arguments, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MCP工具调用延迟基准（stateless vs pooled）")
+    parser.add_argument("--config", default="config.json", help="配置文件路径，读取其中的 mcp.url")
+    parser.add_argument("--url", help="MCP服务地址，指定后忽略配置文件")
+    parser.add_argument("--tool", default="SearchFunds", help="调用的工具名")
+    parser.add_argument("--args", default='{"keyword": "易方达"}', help="工具参数（JSON）")
+    parser.add_argument("--calls", type=int, default=30, help="每种模式的调用次数")
+    parser.add_argument("--concurrency", type=int, default=1, help="并发调用数")
+    parser.add_argument("--pool-size", type=int, default=2, help="pooled 模式的会话数")
+    parser.add_argument("--output", help="结果保存为JSON文件")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+离线基准测试
+启动本地MCP和模型替身服务（benchmarks/fake_servers.py），以指定并发驱动 qieman_mcp.main 或 web_server 的 /ws 接口，
+统计延迟分位数、吞吐量、峰值内存和各阶段耗时，结果保存为JSON便于对比
+
+用法：
+    python benchmarks/run.py --target main --concurrency 4 --questions 40
+    python benchmarks/run.py --target ws --concurrency 8 --questions 80 --mcp-latency 300 --baseline benchmarks/results/old.json
+
+项目代码在临时工作目录中运行，日志和问答记录不会写入项目目录
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from common import latency_summary, peak_rss_mb, project_root
+from fake_servers import FUNDS, add_arguments
+
+sys.path.insert(0, project_root())
+
+QUESTION_TEMPLATES = [
+    "{name}最近的业绩表现怎么样",
+    "{name}的规模和持有人结构",
+    "{name}的基金经理是谁，值得长期持有吗",
+    "帮我分析一下{code}的净值走势",
+]
+
+
+def make_questions(count, distinct):
+    """生成问题列表，distinct 个不同问题循环使用"""
+    pool = []
+    for template in QUESTION_TEMPLATES:
+        for fund in FUNDS:
+            pool.append(template.format(name=fund["fundName"], code=fund["fundCode"]))
+    pool = pool[:max(1, distinct)]
+    return [pool[i % len(pool)] for i in range(count)]
+
+
+def make_config(args, work_dir):
+    """基于项目配置生成指向替身服务的配置"""
+    config = {}
+    config_path = os.path.join(project_root(), "config.json")
+    if os.path.exists(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    config["mcp"] = {**config.get("mcp", {}), "url": f"http://127.0.0.1:{args.mcp_port}/sse"}
+    if args.mcp_mode:
+        config["mcp"]["mode"] = args.mcp_mode
+    config["model"] = {
+        **config.get("model", {}),
+        "api_key": "fake",
+        "base_url": f"http://127.0.0.1:{args.llm_port}/v1",
+    }
+    config["pool"] = {**config.get("pool", {}), "size": args.pool_size or args.concurrency}
+    config["schema_cache"] = {**config.get("schema_cache", {}), "path": os.path.join(work_dir, "mcp_schemas.json")}
+    config["tool_cache"] = {**config.get("tool_cache", {}), "enabled": not args.no_tool_cache, "sqlite_path": None}
+    config["answer_cache"] = {**config.get("answer_cache", {}), "enabled": args.answer_cache}
+    # 所有基准客户端来自同一地址，放宽单客户端排队限制
+    config["scheduler"] = {
+        **config.get("scheduler", {}),
+        "max_concurrent": args.pool_size or args.concurrency,
+        "max_queue": args.questions,
+        "max_queue_per_client": args.questions,
+    }
+    return config
+
+
+def start_fake_servers(args):
+    """在子进程中启动替身服务，等待端口可用"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_servers.py")
+    command = [sys.executable, script]
+    for name in ("mcp_port", "llm_port", "mcp_latency", "mcp_jitter", "llm_ttft", "llm_chunk_delay",
+                 "tool_rounds", "parallel_tools", "answer_chars"):
+        command += ["--" + name.replace("_", "-"), str(getattr(args, name))]
+    process = subprocess.Popen(command)
+    deadline = time.time() + 30
+    for port in (args.mcp_port, args.llm_port):
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline or process.poll() is not None:
+                    process.terminate()
+                    raise RuntimeError(f"替身服务启动失败，端口 {port} 不可用")
+                time.sleep(0.2)
+    return process
+
+
+class StageRecorder:
+    """通过ReAct事件记录各阶段耗时"""
+
+    def __init__(self):
+        self.llm_rounds = []
+        self.tool_calls = defaultdict(list)
+        self.tool_bytes = []
+
+    def __call__(self, event):
+        import agent_events
+        if event.type == agent_events.REASONING_END:
+            self.llm_rounds.append(event.data["duration_ms"])
+        elif event.type == agent_events.TOOL_END:
+            self.tool_calls[event.data["name"]].append(event.data["duration_ms"])
+            self.tool_bytes.append(event.data["bytes"])
+
+    def summary(self):
+        import metrics
+        all_tools = [ms for values in self.tool_calls.values() for ms in values]
+        stages = {
+            "llm_round": latency_summary(self.llm_rounds),
+            "tool_call": latency_summary(all_tools),
+            "tool_call_by_name": {name: latency_summary(values) for name, values in self.tool_calls.items()},
+            "tool_response_bytes_mean": round(sum(self.tool_bytes) / len(self.tool_bytes)) if self.tool_bytes else 0,
+        }
+        # 排队等待只记录了直方图，给出平均值
+        for stage in ("scheduler", "pool"):
+            count = metrics.QUEUE_WAIT.count(stage=stage)
+            if count:
+                stages[f"queue_wait_{stage}_mean_ms"] = round(metrics.QUEUE_WAIT.sum(stage=stage) / count * 1000, 1)
+        return stages
+
+
+async def drive(questions, concurrency, ask):
+    """以指定并发执行 ask(question)，返回 (各问题结果, 总耗时)"""
+    queue = asyncio.Queue()
+    for question in questions:
+        queue.put_nowait(question)
+    results = []
+
+    async def worker():
+        while not queue.empty():
+            question = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                record = await ask(question)
+            except Exception as e:
+                record = {"error": str(e)}
+            record["latency_ms"] = (time.perf_counter() - start) * 1000
+            results.append(record)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+async def bench_main(config, questions, concurrency):
+    from qieman_mcp import main, ERROR_PREFIX
+    from fund_manager_pool import FundManagerPool
+    from mcp_session_pool import close_session_pools
+    from nav_store import close_nav_stores
+    from fan_out import close_fan_out_planners
+
+    pool = FundManagerPool.from_config(config)
+    await pool.start()
+
+    async def ask(question):
+        response = await main(question, None, config, pool=pool)
+        if str(response).startswith(ERROR_PREFIX):
+            return {"error": response}
+        return {"bytes": len(response.encode("utf-8"))}
+
+    try:
+        return await drive(questions, concurrency, ask)
+    finally:
+        await pool.close()
+        await close_fan_out_planners()
+        await close_session_pools()
+        close_nav_stores()
+
+
+async def bench_ws(config, questions, concurrency):
+    import aiohttp
+    from aiohttp import web
+    import web_server
+
+    app, _ = web_server.create_app(config)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    async def ask_with(ws, question):
+        start = time.perf_counter()
+        record = {}
+        await ws.send_str(json.dumps({"question": question}))
+        async for msg in ws:
+            data = json.loads(msg.data)
+            elapsed = (time.perf_counter() - start) * 1000
+            record.setdefault("first_frame_ms", elapsed)
+            if data["type"] == "delta":
+                record.setdefault("first_delta_ms", elapsed)
+            elif data["type"] == "queued":
+                record["queued"] = True
+            elif data["type"] == "result":
+                record["bytes"] = len(str(data["response"]).encode("utf-8"))
+                return record
+            elif data["type"] in ("error", "busy"):
+                record["error"] = data["message"]
+                return record
+        record["error"] = "连接已关闭"
+        return record
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            # 每个并发客户端使用一条WebSocket连接
+            connections = [await session.ws_connect(f"http://127.0.0.1:{port}/ws") for _ in range(concurrency)]
+            idle = asyncio.Queue()
+            for ws in connections:
+                idle.put_nowait(ws)
+
+            async def ask(question):
+                ws = await idle.get()
+                try:
+                    return await ask_with(ws, question)
+                finally:
+                    idle.put_nowait(ws)
+
+            try:
+                return await drive(questions, concurrency, ask)
+            finally:
+                for ws in connections:
+                    await ws.close()
+    finally:
+        await runner.cleanup()
+
+
+def build_report(args, results, elapsed, stages):
+    ok = [r for r in results if "error" not in r]
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "target": args.target,
+            "args": vars(args),
+        },
+        "questions": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_qps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "throughput_qpm": round(len(ok) / elapsed * 60, 2) if elapsed else 0.0,
+        "latency": latency_summary([r["latency_ms"] for r in ok]),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+    if args.target == "ws":
+        report["stages"]["first_frame"] = latency_summary([r["first_frame_ms"] for r in ok if "first_frame_ms" in r])
+        report["stages"]["first_delta"] = latency_summary([r["first_delta_ms"] for r in ok if "first_delta_ms" in r])
+        report["queued"] = sum(1 for r in results if r.get("queued"))
+    errors = [r["error"] for r in results if "error" in r]
+    if errors:
+        report["error_samples"] = errors[:5]
+    return report
+
+
+def print_report(report, baseline=None):
+    latency = report["latency"]
+    print(f"\n目标: {report['meta']['target']}  问题数: {report['questions']}  失败: {report['errors']}  "
+          f"耗时: {report['elapsed_s']}s  峰值内存: {report['peak_rss_mb']}MB")
+    print(f"吞吐: {report['throughput_qps']} 个/秒（{report['throughput_qpm']} 个/分钟）")
+    print(f"延迟: 平均 {latency['mean_ms']}ms  p50 {latency['p50_ms']}ms  "
+          f"p95 {latency['p95_ms']}ms  p99 {latency['p99_ms']}ms  最大 {latency['max_ms']}ms")
+    print("各阶段:")
+    for name, value in report["stages"].items():
+        if isinstance(value, dict) and "p50_ms" in value:
+            print(f"  {name:<16} 次数 {value['count']:<5} 平均 {value['mean_ms']}ms  "
+                  f"p50 {value['p50_ms']}ms  p95 {value['p95_ms']}ms")
+        elif not isinstance(value, dict):
+            print(f"  {name:<16} {value}")
+
+    if baseline:
+        print(f"\n与基线对比（{baseline['meta']['timestamp']}）:")
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            old, new = baseline["latency"][key], latency[key]
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {key:<8} {old} -> {new}  ({change:+.1f}%)")
+        old, new = baseline["throughput_qps"], report["throughput_qps"]
+        change = (new - old) / old * 100 if old else 0.0
+        print(f"  吞吐     {old} -> {new} 个/秒  ({change:+.1f}%)")
+
+
+async def run(args):
+    work_dir = tempfile.mkdtemp(prefix="fund_bench_")
+    config = make_config(args, work_dir)
+    questions = make_questions(args.questions, args.distinct)
+
+    process = None if args.no_fakes else start_fake_servers(args)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        if args.target == "ws":
+            # web_server 导入时会重新配置日志，需在调整日志级别之前导入
+            import web_server  # noqa: F401
+        if args.quiet:
+            logging.getLogger().setLevel(logging.WARNING)
+        import agent_events
+        recorder = StageRecorder()
+        agent_events.add_listener(recorder)
+        if args.target == "ws":
+            results, elapsed = await bench_ws(config, questions, args.concurrency)
+        else:
+            results, elapsed = await bench_main(config, questions, args.concurrency)
+        report = build_report(args, results, elapsed, recorder.summary())
+    finally:
+        os.chdir(cwd)
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线基准测试（本地MCP和模型替身服务）")
+    parser.add_argument("--target", choices=["main", "ws"], default="main", help="测试目标：qieman_mcp.main 或 /ws 接口")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发数")
+    parser.add_argument("--questions", type=int, default=40, help="问题总数")
+    parser.add_argument("--distinct", type=int, default=24, help="不同问题的数量，重复的问题可命中缓存")
+    parser.add_argument("--pool-size", type=int, help="基金管理助手池大小，默认与并发数相同")
+    parser.add_argument("--mcp-mode", choices=["stateless", "pooled"], help="MCP工具调用模式，默认使用项目配置")
+    parser.add_argument("--no-tool-cache", action="store_true", help="关闭工具结果缓存")
+    parser.add_argument("--answer-cache", action="store_true", help="开启问答缓存（默认关闭）")
+    parser.add_argument("--no-fakes", action="store_true", help="不启动替身服务，使用已在运行的服务")
+    parser.add_argument("--output", help="结果JSON路径，默认 benchmarks/results/<目标>-<时间>.json")
+    parser.add_argument("--baseline", help="用于对比的历史结果JSON")
+    parser.add_argument("--quiet", action="store_true", help="只输出警告及以上级别的日志")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.quiet:
+        os.environ.setdefault("AGENTSCOPE_DISABLE_CONSOLE_OUTPUT", "true")
+    report = asyncio.run(run(args))
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"{args.target}-{time.strftime('%Y%m%d_%H%M%S')}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report, baseline)
+    print(f"\n结果已保存: {output}")
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+按问题复杂度选择模型
+“查询某基金净值”与完整的持仓分析使用同一个大模型、同样的推理轮数上限，既慢又贵。
+回答前按关键词、提到的基金数量和问题长度把问题分为 简单查询 / 对比 / 深度分析 三类，
+每类使用配置的模型、最大推理轮数和系统提示词（简单查询默认使用更短的提示词）；
+按类别统计耗时、token用量和费用，用于调整分类规则和模型选择
+"""
+
+import json
+from typing import Dict, Any, Optional
+
+from agentscope.model import ChatModelBase
+
+import metrics
+from text_patterns import find_fund_codes
+
+# 问题类别
+LOOKUP = "lookup"
+COMPARE = "compare"
+ANALYSIS = "analysis"
+CLASSES = (LOOKUP, COMPARE, ANALYSIS)
+
+# 各类别的关键词：命中深度分析关键词优先，其次是对比
+DEFAULT_KEYWORDS = {
+    ANALYSIS: ["分析", "建议", "持仓", "组合", "配置", "策略", "诊断", "调仓", "评估", "推荐", "怎么看",
+               "前景", "值得", "报告", "pdf", "为什么", "定投", "止盈", "止损"],
+    COMPARE: ["对比", "比较", "相比", "哪个", "哪只", "区别", "还是", "vs", "pk", "排名"],
+    # 只列出具体的数据项；“查询”“多少”“是什么”等泛用词会把多方面的问题也分到简单查询
+    LOOKUP: ["净值", "规模", "经理", "费率", "成立", "涨跌", "涨幅", "跌幅", "走势"],
+}
+# 未配置时各类别的最大推理轮数
+DEFAULT_MAX_ITERS = {LOOKUP: 4, COMPARE: 8, ANALYSIS: 10}
+# 未配置时各类别的系统提示词，None表示使用基金管理助手的完整提示词
+DEFAULT_SYS_PROMPTS = {
+    LOOKUP: (
+        "你是基金数据查询助手，负责查询基金的净值、规模、基金经理、费率等数据。\n"
+        "你**必须先调用工具获取最新数据**，再用Markdown格式简洁地直接回答所问的数据，不展开投资分析和建议。"
+    ),
+}
+
+
+class MeteredChatModel(ChatModelBase):
+    """累计模型返回的token用量，用于按问题统计费用"""
+
+    def __init__(self, model: ChatModelBase):
+        super().__init__(model.model_name, model.stream)
+        self.model = model
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def _record(self, usage) -> None:
+        if usage is not None:
+            self.input_tokens += usage.input_tokens
+            self.output_tokens += usage.output_tokens
+
+    async def __call__(self, *args: Any, **kwargs: Any):
+        response = await self.model(*args, **kwargs)
+        if not hasattr(response, "__anext__"):
+            self._record(response.usage)
+            return response
+        return self._stream(response)
+
+    async def _stream(self, response):
+        usage = None
+        async for chunk in response:
+            usage = chunk.usage or usage
+            yield chunk
+        # 流式输出的用量在最后的片段中
+        self._record(usage)
+
+
+class ComplexityRouter:
+    """问题复杂度分类及按类别的统计"""
+
+    def __init__(
+        self,
+        classes=None,
+        keywords=None,
+        default_class=ANALYSIS,
+        long_question_chars=60,
+        lookup_max_aspects=2,
+    ):
+        """
+        Args:
+            classes: 类别 -> {"model": 模型配置覆盖项, "max_iters": 最大推理轮数, "sys_prompt": 系统提示词,
+                "input_price": 每千输入token费用, "output_price": 每千输出token费用}
+            keywords: 类别 -> 关键词列表，覆盖默认关键词
+            default_class: 无法判断时使用的类别
+            long_question_chars: 超过该字数且没有命中关键词的问题按深度分析处理
+            lookup_max_aspects: 命中超过该数量的简单查询关键词（一次问多项数据）时不按简单查询处理
+        """
+        self.classes = {name: dict((classes or {}).get(name, {})) for name in CLASSES}
+        self.keywords = {**DEFAULT_KEYWORDS, **(keywords or {})}
+        self.default_class = default_class
+        self.long_question_chars = long_question_chars
+        self.lookup_max_aspects = lookup_max_aspects
+
+        self._stats = {
+            name: {"questions": 0, "errors": 0, "max_iters_reached": 0, "duration_s": 0.0,
+                   "rounds": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0}
+            for name in CLASSES
+        }
+
+    @classmethod
+    def from_config(cls, config) -> Optional["ComplexityRouter"]:
+        """根据 config["complexity_router"] 创建，未启用时返回None"""
+        router_config = (config or {}).get("complexity_router", {})
+        if not router_config.get("enabled", True):
+            return None
+        return cls(
+            classes=router_config.get("classes"),
+            keywords=router_config.get("keywords"),
+            default_class=router_config.get("default_class", ANALYSIS),
+            long_question_chars=router_config.get("long_question_chars", 60),
+            lookup_max_aspects=router_config.get("lookup_max_aspects", 2),
+        )
+
+    def classify(self, question: str, annotated: Optional[str] = None) -> str:
+        """
+        判断问题类别
+
+        Args:
+            question: 用户原始问题
+            annotated: 附加了已识别基金代码的问题，用于统计提到的基金数量
+        """
+        text = (question or "").lower()
+        funds = len(find_fund_codes(annotated or question))
+        if any(keyword in text for keyword in self.keywords[ANALYSIS]):
+            return ANALYSIS
+        if funds >= 2 or any(keyword in text for keyword in self.keywords[COMPARE]):
+            return COMPARE
+        if len(question) > self.long_question_chars:
+            return ANALYSIS
+        aspects = sum(1 for keyword in self.keywords[LOOKUP] if keyword in text)
+        if aspects > self.lookup_max_aspects:
+            return self.default_class
+        if funds == 1 or aspects:
+            return LOOKUP
+        return self.default_class
+
+    def model_config(self, query_class: str, base: Dict[str, Any]) -> Dict[str, Any]:
+        """类别使用的模型配置：在 config["model"] 基础上覆盖类别配置的字段"""
+        return {**base, **self.classes[query_class].get("model", {})}
+
+    def max_iters(self, query_class: str) -> int:
+        return self.classes[query_class].get("max_iters", DEFAULT_MAX_ITERS[query_class])
+
+    def sys_prompt(self, query_class: str) -> Optional[str]:
+        """类别使用的系统提示词，None表示使用完整提示词（配置为空字符串时也使用完整提示词）"""
+        if "sys_prompt" in self.classes[query_class]:
+            return self.classes[query_class]["sys_prompt"] or None
+        return DEFAULT_SYS_PROMPTS.get(query_class)
+
+    def record(
+        self,
+        query_class: str,
+        duration: float,
+        status: str,
+        rounds: int,
+        input_tokens: int,
+        output_tokens: int,
+    ) -> None:
+        """记录一个问题的处理结果"""
+        class_config = self.classes[query_class]
+        cost = (input_tokens * class_config.get("input_price", 0)
+                + output_tokens * class_config.get("output_price", 0)) / 1000
+        stats = self._stats[query_class]
+        stats["questions"] += 1
+        stats["errors"] += status == "error"
+        # 达到推理轮数上限说明该类别的轮数可能不够，或问题被分错了类
+        stats["max_iters_reached"] += rounds >= self.max_iters(query_class)
+        stats["duration_s"] += duration
+        stats["rounds"] += rounds
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+        stats["cost"] += cost
+
+        metrics.CLASS_QUESTIONS.inc(query_class=query_class, status=status)
+        metrics.CLASS_DURATION.observe(duration, query_class=query_class)
+        metrics.CLASS_TOKENS.inc(input_tokens, query_class=query_class, kind="input")
+        metrics.CLASS_TOKENS.inc(output_tokens, query_class=query_class, kind="output")
+        metrics.CLASS_COST.inc(cost, query_class=query_class)
+
+    def stats(self) -> Dict[str, Any]:
+        """按类别的统计：问题数、平均耗时、平均推理轮数、token用量和费用"""
+        result = {}
+        for name, stats in self._stats.items():
+            questions = stats["questions"] or 1
+            result[name] = {
+                "questions": stats["questions"],
+                "errors": stats["errors"],
+                "max_iters_reached": stats["max_iters_reached"],
+                "avg_duration_s": round(stats["duration_s"] / questions, 2),
+                "avg_rounds": round(stats["rounds"] / questions, 2),
+                "input_tokens": stats["input_tokens"],
+                "output_tokens": stats["output_tokens"],
+                "cost": round(stats["cost"], 4),
+                "model": self.classes[name].get("model", {}).get("model_name"),
+                "max_iters": self.max_iters(name),
+            }
+        return result
+
+
+# 进程内共享的分类器，所有基金管理助手共用统计
+_routers: Dict[str, Optional[ComplexityRouter]] = {}
+
+
+def get_complexity_router(config) -> Optional[ComplexityRouter]:
+    """获取进程内共享的问题复杂度分类器"""
+    router_config = (config or {}).get("complexity_router", {})
+    key = json.dumps(router_config, sort_keys=True)
+    if key not in _routers:
+        _routers[key] = ComplexityRouter.from_config(config)
+    return _routers[key]
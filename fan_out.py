@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+多基金问题并发拆分（map-reduce）
+“对比A、B、C三只基金”这类问题在一个ReAct循环里依次查询、分析每只基金，耗时是各基金耗时之和。
+问题中提到多只基金时，先为每只基金并发运行一个轻量子任务（独立的基金管理助手，小模型、较少推理轮数）
+查询数据并给出要点摘要，再由原助手基于各基金摘要汇总回答；总耗时接近最慢的一只基金。
+子任务使用进程内共享的助手池，并发数受限，与问答预热池互不占用；
+助手和并发限制绑定事件循环，按事件循环分别创建（GUI每次启动服务都使用新的事件循环）。
+子任务的问题只保留用户所问的方面和该基金本身，不包含其他基金的代码和名称
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import metrics
+from agent_events import SUBTASK_START, SUBTASK_END
+from fund_resolver import get_fund_resolver, normalize_name
+from loop_local import LoopLocal
+from text_patterns import FUND_CODE, find_fund_codes
+
+logger = logging.getLogger(__name__)
+
+# 替换基金名称后连在一起的“该基金、该基金和该基金”
+_FUND_LIST = re.compile(r"该基金(?:[、，,和与及跟/&]该基金)+")
+
+
+class FanOutPlanner:
+    """识别多基金问题，并发运行每只基金的子任务"""
+
+    def __init__(
+        self,
+        config,
+        min_funds=2,
+        max_funds=6,
+        concurrency=3,
+        query_class="lookup",
+        max_iters=4,
+        summary_chars=800,
+        timeout=120,
+    ):
+        """
+        Args:
+            config: 配置参数，用于创建子任务的基金管理助手
+            min_funds: 问题中至少提到几只基金时拆分
+            max_funds: 提到的基金超过该数量时不拆分（按原方式处理）
+            concurrency: 同时运行的子任务数（所有问题合计）
+            query_class: 子任务使用的问题类别（决定模型），见 complexity_router
+            max_iters: 子任务的最大推理轮数
+            summary_chars: 每只基金摘要最多保留的字符数
+            timeout: 单个子任务的处理时限（秒）
+        """
+        self.config = config
+        self.min_funds = min_funds
+        self.max_funds = max_funds
+        self.concurrency = concurrency
+        self.query_class = query_class
+        self.max_iters = max_iters
+        self.summary_chars = summary_chars
+        self.timeout = timeout
+
+        # 并发限制和空闲的子任务助手（最多保留 concurrency 个）按事件循环区分
+        self._semaphores = LoopLocal()
+        self._idle_managers = LoopLocal()
+
+        self.questions = 0
+        self.subtasks = 0
+        self.failed = 0
+        self.saved_s = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> Optional["FanOutPlanner"]:
+        """根据 config["fan_out"] 创建，未启用时返回None"""
+        fan_out_config = (config or {}).get("fan_out", {})
+        if not fan_out_config.get("enabled", True):
+            return None
+        return cls(
+            config,
+            min_funds=fan_out_config.get("min_funds", 2),
+            max_funds=fan_out_config.get("max_funds", 6),
+            concurrency=fan_out_config.get("concurrency", 3),
+            query_class=fan_out_config.get("query_class", "lookup"),
+            max_iters=fan_out_config.get("max_iters", 4),
+            summary_chars=fan_out_config.get("summary_chars", 800),
+            timeout=fan_out_config.get("timeout", 120),
+        )
+
+    def plan(self, annotated: str) -> Optional[List[Tuple[str, str]]]:
+        """
+        判断是否拆分，返回 [(基金代码, 基金名称), ...]，不拆分时返回None
+
+        Args:
+            annotated: 附加了已识别基金代码的问题
+        """
+        codes = find_fund_codes(annotated)
+        if not self.min_funds <= len(codes) <= self.max_funds:
+            return None
+        resolver = get_fund_resolver(self.config)
+        return [(code, resolver.funds.get(code, code) if resolver else code) for code in codes]
+
+    def focus_question(self, question: str, funds: List[Tuple[str, str]]) -> str:
+        """将问题中提到的基金（代码、名称、别名）都替换为“该基金”，只保留用户所问的方面"""
+        fragments = {code for code, _ in funds} | {name for _, name in funds}
+        resolver = get_fund_resolver(self.config)
+        if resolver is not None:
+            question = normalize_name(question)
+            fragments |= {normalize_name(name) for _, name in funds}
+            fragments |= {fragment for fragment, _ in resolver.find_mentions(question)}
+            fragments |= {fragment for fragment, _ in resolver.find_candidates(question)}
+        for fragment in sorted(fragments, key=len, reverse=True):
+            question = question.replace(fragment, "该基金")
+        return _FUND_LIST.sub("该基金", FUND_CODE.sub("该基金", question))
+
+    def sub_question(self, focus: str, code: str, name: str) -> str:
+        """子任务的问题：只查询一只基金，按原问题关注的方面给出要点"""
+        display = name if name == code else f"{name}（{code}）"
+        return (
+            f"用户问题关注的方面：{focus}\n\n"
+            f"本次只需查询并整理基金 {display} 的相关数据，与其他基金的对比由后续步骤完成。"
+            f"请调用工具获取数据，用要点列出关键数字和结论，不超过{self.summary_chars // 2}字。"
+        )
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        return self._semaphores.get("subtasks", lambda: asyncio.Semaphore(self.concurrency))
+
+    def _idle(self) -> List[Any]:
+        return self._idle_managers.get("managers", list)
+
+    async def _acquire(self):
+        idle = self._idle()
+        if idle:
+            return idle.pop()
+        # 延迟导入，避免与 qieman_mcp 循环导入
+        from qieman_mcp import QiemanFundManager
+        manager = QiemanFundManager(self.config)
+        await manager.initialize_agent()
+        return manager
+
+    def _release(self, manager, failed: bool) -> None:
+        idle = self._idle()
+        if not failed and len(idle) < self.concurrency:
+            idle.append(manager)
+
+    async def close(self) -> None:
+        """释放当前事件循环中空闲的子任务助手"""
+        for managers in self._idle_managers.pop_all():
+            for manager in managers:
+                await manager.close()
+
+    async def _run_one(self, focus: str, code: str, name: str, emit) -> Dict[str, Any]:
+        async with self._semaphore():
+            await emit(SUBTASK_START, code=code, name=name)
+            start = time.perf_counter()
+            manager = None
+            failed = False
+            try:
+                manager = await self._acquire()
+                await manager.reset_memory()
+                # 子任务不传事件回调，推理和工具调用事件只分发给全局监听器（运行指标），不推送给用户
+                res = await asyncio.wait_for(
+                    manager.process_user_query(
+                        self.sub_question(focus, code, name),
+                        query_class=self.query_class,
+                        max_iters=self.max_iters,
+                        subtask=True,
+                    ),
+                    timeout=self.timeout,
+                )
+                summary, error = res["response"][:self.summary_chars], None
+            except asyncio.CancelledError:
+                failed = True
+                raise
+            except Exception as e:
+                failed = True
+                summary, error = None, str(e) or type(e).__name__
+                logger.warning(f"基金 {code} 的子任务失败: {error}")
+            finally:
+                if manager is not None:
+                    self._release(manager, failed)
+            duration = time.perf_counter() - start
+            metrics.FAN_OUT_SUBTASKS.inc(status="error" if error else "ok")
+            await emit(SUBTASK_END, code=code, name=name, duration_ms=round(duration * 1000, 1), error=error)
+            return {"code": code, "name": name, "summary": summary, "error": error, "duration": duration}
+
+    async def run(self, question: str, funds: List[Tuple[str, str]], emit) -> List[Dict[str, Any]]:
+        """
+        并发运行各基金的子任务
+
+        Args:
+            question: 用户原始问题
+            funds: plan() 的结果
+            emit: 发送进度事件的协程函数 emit(event_type, **data)
+
+        Returns:
+            list: [{"code", "name", "summary", "error", "duration"}, ...]，与 funds 顺序一致
+        """
+        start = time.perf_counter()
+        focus = self.focus_question(question, funds)
+        results = await asyncio.gather(*(self._run_one(focus, code, name, emit) for code, name in funds))
+        elapsed = time.perf_counter() - start
+        self.questions += 1
+        self.subtasks += len(results)
+        self.failed += sum(1 for result in results if result["error"])
+        # 与依次处理相比节省的时间
+        sequential = sum(result["duration"] for result in results)
+        self.saved_s += max(sequential - elapsed, 0)
+        metrics.FAN_OUT_SAVED.inc(max(sequential - elapsed, 0))
+        logger.info(f"多基金问题拆分为 {len(results)} 个子任务，耗时 {elapsed:.1f}s，依次处理约需 {sequential:.1f}s")
+        return results
+
+    @staticmethod
+    def synthesis_question(annotated: str, results: List[Dict[str, Any]]) -> str:
+        """汇总步骤的问题：原问题 + 各基金子任务的摘要"""
+        sections = []
+        for result in results:
+            title = result["name"] if result["name"] == result["code"] else f"{result['name']} {result['code']}"
+            body = result["summary"] or f"（子任务未能获取数据：{result['error']}，如需要请调用工具查询）"
+            sections.append(f"### {title}\n{body}")
+        return (
+            f"{annotated}\n\n"
+            "以下是已分别查询整理的各基金数据摘要，请据此直接对比汇总回答；"
+            "摘要缺少的数据再调用工具补充，需要计算收益风险指标时可调用本地组合分析工具。\n\n"
+            + "\n\n".join(sections)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息：拆分的问题数、子任务数、失败数和累计节省的时间"""
+        return {
+            "questions": self.questions,
+            "subtasks": self.subtasks,
+            "failed": self.failed,
+            "saved_s": round(self.saved_s, 1),
+            "idle_managers": len(self._idle()),
+        }
+
+
+# 进程内共享的拆分器，所有基金管理助手共用子任务助手池和并发上限
+_planners: Dict[str, Optional[FanOutPlanner]] = {}
+
+
+def get_fan_out_planner(config) -> Optional[FanOutPlanner]:
+    """获取进程内共享的多基金问题拆分器"""
+    key = json.dumps((config or {}).get("fan_out", {}), sort_keys=True)
+    if key not in _planners:
+        _planners[key] = FanOutPlanner.from_config(config)
+    return _planners[key]
+
+
+async def close_fan_out_planners() -> None:
+    """释放当前事件循环中各拆分器空闲的子任务助手，在Web应用关闭时调用"""
+    for planner in _planners.values():
+        if planner is not None:
+            await planner.close()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+QiemanFundManager 预热池
+进程内复用已初始化的基金管理助手，避免每个问题都重新创建MCP客户端、工具集和模型客户端
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List
+
+import metrics
+from qieman_mcp import QiemanFundManager
+
+logger = logging.getLogger(__name__)
+
+
+class FundManagerPool:
+    """预热的基金管理助手池"""
+
+    def __init__(self, config, size=2, max_uses=50, health_check_interval=300):
+        """
+        Args:
+            config: 配置参数，用于创建 QiemanFundManager
+            size: 池中管理器的数量
+            max_uses: 单个管理器最多处理的问题数，达到后回收重建
+            health_check_interval: 健康检查间隔（秒），空闲管理器超过该间隔未检查时在借出前检查
+        """
+        self.config = config
+        self.size = max(1, int(size))
+        self.max_uses = max(1, int(max_uses))
+        self.health_check_interval = health_check_interval
+
+        self._idle: asyncio.Queue = None
+        self._managers: List[QiemanFundManager] = []
+        self._started = False
+        self._start_lock = None
+        self._recycled = 0
+        # 后台回收任务，关闭池时等待完成
+        self._recycle_tasks = set()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据 config["pool"] 创建预热池"""
+        pool_config = (config or {}).get("pool", {})
+        return cls(
+            config,
+            size=pool_config.get("size", 2),
+            max_uses=pool_config.get("max_uses", 50),
+            health_check_interval=pool_config.get("health_check_interval", 300),
+        )
+
+    async def start(self) -> None:
+        """并发创建并预热所有管理器"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._started:
+                return
+            self._idle = asyncio.Queue()
+            managers = await asyncio.gather(
+                *[self._create_manager() for _ in range(self.size)]
+            )
+            for manager in managers:
+                self._managers.append(manager)
+                self._idle.put_nowait(manager)
+            self._started = True
+            logger.info(f"基金管理助手池已就绪，共 {self.size} 个实例")
+
+    async def close(self) -> None:
+        """关闭池，等待进行中的回收完成后释放所有管理器"""
+        if self._recycle_tasks:
+            await asyncio.gather(*self._recycle_tasks, return_exceptions=True)
+        for manager in self._managers:
+            await self._dispose(manager)
+        self._managers.clear()
+        self._started = False
+
+    async def _create_manager(self) -> QiemanFundManager:
+        """创建并预热一个管理器，预热失败时返回未初始化的实例（首次使用时再初始化）"""
+        manager = QiemanFundManager(self.config)
+        manager.use_count = 0
+        manager.last_health_check = time.monotonic()
+        try:
+            await manager.initialize_agent()
+        except Exception as e:
+            logger.error(f"预热基金管理助手失败，将在首次使用时重试: {str(e)}")
+        return manager
+
+    async def _dispose(self, manager: QiemanFundManager) -> None:
+        """释放管理器持有的资源"""
+        try:
+            await manager.close()
+        except Exception as e:
+            logger.warning(f"释放基金管理助手失败: {str(e)}")
+
+    async def _recycle(self, manager: QiemanFundManager) -> QiemanFundManager:
+        """回收旧管理器并创建新的替代实例"""
+        await self._dispose(manager)
+        new_manager = await self._create_manager()
+        self._managers = [new_manager if m is manager else m for m in self._managers]
+        self._recycled += 1
+        return new_manager
+
+    async def health_check(self, manager: QiemanFundManager) -> bool:
+        """检查管理器是否可用：agent已创建且MCP服务可以正常列出工具"""
+        if manager.agent is None:
+            return False
+        try:
+            await manager.check_mcp()
+        except Exception as e:
+            logger.warning(f"基金管理助手健康检查失败: {str(e)}")
+            return False
+        manager.last_health_check = time.monotonic()
+        return True
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        借出一个管理器，使用完毕后自动归还
+
+        每次借出前清空agent记忆；处理出错或使用次数达到上限时回收重建。
+        调用方被取消（如客户端断开）不代表管理器出错，清理本次问题的状态后直接归还
+        """
+        if not self._started:
+            await self.start()
+
+        wait_start = time.perf_counter()
+        manager = await self._idle.get()
+        metrics.QUEUE_WAIT.observe(time.perf_counter() - wait_start, stage="pool")
+        failed = False
+        try:
+            if time.monotonic() - manager.last_health_check > self.health_check_interval:
+                if not await self.health_check(manager):
+                    manager = await self._recycle(manager)
+            await manager.reset_memory()
+            yield manager
+        except asyncio.CancelledError:
+            try:
+                await manager.reset_memory()
+            except Exception as e:
+                logger.warning(f"清理被取消的问题状态失败，回收该管理器: {str(e)}")
+                failed = True
+            raise
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            manager.use_count += 1
+            if failed or manager.use_count >= self.max_uses:
+                # 回收过程不应阻塞调用方，放到后台完成后再归还到池中
+                task = asyncio.ensure_future(self._recycle_and_release(manager))
+                self._recycle_tasks.add(task)
+                task.add_done_callback(self._recycle_tasks.discard)
+            else:
+                self._idle.put_nowait(manager)
+
+    async def _recycle_and_release(self, manager: QiemanFundManager) -> None:
+        new_manager = await self._recycle(manager)
+        self._idle.put_nowait(new_manager)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回池的运行状态"""
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle else 0,
+            "recycled": self._recycled,
+            "uses": [getattr(m, "use_count", 0) for m in self._managers],
+        }
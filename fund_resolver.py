@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+"""
+基金名称 -> 基金代码 本地识别
+问题中的基金通常写的是名称或简称（如“易方达蓝筹”），模型第一轮推理往往只是调用搜索工具查代码。
+本地维护 基金名称、简称、拼音首字母、别名 的索引：
+- 确定识别：问题中出现完整名称、核心名称（去掉份额类别和类型后缀）或别名，且只对应一只基金
+- 候选：名称的前缀（不少于 min_match_chars 个字且只对应一只基金）、拼音首字母，
+  以及前缀树没有识别出基金时按名称两字片段重合度的模糊匹配（容忍字序调换、漏字）
+基金列表来自MCP工具返回结果中的 基金代码/名称，以及定期调用配置的基金列表工具，持久化到本地文件。
+确定识别的基金代码附加到问题后面，省去搜索基金的推理轮次；候选只作为提示附加，由模型核实；
+问答缓存也用确定识别的结果把同一基金的不同写法归一
+"""
+
+import asyncio
+import fnmatch
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+from agent_events import detached_events
+from loop_local import LoopLocal
+from text_patterns import FUND_CODE
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+    logger.warning("未安装 pypinyin，基金名称拼音首字母识别不可用（pip install pypinyin）")
+
+# 工具结果中基金代码和名称可能使用的字段名
+CODE_FIELDS = ("fundCode", "fund_code", "code")
+NAME_FIELDS = ("fundName", "fund_name", "shortName", "fundShortName", "name")
+
+_WHITESPACE = re.compile(r"\s+")
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]{4,}")
+# 去掉份额类别、基金类型等后缀得到核心名称，如 “中欧医疗健康混合A” -> “中欧医疗健康”
+_NAME_SUFFIX = re.compile(r"(\(lof\)|\(qdii\)|lof|qdii|etf|联接|发起式|混合|股票|债券|指数|[a-z])$")
+# 名称之后紧跟的份额类别、基金类型后缀，如 “易方达蓝筹精选混合” 中的 “混合”
+_TRAILING_SUFFIX = re.compile(r"(\(lof\)|\(qdii\)|lof|qdii|etf|联接|发起式|混合|股票|债券|指数)*(?:[a-z](?![a-z]))?")
+# 前缀树节点只需区分 一只基金 / 多只基金
+_AMBIGUOUS = ""
+
+
+def normalize_name(text: str) -> str:
+    """名称规范化：全角转半角、去除空白、转小写"""
+    return _WHITESPACE.sub("", unicodedata.normalize("NFKC", text or "")).lower()
+
+
+def core_name(name: str) -> str:
+    """去掉份额类别和基金类型后缀的核心名称"""
+    name = normalize_name(name)
+    while True:
+        stripped = _NAME_SUFFIX.sub("", name)
+        if stripped == name or len(stripped) < 2:
+            return name
+        name = stripped
+
+
+def pinyin_initials(text: str) -> Optional[str]:
+    """拼音首字母，未安装 pypinyin 时返回None"""
+    if lazy_pinyin is None:
+        return None
+    initials = "".join(lazy_pinyin(text, style=Style.FIRST_LETTER, errors="ignore"))
+    return initials.lower() or None
+
+
+def _bigrams(text: str) -> List[str]:
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+class _TrieNode:
+    __slots__ = ("children", "code", "name_code")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # 以该节点为前缀的所有名称对应的基金代码：唯一时为代码，多只基金时为 _AMBIGUOUS
+        self.code: Optional[str] = None
+        # 在该节点结束的完整名称或别名对应的基金代码，规则同上
+        self.name_code: Optional[str] = None
+
+
+class FundResolver:
+    """基金名称识别索引"""
+
+    def __init__(
+        self,
+        path="cache/fund_names.json",
+        aliases=None,
+        min_match_chars=4,
+        fuzzy_threshold=0.5,
+        list_tool=None,
+        list_args=None,
+        refresh_interval=86400,
+        learn_tools=None,
+    ):
+        """
+        Args:
+            path: 基金列表持久化文件路径，为空时只保存在内存中
+            aliases: 别名 -> 基金代码
+            min_match_chars: 按前缀识别时最少匹配的字数
+            fuzzy_threshold: 模糊匹配时名称两字片段的最低重合比例
+            list_tool: 定期拉取基金列表的MCP工具名，为空时只从工具返回结果中收集
+            list_args: 调用基金列表工具的参数
+            refresh_interval: 基金列表刷新间隔（秒）
+            learn_tools: 从哪些工具（支持通配符*）的返回结果中收集基金代码和名称
+        """
+        self.path = path
+        self.aliases = {normalize_name(k): v for k, v in (aliases or {}).items()}
+        self.min_match_chars = min_match_chars
+        self.fuzzy_threshold = fuzzy_threshold
+        self.list_tool = list_tool
+        self.list_args = list_args or {}
+        self.refresh_interval = refresh_interval
+        self.learn_tools = learn_tools or ["*"]
+
+        self.funds: Dict[str, str] = {}
+        self.updated_at = 0.0
+        self._root = _TrieNode()
+        self._bigram_index: Dict[str, set] = {}
+        self._core_bigrams: Dict[str, int] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._write_lock = threading.Lock()
+        # 进行中的刷新任务绑定创建它的事件循环，按事件循环分别记录
+        self._refresh_tasks = LoopLocal()
+
+        self.resolved = 0
+        self.candidates = 0
+
+        for alias, code in self.aliases.items():
+            self._insert(alias, code, complete=True)
+        self._load()
+
+    @classmethod
+    def from_config(cls, config) -> Optional["FundResolver"]:
+        """根据 config["fund_resolver"] 创建，未启用时返回None；问答缓存中配置的基金别名一并使用"""
+        resolver_config = (config or {}).get("fund_resolver", {})
+        if not resolver_config.get("enabled", True):
+            return None
+        aliases = {
+            **(config or {}).get("answer_cache", {}).get("fund_aliases", {}),
+            **resolver_config.get("aliases", {}),
+        }
+        return cls(
+            path=resolver_config.get("path", "cache/fund_names.json"),
+            aliases=aliases,
+            min_match_chars=resolver_config.get("min_match_chars", 4),
+            fuzzy_threshold=resolver_config.get("fuzzy_threshold", 0.5),
+            list_tool=resolver_config.get("list_tool") or None,
+            list_args=resolver_config.get("list_args"),
+            refresh_interval=resolver_config.get("refresh_interval", 86400),
+            learn_tools=resolver_config.get("learn_tools"),
+        )
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"读取基金名称索引失败，将重新收集: {str(e)}")
+            return
+        for code, name in data.get("funds", {}).items():
+            self.add(code, name)
+        self.updated_at = data.get("updated_at", 0.0)
+        self._dirty = False
+
+    def save(self) -> None:
+        """将基金列表写入本地文件"""
+        if not self.path or not self._dirty:
+            return
+        self._write(self._snapshot())
+
+    async def save_async(self) -> None:
+        """在线程中写入本地文件，不阻塞事件循环"""
+        if not self.path or not self._dirty:
+            return
+        try:
+            await asyncio.to_thread(self._write, self._snapshot())
+        except OSError as e:
+            self._dirty = True
+            logger.warning(f"写入基金名称索引失败: {str(e)}")
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """在事件循环中复制待写入的数据，写文件期间收集的新基金留到下次写入"""
+        self._dirty = False
+        self._saved_at = time.time()
+        return {"updated_at": self.updated_at, "funds": dict(self.funds)}
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        with self._write_lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _insert(self, key: str, code: str, complete: bool) -> None:
+        """加入一个索引键，complete 为True时该键本身（完整名称、核心名称或别名）可确定识别基金"""
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            if node.code is None:
+                node.code = code
+            elif node.code != code:
+                node.code = _AMBIGUOUS
+        if complete:
+            node.name_code = code if node.name_code in (None, code) else _AMBIGUOUS
+
+    def add(self, code: str, name: str) -> bool:
+        """加入一只基金，返回是否为新基金或名称有变化"""
+        code, name = str(code).strip(), str(name).strip()
+        if not FUND_CODE.fullmatch(code) or not name or self.funds.get(code) == name:
+            return False
+        self.funds[code] = name
+        core = core_name(name)
+        for key in {normalize_name(name), core}:
+            self._insert(key, code, complete=True)
+        initials = pinyin_initials(core)
+        if initials:
+            self._insert(initials, code, complete=False)
+        bigrams = set(_bigrams(core))
+        for bigram in bigrams:
+            self._bigram_index.setdefault(bigram, set()).add(code)
+        self._core_bigrams[code] = max(len(bigrams), 1)
+        self._dirty = True
+        return True
+
+    def _match(self, text: str, start: int) -> Optional[Tuple[int, str, bool]]:
+        """
+        从 start 开始沿前缀树匹配
+
+        Returns:
+            tuple: (结束位置, 基金代码, 是否确定识别)，没有匹配时返回None。
+                完整名称或别名为确定识别（其后紧跟的份额类别等后缀需与同一只基金一致）；
+                否则只对应一只基金、不少于 min_match_chars 个字的最长前缀为候选
+        """
+        node = self._root
+        name_match = prefix_match = unique = None
+        for end in range(start, len(text)):
+            node = node.children.get(text[end])
+            if node is None:
+                break
+            if node.name_code:
+                name_match = (end + 1, node.name_code)
+            if node.code:
+                unique = (end + 1, node.code)
+                if end + 1 - start >= self.min_match_chars:
+                    prefix_match = unique
+        if name_match is not None:
+            end, code = name_match
+            # “中欧医疗健康混合C” 只匹配到核心名称 “中欧医疗健康” 时，份额类别无法确认，只作为候选
+            suffix_end = _TRAILING_SUFFIX.match(text, end).end()
+            if suffix_end == end or (unique is not None and unique[0] >= suffix_end and unique[1] == code):
+                return end, code, True
+            return end, code, False
+        if prefix_match is not None:
+            return prefix_match[0], prefix_match[1], False
+        return None
+
+    def _fuzzy(self, text: str) -> Optional[str]:
+        """按两字片段重合度模糊匹配，最佳结果明显优于次佳时返回基金代码"""
+        counts = Counter()
+        for bigram in set(_bigrams(text)):
+            for code in self._bigram_index.get(bigram, ()):
+                counts[code] += 1
+        if not counts:
+            return None
+        scored = sorted(((n / self._core_bigrams[code], code) for code, n in counts.items()), reverse=True)
+        score, code = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        if score >= self.fuzzy_threshold and score - runner_up >= 0.15:
+            return code
+        return None
+
+    def _scan(self, text: str) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """
+        找出文本中提到的基金
+
+        Returns:
+            tuple: (确定识别的 [(规范化后的原文片段, 基金代码)], 候选 [(原文片段, 基金代码)])；
+                前缀树没有匹配时按整段中文模糊匹配，结果作为候选
+        """
+        text = normalize_name(text)
+        mentions, candidates = [], []
+        start = 0
+        while start < len(text):
+            match = self._match(text, start)
+            if match is None:
+                start += 1
+                continue
+            end, code, certain = match
+            (mentions if certain else candidates).append((text[start:end], code))
+            start = end
+
+        if not mentions and not candidates and self._bigram_index:
+            for run in _CJK_RUN.findall(text):
+                code = self._fuzzy(run)
+                if code is not None:
+                    candidates.append((run, code))
+        return mentions, candidates
+
+    def find_mentions(self, text: str) -> List[Tuple[str, str]]:
+        """
+        文本中确定提到的基金（完整名称、核心名称或别名）
+
+        Returns:
+            list: [(规范化后的原文片段, 基金代码), ...]
+        """
+        return self._scan(text)[0]
+
+    def find_candidates(self, text: str) -> List[Tuple[str, str]]:
+        """文本中可能提到、需要核实的基金（名称前缀、拼音首字母、模糊匹配），不含已确定识别的基金"""
+        mentions, candidates = self._scan(text)
+        confirmed = {code for _, code in mentions}
+        return [(fragment, code) for fragment, code in candidates if code not in confirmed]
+
+    def resolve(self, name: str) -> Optional[str]:
+        """识别单个基金名称（基金代码、完整名称、核心名称或别名），无法确定时返回None"""
+        key = normalize_name(name)
+        if FUND_CODE.fullmatch(key):
+            return key
+        match = self._match(key, 0)
+        if match is not None and match[2] and match[0] == len(key):
+            return match[1]
+        return None
+
+    def annotate(self, question: str) -> Tuple[str, str]:
+        """
+        在问题后附加识别出的基金代码；问题中已写明的代码不重复附加
+
+        确定识别的基金提示模型无需再搜索；候选只列出供模型核实，不影响模型搜索基金代码
+
+        Returns:
+            tuple: (只附加确定识别的基金代码的问题，用于按基金代码路由和拆分问题，避免把候选当作已提到的基金；
+                    再附加候选基金的问题，发送给模型)
+        """
+        mentions, possible = self._scan(question)
+        mentions = [(text, code) for text, code in mentions if code not in question]
+        confirmed = {code for _, code in mentions}
+        possible = [(text, code) for text, code in possible if code not in question and code not in confirmed]
+        annotated = question
+        if mentions:
+            self.resolved += len(mentions)
+            annotated += f"\n\n（已识别的基金代码：{'；'.join(self._describe(mentions))}，无需再搜索基金代码）"
+        prompt = annotated
+        if possible:
+            self.candidates += len(possible)
+            prompt += f"\n\n（问题中的基金可能是：{'；'.join(self._describe(possible))}，请核实）"
+        return annotated, prompt
+
+    def _describe(self, mentions: List[Tuple[str, str]]) -> List[str]:
+        lines = []
+        for text, code in mentions:
+            line = f"{self.funds.get(code, text)} {code}"
+            if line not in lines:
+                lines.append(line)
+        return lines
+
+    def replace_mentions(self, text: str) -> str:
+        """将已规范化文本中提到的基金名称替换为基金代码，只使用确定识别的结果"""
+        for mention, code in sorted(self.find_mentions(text), key=lambda m: len(m[0]), reverse=True):
+            text = text.replace(mention, code)
+        return text
+
+    def learn(self, data) -> int:
+        """从工具返回的JSON中收集基金代码和名称，返回新增数量"""
+        added = 0
+        if isinstance(data, dict):
+            code = next((data[f] for f in CODE_FIELDS if data.get(f)), None)
+            name = next((data[f] for f in NAME_FIELDS if data.get(f)), None)
+            if code and name and isinstance(name, str):
+                added += self.add(code, name)
+            children = data.values()
+        elif isinstance(data, list):
+            children = data
+        else:
+            return 0
+        for child in children:
+            if isinstance(child, (dict, list)):
+                added += self.learn(child)
+        return added
+
+    def learn_from_response(self, response) -> int:
+        added = 0
+        for block in response.content or []:
+            if block.get("type") != "text":
+                continue
+            try:
+                added += self.learn(json.loads(block.get("text", "")))
+            except (TypeError, ValueError):
+                continue
+        return added
+
+    def save_due(self) -> bool:
+        """新收集的基金合并写盘，避免每次工具调用都写文件"""
+        return self._dirty and time.time() - self._saved_at > 60
+
+    def needs_refresh(self) -> bool:
+        return bool(self.list_tool) and time.time() - self.updated_at > self.refresh_interval
+
+    def refresh_in_background(self, toolkit) -> None:
+        """基金列表过期时在后台调用基金列表工具刷新，每个事件循环同一时间只有一个刷新任务"""
+        if not self.needs_refresh() or self.list_tool not in toolkit.tools:
+            return
+        running = self._refresh_tasks.get("refresh", set)
+        if running:
+            return
+        task = asyncio.create_task(self._refresh(toolkit.tools[self.list_tool].original_func))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    async def _refresh(self, func) -> None:
+        try:
+            # 任务复制了发起刷新的问题的上下文，需脱离其事件流，否则刷新的工具调用会推送给该用户
+            with detached_events():
+                response = await func(**self.list_args)
+            added = self.learn_from_response(response)
+        except Exception as e:
+            logger.warning(f"刷新基金列表失败: {str(e)}")
+            return
+        self.updated_at = time.time()
+        self._dirty = True
+        await self.save_async()
+        logger.info(f"基金列表已刷新，新增 {added} 只，共 {len(self.funds)} 只")
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        return {
+            "funds": len(self.funds),
+            "aliases": len(self.aliases),
+            "resolved": self.resolved,
+            "candidates": self.candidates,
+        }
+
+
+def install_fund_resolver(toolkit, resolver: Optional[FundResolver]) -> None:
+    """为MCP工具套上基金名称收集层，从返回结果中收集基金代码和名称"""
+    if resolver is None:
+        return
+    for name, tool in toolkit.tools.items():
+        layers = getattr(tool.original_func, "__tool_layers__", set())
+        if tool.mcp_name is None or "fund_resolver" in layers:
+            continue
+        if not any(fnmatch.fnmatchcase(name, pattern) for pattern in resolver.learn_tools):
+            continue
+        tool.original_func = _wrap(resolver, tool.original_func)
+
+
+def _wrap(resolver, func):
+    async def call_tool(**kwargs):
+        response = await func(**kwargs)
+        if resolver.learn_from_response(response) and resolver.save_due():
+            await resolver.save_async()
+        return response
+
+    call_tool.__tool_layers__ = getattr(func, "__tool_layers__", set()) | {"fund_resolver"}
+    return call_tool
+
+
+# 进程内共享的识别索引
+_resolvers: Dict[str, Optional[FundResolver]] = {}
+
+
+def get_fund_resolver(config) -> Optional[FundResolver]:
+    """获取进程内共享的基金名称识别索引"""
+    key = json.dumps(
+        [(config or {}).get("fund_resolver", {}), (config or {}).get("answer_cache", {}).get("fund_aliases", {})],
+        sort_keys=True,
+    )
+    if key not in _resolvers:
+        _resolvers[key] = FundResolver.from_config(config)
+    return _resolvers[key]
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+多端点模型调用（对冲请求 + 熔断）
+模型服务偶尔变慢时，每一轮ReAct推理都会卡住，所有用户一起等待。
+按顺序配置多个兼容OpenAI API的端点：
+- 对冲：首个响应片段超过该端点近期延迟的分位数仍未返回时，向下一个端点再发一次相同请求，先返回的被采用，另一个取消
+- 熔断：连续失败达到阈值的端点暂停使用一段时间，之后放行一次试探请求；所有端点都不可用时仍放行首个端点试探，不直接失败
+- 延迟统计：近期明显慢于最快端点的端点排到后面
+端点状态按 base_url + 模型名 在进程内共享，所有基金管理助手共用
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+from agentscope.model import ChatModelBase, OpenAIChatModel
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class EndpointState:
+    """单个模型端点的延迟统计和熔断状态"""
+
+    def __init__(self, name: str, window=100, max_age=600, failure_threshold=3, reset_timeout=60):
+        """
+        Args:
+            name: 端点名称，用于日志和指标
+            window: 保留最近多少次请求的首个响应片段延迟
+            max_age: 延迟数据的有效期（秒），过期后被排到后面的端点重新按配置顺序使用
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断后多少秒放行一次试探请求
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_age = max_age
+
+        # (记录时间, 延迟)
+        self.latencies = deque(maxlen=window)
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.wins = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def acquire(self) -> bool:
+        """是否可以向该端点发送请求；半开状态下同一时间只放行一个试探请求"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append((time.monotonic(), latency))
+        metrics.MODEL_FIRST_CHUNK.observe(latency, endpoint=self.name)
+        if self.opened_at is not None:
+            logger.info(f"模型端点 {self.name} 已恢复")
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.errors += 1
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial:
+                logger.warning(f"模型端点 {self.name} 连续失败 {self.failures} 次，暂停使用 {self.reset_timeout} 秒")
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+    def record_cancelled(self, elapsed: Optional[float] = None) -> None:
+        """被对冲请求抢先的慢请求，已等待的时间计入延迟（实际延迟至少为此值）；取消不计为失败"""
+        if elapsed is not None:
+            self.latencies.append((time.monotonic(), elapsed))
+        self._trial = False
+
+    def percentile(self, q: float) -> Optional[float]:
+        """近期首个响应片段延迟的分位数，没有数据时返回None"""
+        since = time.monotonic() - self.max_age
+        ordered = sorted(latency for recorded_at, latency in self.latencies if recorded_at >= since)
+        if not ordered:
+            return None
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p90 = self.percentile(0.5), self.percentile(0.9)
+        return {
+            "state": self.state,
+            "requests": self.requests,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "p50_s": round(p50, 3) if p50 is not None else None,
+            "p90_s": round(p90, 3) if p90 is not None else None,
+        }
+
+
+class HedgedChatModel(ChatModelBase):
+    """按顺序使用多个模型端点，慢请求对冲、失败端点熔断"""
+
+    def __init__(
+        self,
+        endpoints: List[tuple],
+        hedge_percentile=0.9,
+        min_hedge_delay=2.0,
+        max_hedge_delay=20.0,
+        slow_factor=2.0,
+        stream=True,
+    ):
+        """
+        Args:
+            endpoints: [(模型实例, EndpointState), ...]，按优先顺序排列
+            hedge_percentile: 首个响应片段超过该端点近期延迟的这个分位数时发送对冲请求
+            min_hedge_delay: 对冲等待时间下限（秒）
+            max_hedge_delay: 对冲等待时间上限（秒），端点还没有延迟数据时使用
+            slow_factor: 近期延迟中位数超过最快端点这个倍数的端点排到后面
+            stream: 是否流式输出
+        """
+        super().__init__(endpoints[0][0].model_name, stream)
+        self.endpoints = endpoints
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.slow_factor = slow_factor
+
+    def _candidates(self) -> List[tuple]:
+        """本次请求依次尝试的端点：未熔断的端点按配置顺序，明显变慢的排到后面"""
+        available = [(model, state) for model, state in self.endpoints if state.state != OPEN]
+        medians = [state.percentile(0.5) for _, state in available]
+        known = [m for m in medians if m is not None]
+        if known:
+            fastest = min(known)
+            available.sort(key=lambda item: (item[1].percentile(0.5) or 0) > fastest * self.slow_factor)
+        # 所有端点都已熔断时仍按配置顺序尝试，不直接失败
+        return available or list(self.endpoints)
+
+    def _hedge_delay(self, state: EndpointState) -> float:
+        latency = state.percentile(self.hedge_percentile)
+        if latency is None:
+            return self.max_hedge_delay
+        return min(max(latency, self.min_hedge_delay), self.max_hedge_delay)
+
+    @staticmethod
+    async def _first_response(model, state: EndpointState, args, kwargs):
+        """
+        发送请求并等待首个响应片段，返回 (首个片段, 后续片段的生成器或None, 延迟)
+
+        失败由调用方在读取结果时记录：被取消的请求在取消过程中抛出的其他异常不应计为端点失败
+        """
+        start = time.perf_counter()
+        state.requests += 1
+        try:
+            response = await model(*args, **kwargs)
+            if not hasattr(response, "__anext__"):
+                return response, None, time.perf_counter() - start
+            try:
+                first = await response.__anext__()
+            except BaseException:
+                await response.aclose()
+                raise
+            return first, response, time.perf_counter() - start
+        except asyncio.CancelledError:
+            state.record_cancelled(time.perf_counter() - start)
+            raise
+
+    async def __call__(self, *args: Any, **kwargs: Any):
+        candidates = self._candidates()
+        # 所有端点都已熔断时不再跳过
+        force = all(state.state == OPEN for _, state in candidates)
+        tasks: Dict[asyncio.Task, tuple] = {}
+        next_index = 0
+        last_error: Optional[BaseException] = None
+
+        def start(model, state):
+            tasks[asyncio.ensure_future(self._first_response(model, state, args, kwargs))] = (model, state)
+
+        def launch():
+            nonlocal next_index
+            model, state = candidates[next_index]
+            next_index += 1
+            if not state.acquire() and not force:
+                # 熔断中（或半开状态下已有试探请求）的端点跳过
+                return False
+            start(model, state)
+            return True
+
+        try:
+            while not tasks and next_index < len(candidates):
+                launch()
+            if not tasks:
+                # 所有端点都在半开状态且已有试探请求：仍放行首个端点作为试探，不直接失败
+                logger.info(f"没有空闲的模型端点，向 {candidates[0][1].name} 发送试探请求")
+                start(*candidates[0])
+            while tasks:
+                newest = list(tasks.values())[-1][1]
+                can_hedge = next_index < len(candidates)
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=self._hedge_delay(newest) if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # 当前请求慢于近期延迟，向下一个端点发送对冲请求
+                    newest.hedges += 1
+                    metrics.MODEL_HEDGES.inc(endpoint=newest.name)
+                    logger.info(f"模型端点 {newest.name} 响应慢，发送对冲请求")
+                    while next_index < len(candidates) and not launch():
+                        pass
+                    continue
+
+                for task in done:
+                    model, state = tasks.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        state.record_failure()
+                        metrics.MODEL_REQUESTS.inc(endpoint=state.name, outcome="error")
+                        logger.warning(f"模型端点 {state.name} 请求失败: {str(last_error)}")
+                        continue
+                    first, rest, latency = task.result()
+                    state.record_success(latency)
+                    state.wins += 1
+                    metrics.MODEL_REQUESTS.inc(endpoint=state.name, outcome="won")
+                    await self._cancel(tasks)
+                    if rest is None:
+                        return first
+                    return self._stream(state, first, rest)
+
+                # 已发出的请求都失败了，改用下一个端点
+                while not tasks and next_index < len(candidates):
+                    launch()
+        finally:
+            await self._cancel(tasks)
+
+        raise last_error or RuntimeError("没有可用的模型端点")
+
+    @staticmethod
+    async def _cancel(tasks: Dict[asyncio.Task, tuple]) -> None:
+        """
+        取消未被采用的请求；已返回首个片段的流式响应也要关闭
+
+        取消前已经失败的请求计为失败；被取消的请求不计为失败，取消过程中抛出其他异常时也只释放半开试探名额
+        """
+        cancelled = []
+        for task, (_, state) in list(tasks.items()):
+            if not task.done():
+                task.cancel()
+                cancelled.append((task, state))
+                metrics.MODEL_REQUESTS.inc(endpoint=state.name, outcome="cancelled")
+            elif task.cancelled():
+                continue
+            elif task.exception() is not None:
+                state.record_failure()
+                metrics.MODEL_REQUESTS.inc(endpoint=state.name, outcome="error")
+            else:
+                _, rest, latency = task.result()
+                if rest is not None:
+                    await rest.aclose()
+                state.record_success(latency)
+                metrics.MODEL_REQUESTS.inc(endpoint=state.name, outcome="cancelled")
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for task, state in cancelled:
+            if not task.cancelled():
+                state.record_cancelled()
+        tasks.clear()
+
+    @staticmethod
+    async def _stream(state: EndpointState, first, rest):
+        yield first
+        try:
+            async for chunk in rest:
+                yield chunk
+        except Exception:
+            state.record_failure()
+            raise
+
+
+# 进程内共享的端点状态，按 base_url + 模型名
+_states: Dict[str, EndpointState] = {}
+
+
+def _endpoint_state(endpoint: Dict[str, Any], hedging_config: Dict[str, Any]) -> EndpointState:
+    name = f"{endpoint['model_name']}@{endpoint['base_url']}"
+    if name not in _states:
+        _states[name] = EndpointState(
+            name,
+            window=hedging_config.get("latency_window", 100),
+            max_age=hedging_config.get("latency_max_age", 600),
+            failure_threshold=hedging_config.get("failure_threshold", 3),
+            reset_timeout=hedging_config.get("reset_timeout", 60),
+        )
+    return _states[name]
+
+
+def create_chat_model(model_config: Dict[str, Any], hedging_config: Optional[Dict[str, Any]] = None) -> ChatModelBase:
+    """
+    创建模型实例：没有配置备用端点时为普通的 OpenAIChatModel，否则为 HedgedChatModel
+
+    Args:
+        model_config: 主端点配置 {"model_name", "api_key", "base_url"}
+        hedging_config: config["model_hedging"]，endpoints 为按优先顺序排列的备用端点
+    """
+    hedging_config = hedging_config or {}
+    endpoints = [model_config]
+    if hedging_config.get("enabled", True):
+        endpoints += [
+            {**model_config, **endpoint} for endpoint in hedging_config.get("endpoints", [])
+        ]
+    models = [
+        OpenAIChatModel(
+            model_name=endpoint["model_name"],
+            api_key=endpoint["api_key"],
+            client_args={"base_url": endpoint["base_url"]},
+        )
+        for endpoint in endpoints
+    ]
+    if len(models) == 1:
+        return models[0]
+    return HedgedChatModel(
+        [(model, _endpoint_state(endpoint, hedging_config)) for model, endpoint in zip(models, endpoints)],
+        hedge_percentile=hedging_config.get("hedge_percentile", 0.9),
+        min_hedge_delay=hedging_config.get("min_hedge_delay", 2.0),
+        max_hedge_delay=hedging_config.get("max_hedge_delay", 20.0),
+        slow_factor=hedging_config.get("slow_factor", 2.0),
+    )
+
+
+def endpoint_stats() -> Dict[str, Dict[str, Any]]:
+    """各模型端点的统计信息"""
+    return {name: state.stats() for name, state in _states.items()}
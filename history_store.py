@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+问答历史记录索引
+历史记录页面每次列出记录都要 glob 整个 results/ 目录并读取每个文件的修改时间，记录多了之后越来越慢，且一次返回全部文件名。
+在SQLite中维护历史记录索引（文件名、时间、问题、大小、回答预览），由保存和删除记录时同步更新：
+- 列表查询只读覆盖索引，按时间或大小排序，按日期范围过滤，用游标分页
+- 启动时与 results/ 目录核对一次，补录索引中缺少的文件、移除已不存在的文件
+- 索引由Web应用创建和关闭；连接可在多个线程中使用（由锁串行化），事件循环中的写入放到线程池执行
+"""
+
+import base64
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional
+
+from text_patterns import TIME_SECTION, QUESTION_SECTION, ANSWER_SECTION
+
+logger = logging.getLogger(__name__)
+
+# 排序字段 -> 列名
+SORT_COLUMNS = {"time": "created_at", "size": "size"}
+
+
+def encode_cursor(sort_value, filename: str) -> str:
+    """分页游标：上一页最后一条记录的排序值和文件名"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, filename]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """解析分页游标，格式不正确时抛出 ValueError"""
+    try:
+        sort_value, filename = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+    return sort_value, filename
+
+
+class HistoryStore:
+    """results/ 目录下问答记录的SQLite索引"""
+
+    def __init__(self, results_dir="results", path="cache/history.db", title_chars=100, preview_chars=200):
+        """
+        Args:
+            results_dir: 历史记录目录
+            path: SQLite文件路径
+            title_chars: 列表中显示的问题最多保留的字符数
+            preview_chars: 列表中显示的回答预览最多保留的字符数
+        """
+        self.results_dir = results_dir
+        self.title_chars = title_chars
+        self.preview_chars = preview_chars
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Web服务每次启动都在新的线程和事件循环中运行，连接不绑定创建它的线程
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "filename TEXT PRIMARY KEY, created_at TEXT, size INTEGER, "
+            "title TEXT, preview TEXT, question TEXT)"
+        )
+        # 覆盖索引：列表查询只读索引，不回表读取完整问题
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS history_by_time ON history (created_at, filename, size, title, preview)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS history_by_size ON history (size, filename, created_at, title, preview)"
+        )
+        self._db.commit()
+
+    @classmethod
+    def from_config(cls, config) -> Optional["HistoryStore"]:
+        """根据 config["history"] 创建，未启用时返回None（需调用 sync 与 results/ 目录核对）"""
+        history_config = (config or {}).get("history", {})
+        if not history_config.get("enabled", True):
+            return None
+        return cls(
+            path=history_config.get("path", "cache/history.db"),
+            title_chars=history_config.get("title_chars", 100),
+            preview_chars=history_config.get("preview_chars", 200),
+        )
+
+    def _row(self, filename: str, created_at: str, size: int, question: str, answer: str) -> tuple:
+        question = question.strip()
+        preview = " ".join(answer.split())[:self.preview_chars]
+        return filename, created_at, size, " ".join(question.split())[:self.title_chars], preview, question
+
+    def add(self, filename: str, created_at: str, size: int, question: str, answer: str) -> None:
+        """
+        记录一个问答记录文件（同名文件以新记录为准）
+
+        Args:
+            filename: results/ 下的文件名
+            created_at: 记录时间 YYYY-MM-DD HH:MM:SS
+            size: 文件大小（字节）
+            question: 问题
+            answer: 回答
+        """
+        row = self._row(filename, created_at, size, question, answer)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO history (filename, created_at, size, title, preview, question) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            self._db.commit()
+
+    def remove(self, filenames: List[str]) -> None:
+        """移除已删除文件的记录"""
+        with self._lock:
+            self._db.executemany("DELETE FROM history WHERE filename = ?", [(filename,) for filename in filenames])
+            self._db.commit()
+
+    def _parse_file(self, filename: str, stat: os.stat_result) -> Optional[tuple]:
+        try:
+            with open(os.path.join(self.results_dir, filename), "r", encoding="utf-8") as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"读取历史记录 {filename} 失败: {str(e)}")
+            return None
+        time_match = TIME_SECTION.search(content)
+        question_match = QUESTION_SECTION.search(content)
+        answer_match = ANSWER_SECTION.search(content)
+        created_at = (
+            time_match.group(1) if time_match
+            else datetime.datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+        )
+        return self._row(
+            filename,
+            created_at,
+            stat.st_size,
+            question_match.group(1) if question_match else "",
+            answer_match.group(1) if answer_match else "",
+        )
+
+    def sync(self) -> None:
+        """与 results/ 目录核对：补录索引中缺少的文件，移除已不存在的文件"""
+        if not os.path.isdir(self.results_dir):
+            return
+        files = {
+            entry.name: entry.stat()
+            for entry in os.scandir(self.results_dir)
+            if entry.is_file() and entry.name.endswith(".md")
+        }
+        with self._lock:
+            indexed = {filename for filename, in self._db.execute("SELECT filename FROM history")}
+        missing = [filename for filename in files if filename not in indexed]
+        rows = [row for row in (self._parse_file(filename, files[filename]) for filename in missing) if row is not None]
+        removed = [filename for filename in indexed if filename not in files]
+        with self._lock:
+            if rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO history (filename, created_at, size, title, preview, question) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            if removed:
+                self._db.executemany("DELETE FROM history WHERE filename = ?", [(filename,) for filename in removed])
+            self._db.commit()
+        if rows or removed:
+            logger.info(f"历史记录索引已同步：补录 {len(rows)} 条，移除 {len(removed)} 条")
+
+    def page(
+        self,
+        limit=50,
+        cursor: Optional[str] = None,
+        sort="time",
+        order="desc",
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        分页列出历史记录
+
+        Args:
+            limit: 每页条数
+            cursor: 上一页返回的 next_cursor，为None时从第一页开始
+            sort: 排序字段，time 或 size
+            order: desc 或 asc
+            start_date: 起始日期 YYYY-MM-DD（含）
+            end_date: 截止日期 YYYY-MM-DD（含）
+
+        Returns:
+            dict: {"items": [{"filename", "created_at", "size", "question", "preview"}], "next_cursor": 下一页游标或None}
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"不支持的排序字段: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"不支持的排序方向: {order}")
+        column = SORT_COLUMNS[sort]
+
+        conditions, params = [], []
+        if start_date:
+            conditions.append("created_at >= ?")
+            params.append(datetime.date.fromisoformat(start_date).isoformat())
+        if end_date:
+            conditions.append("created_at < ?")
+            params.append((datetime.date.fromisoformat(end_date) + datetime.timedelta(days=1)).isoformat())
+        if cursor:
+            sort_value, filename = decode_cursor(cursor)
+            conditions.append(f"({column}, filename) {'<' if order == 'desc' else '>'} (?, ?)")
+            params += [sort_value, filename]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        index = "history_by_time" if sort == "time" else "history_by_size"
+
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT filename, created_at, size, title, preview FROM history INDEXED BY {index} {where} "
+                f"ORDER BY {column} {order}, filename {order} LIMIT ?",
+                params + [limit + 1],
+            ).fetchall()
+        items = [
+            {"filename": filename, "created_at": created_at, "size": size, "question": title, "preview": preview}
+            for filename, created_at, size, title, preview in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor(last[column], last["filename"])
+        return {"items": items, "next_cursor": next_cursor}
+
+    def filenames(self) -> List[str]:
+        """所有记录的文件名，最新的在前"""
+        with self._lock:
+            return [
+                filename for filename, in self._db.execute(
+                    "SELECT filename FROM history INDEXED BY history_by_time ORDER BY created_at DESC, filename DESC"
+                )
+            ]
+
+    def recent_questions(self, limit: int) -> List[str]:
+        """最近的问题（完整文本），最新的在前"""
+        with self._lock:
+            return [
+                question for question, in self._db.execute(
+                    "SELECT question FROM history ORDER BY created_at DESC LIMIT ?", (limit,)
+                )
+            ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+按事件循环区分的进程内共享实例
+GUI 每次启动服务都在新的线程和事件循环中运行，绑定事件循环（任务、信号量）或持有数据库连接的共享实例
+按 当前事件循环 + 配置 分别创建，由应用关闭时取出释放，不会被下一次启动的服务复用
+"""
+
+import asyncio
+import weakref
+from typing import Any, Callable, Dict, Hashable, List
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class LoopLocal:
+    """按事件循环区分的实例表，事件循环被回收后其实例随之释放"""
+
+    def __init__(self):
+        self._by_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Any]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        # 不在事件循环中创建的实例
+        self._outside: Dict[Hashable, Any] = {}
+
+    def _items(self) -> Dict[Hashable, Any]:
+        loop = _running_loop()
+        if loop is None:
+            return self._outside
+        return self._by_loop.setdefault(loop, {})
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """获取当前事件循环中 key 对应的实例，不存在时调用 factory() 创建"""
+        items = self._items()
+        if key not in items:
+            items[key] = factory()
+        return items[key]
+
+    def pop_all(self) -> List[Any]:
+        """移除并返回当前事件循环中的所有实例，由调用方释放"""
+        items = self._items()
+        values = list(items.values())
+        items.clear()
+        return values
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+MCP工具Schema本地缓存
+将 toolkit.get_json_schemas() 的结果按MCP地址缓存到本地文件，重启后无需等待工具列表即可响应首个问题
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def schema_hash(schemas: List[Dict[str, Any]]) -> str:
+    """计算工具Schema列表的哈希，用于判断服务端工具是否发生变化"""
+    canonical = json.dumps(
+        sorted(schemas, key=lambda s: s["function"]["name"]),
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _url_key(url: str) -> str:
+    """MCP地址中含有apiKey，缓存文件中只保存其哈希"""
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class ToolSchemaCache:
+    """按MCP地址缓存工具Schema，过期后先返回旧数据并在后台重新校验"""
+
+    def __init__(self, path="cache/mcp_schemas.json", ttl=86400):
+        """
+        Args:
+            path: 缓存文件路径
+            ttl: 缓存有效期（秒），超过后在后台重新拉取工具列表
+        """
+        self.path = path
+        self.ttl = ttl
+        self._revalidations: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def from_config(cls, config) -> Optional["ToolSchemaCache"]:
+        """根据 config["schema_cache"] 创建缓存，未启用时返回None"""
+        cache_config = (config or {}).get("schema_cache", {})
+        if not cache_config.get("enabled", True):
+            return None
+        return cls(
+            path=cache_config.get("path", "cache/mcp_schemas.json"),
+            ttl=cache_config.get("ttl", 86400),
+        )
+
+    def _read_all(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"读取工具Schema缓存失败，忽略缓存: {str(e)}")
+            return {}
+
+    def load(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        读取指定MCP地址的缓存
+
+        Returns:
+            dict: {"schemas", "hash", "saved_at", "stale"}，无缓存或缓存损坏时返回None
+        """
+        entry = self._read_all().get(_url_key(url))
+        if not entry or not entry.get("schemas"):
+            return None
+        # 文件被手动修改或写入不完整时哈希不一致，视为无效
+        if schema_hash(entry["schemas"]) != entry.get("hash"):
+            logger.warning("工具Schema缓存校验失败，忽略缓存")
+            return None
+        entry["stale"] = time.time() - entry.get("saved_at", 0) > self.ttl
+        return entry
+
+    def save(self, url: str, schemas: List[Dict[str, Any]]) -> str:
+        """保存工具Schema，返回其哈希"""
+        digest = schema_hash(schemas)
+        data = self._read_all()
+        data[_url_key(url)] = {
+            "saved_at": time.time(),
+            "hash": digest,
+            "schemas": schemas,
+        }
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # 先写临时文件再替换，避免并发读到写了一半的文件
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        return digest
+
+    def revalidate(self, url: str, fetch) -> asyncio.Task:
+        """
+        后台重新拉取工具Schema并更新缓存，同一地址同时只会有一个校验任务
+
+        Args:
+            url: MCP地址
+            fetch: 无参协程函数，返回最新的工具Schema列表
+
+        Returns:
+            asyncio.Task: 结果为 (schemas, hash)
+        """
+        key = _url_key(url)
+        task = self._revalidations.get(key)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._revalidate(url, fetch))
+            self._revalidations[key] = task
+        return task
+
+    async def _revalidate(self, url: str, fetch):
+        schemas = await fetch()
+        old = self.load(url)
+        digest = self.save(url, schemas)
+        if old is None or old["hash"] != digest:
+            logger.info(f"MCP工具列表已变化，已更新工具Schema缓存，共 {len(schemas)} 个工具")
+        return schemas, digest
+
+
+# 进程内共享的缓存实例，按缓存文件路径区分
+_caches: Dict[str, ToolSchemaCache] = {}
+
+
+def get_schema_cache(config) -> Optional[ToolSchemaCache]:
+    """获取进程内共享的工具Schema缓存"""
+    cache = ToolSchemaCache.from_config(config)
+    if cache is None:
+        return None
+    return _caches.setdefault(cache.path, cache)
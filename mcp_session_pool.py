@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+MCP长连接会话池
+HttpStatelessClient 每次工具调用都要重新建立HTTP/SSE连接并完成TLS握手和MCP初始化，
+pooled 模式下进程内保持少量长连接会话，工具调用在会话上复用，断线自动重连并定期检查健康状态
+"""
+
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Dict, Any, List, Optional
+
+import httpx
+import mcp.types
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
+from agentscope.mcp import HttpStatefulClient, MCPClientBase, MCPToolFunction
+from agentscope.tool import ToolResponse
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# MCP工具调用模式
+MODE_STATELESS = "stateless"
+MODE_POOLED = "pooled"
+
+
+class _PooledSession:
+    """会话池中的一个长连接会话"""
+
+    def __init__(self, name: str, transport: str, url: str):
+        self.name = name
+        self.transport = transport
+        self.url = url
+
+        self.session = None
+        self.in_flight = 0
+        self.connects = 0
+        self._connecting: Optional[asyncio.Future] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        """返回已连接的会话，未连接时建立连接，并发调用只连接一次"""
+        if self.session is not None:
+            return self.session
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._start())
+        return await asyncio.shield(self._connecting)
+
+    async def _start(self):
+        ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run(ready, self._closing))
+        try:
+            self.session = await ready
+            self.connects += 1
+            return self.session
+        finally:
+            self._connecting = None
+
+    async def _run(self, ready: asyncio.Future, closing: asyncio.Event) -> None:
+        # MCP客户端的连接和关闭必须在同一个任务中完成，由该任务持有连接直到收到关闭信号
+        client = HttpStatefulClient(name=self.name, transport=self.transport, url=self.url)
+        try:
+            await client.connect()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            return
+        ready.set_result(client.session)
+        try:
+            await closing.wait()
+        finally:
+            await client.close()
+
+    async def reset(self) -> None:
+        """关闭当前连接，下次使用时重新连接"""
+        self.session = None
+        if self._closing is not None:
+            self._closing.set()
+        task, self._task = self._task, None
+        if task is not None:
+            try:
+                await task
+            except Exception as e:
+                logger.debug(f"关闭MCP会话出错: {str(e)}")
+
+
+class McpSessionPool:
+    """MCP长连接会话池，同一会话上的多个调用可并发进行"""
+
+    def __init__(self, url, transport="sse", size=2, call_timeout=60, health_check_interval=60, name="qieman_mcp"):
+        """
+        Args:
+            url: MCP服务地址
+            transport: 传输方式，"sse" 或 "streamable_http"
+            size: 长连接会话数量
+            call_timeout: 单次工具调用超时（秒），超时的会话会被重连
+            health_check_interval: 空闲会话的健康检查（ping）间隔（秒）
+            name: MCP客户端名称
+        """
+        self.url = url
+        self.transport = transport
+        self.size = size
+        self.call_timeout = call_timeout
+        self.health_check_interval = health_check_interval
+        self.name = name
+
+        self._sessions = [_PooledSession(name, transport, url) for _ in range(size)]
+        self._health_task: Optional[asyncio.Task] = None
+
+        self.calls = 0
+        self.reconnects = 0
+        self.health_failures = 0
+
+    @classmethod
+    def from_config(cls, config) -> "McpSessionPool":
+        """根据 config["mcp"] 创建会话池"""
+        mcp_config = config["mcp"]
+        return cls(
+            url=mcp_config["url"],
+            transport=mcp_config.get("transport", "sse"),
+            size=mcp_config.get("pool_size", 2),
+            call_timeout=mcp_config.get("call_timeout", 60),
+            health_check_interval=mcp_config.get("health_check_interval", 60),
+        )
+
+    def get_client(self):
+        """一次性的MCP客户端连接（上下文管理器），与 HttpStatelessClient.get_client 相同"""
+        if self.transport == "streamable_http":
+            return streamablehttp_client(url=self.url)
+        return sse_client(url=self.url)
+
+    async def start(self) -> None:
+        """预先建立所有会话连接，连接失败的会话在使用时重试"""
+        results = await asyncio.gather(
+            *(pooled.connect() for pooled in self._sessions),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning(f"MCP会话池预连接失败 {len(failed)}/{self.size}: {failed[0]}")
+        self._ensure_health_task()
+        logger.info(f"MCP会话池已启动，会话数: {self.size}")
+
+    async def close(self) -> None:
+        """关闭所有会话"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(pooled.reset() for pooled in self._sessions), return_exceptions=True)
+
+    def _ensure_health_task(self) -> None:
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    def _pick(self) -> _PooledSession:
+        """优先选择已连接且进行中调用最少的会话"""
+        return min(self._sessions, key=lambda s: (s.session is None, s.in_flight))
+
+    async def _call(self, operation):
+        """在会话上执行 operation(session)，连接失败或超时的会话重连，连接错误时换一个会话重试一次"""
+        self._ensure_health_task()
+        for attempt in range(2):
+            pooled = self._pick()
+            try:
+                session = await pooled.connect()
+                pooled.in_flight += 1
+                try:
+                    return await operation(session)
+                finally:
+                    pooled.in_flight -= 1
+            except McpError as e:
+                # 服务端返回的协议错误不重试；请求超时说明连接可能已失效，重连后抛出
+                if e.error.code == httpx.codes.REQUEST_TIMEOUT:
+                    await self._reconnect(pooled, e)
+                raise
+            except Exception as e:
+                await self._reconnect(pooled, e)
+                if attempt:
+                    raise
+
+    async def _reconnect(self, pooled: _PooledSession, error) -> None:
+        logger.warning(f"MCP会话连接异常，重新连接: {type(error).__name__}: {error}")
+        self.reconnects += 1
+        metrics.MCP_SESSION_RECONNECTS.inc()
+        await pooled.reset()
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any], timeout: Optional[timedelta] = None):
+        """调用MCP工具，返回 mcp.types.CallToolResult"""
+        self.calls += 1
+        read_timeout = timeout or timedelta(seconds=self.call_timeout)
+        return await self._call(
+            lambda session: session.call_tool(name, arguments=arguments, read_timeout_seconds=read_timeout)
+        )
+
+    async def list_tools(self) -> List[mcp.types.Tool]:
+        """获取MCP服务的工具列表"""
+        result = await self._call(lambda session: session.list_tools())
+        return result.tools
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for pooled in self._sessions:
+                if pooled.session is None or pooled.in_flight:
+                    continue
+                try:
+                    await asyncio.wait_for(pooled.session.send_ping(), timeout=self.call_timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.health_failures += 1
+                    await self._reconnect(pooled, e)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回会话池运行状态"""
+        return {
+            "size": self.size,
+            "connected": sum(1 for s in self._sessions if s.session is not None),
+            "in_flight": sum(s.in_flight for s in self._sessions),
+            "calls": self.calls,
+            "reconnects": self.reconnects,
+            "health_failures": self.health_failures,
+        }
+
+
+class PooledMcpToolFunction(MCPToolFunction):
+    """通过会话池调用的MCP工具函数"""
+
+    def __init__(self, mcp_name: str, tool: mcp.types.Tool, pool: McpSessionPool, wrap_tool_result: bool = True):
+        super().__init__(
+            mcp_name=mcp_name,
+            tool=tool,
+            wrap_tool_result=wrap_tool_result,
+            client_gen=pool.get_client,
+        )
+        self.pool = pool
+
+    async def __call__(self, **kwargs: Any) -> mcp.types.CallToolResult | ToolResponse:
+        res = await self.pool.call_tool(self.name, kwargs, self.timeout)
+        if self.wrap_tool_result:
+            return ToolResponse(
+                content=MCPClientBase._convert_mcp_content_to_as_blocks(res.content),
+                metadata=res.meta,
+            )
+        return res
+
+
+# 进程内共享的会话池，按 事件循环 + MCP地址 区分
+_pools: Dict[tuple, McpSessionPool] = {}
+
+
+def get_session_pool(config) -> Optional[McpSessionPool]:
+    """获取进程内共享的MCP会话池，config["mcp"]["mode"] 不是 pooled 时返回None"""
+    mcp_config = (config or {}).get("mcp", {})
+    if mcp_config.get("mode", MODE_STATELESS) != MODE_POOLED:
+        return None
+    key = (id(asyncio.get_running_loop()), mcp_config["url"])
+    if key not in _pools:
+        _pools[key] = McpSessionPool.from_config(config)
+    return _pools[key]
+
+
+async def close_session_pools() -> None:
+    """关闭当前事件循环中的所有MCP会话池"""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _pools if k[0] == loop_id]:
+        await _pools.pop(key).close()
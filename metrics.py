@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标
+轻量的计数器/仪表/直方图实现，以Prometheus文本格式输出，供 /metrics 接口使用。
+记录只涉及字典查找和加法，不引入额外依赖，也不影响请求处理耗时
+"""
+
+import bisect
+import math
+from typing import Dict, List, Tuple
+
+import agent_events
+
+# 默认耗时分桶（秒），覆盖毫秒级缓存命中到数分钟的完整分析
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 数据大小分桶（字节）
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# /metrics 接口的响应类型
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 次数分桶
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+# 估算token数的分桶
+TOKEN_BUCKETS = (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+
+def _format_labels(labelnames, values, extra=None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各分桶计数（不累计）..., +Inf计数], 总和
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def sum(self, **labels) -> float:
+        entry = self._values.get(self._key(labels))
+        return entry[1] if entry else 0.0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """以Prometheus文本格式输出所有指标"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+QUERY_DURATION = REGISTRY.histogram(
+    "fund_query_duration_seconds", "处理一个问题的总耗时", ("status",))
+QUERY_ROUNDS = REGISTRY.histogram(
+    "fund_query_react_rounds", "每个问题的ReAct推理轮数", buckets=COUNT_BUCKETS)
+ANSWER_BYTES = REGISTRY.histogram(
+    "fund_answer_bytes", "最终回答大小（字节）", buckets=SIZE_BUCKETS)
+LLM_ROUND_DURATION = REGISTRY.histogram(
+    "fund_llm_round_duration_seconds", "单轮模型推理耗时")
+TOOL_DURATION = REGISTRY.histogram(
+    "fund_mcp_tool_duration_seconds", "MCP工具调用耗时", ("tool",))
+TOOL_CALLS = REGISTRY.counter(
+    "fund_mcp_tool_calls_total", "MCP工具调用次数", ("tool", "status"))
+TOOL_RESPONSE_BYTES = REGISTRY.histogram(
+    "fund_mcp_tool_response_bytes", "MCP工具返回数据大小（字节）", ("tool",), buckets=SIZE_BUCKETS)
+QUEUE_WAIT = REGISTRY.histogram(
+    "fund_queue_wait_seconds", "等待可用基金管理助手的时间", ("stage",))
+WS_CONNECTIONS = REGISTRY.gauge(
+    "fund_ws_connections", "当前WebSocket连接数")
+WS_QUESTIONS = REGISTRY.counter(
+    "fund_ws_questions_total", "通过WebSocket收到的问题数", ("outcome",))
+AGENT_RUNS_CANCELLED = REGISTRY.counter(
+    "fund_agent_runs_cancelled_total", "因客户端断开或处理超时被取消的问题数", ("reason",))
+MODEL_FIRST_CHUNK = REGISTRY.histogram(
+    "fund_model_first_chunk_seconds", "模型端点返回首个响应片段的延迟", ("endpoint",))
+MODEL_REQUESTS = REGISTRY.counter(
+    "fund_model_requests_total", "各模型端点的请求结果（采用、失败、被对冲请求抢先后取消）", ("endpoint", "outcome"))
+MODEL_HEDGES = REGISTRY.counter(
+    "fund_model_hedges_total", "因模型端点响应慢而发送的对冲请求数", ("endpoint",))
+MODEL_CIRCUIT_OPEN = REGISTRY.gauge(
+    "fund_model_circuit_open", "模型端点是否处于熔断状态（1为熔断）", ("endpoint",))
+CLASS_QUESTIONS = REGISTRY.counter(
+    "fund_query_class_questions_total", "按复杂度类别统计的问题数", ("query_class", "status"))
+CLASS_DURATION = REGISTRY.histogram(
+    "fund_query_class_duration_seconds", "按复杂度类别统计的问题处理耗时", ("query_class",))
+CLASS_TOKENS = REGISTRY.counter(
+    "fund_query_class_tokens_total", "按复杂度类别统计的模型token用量", ("query_class", "kind"))
+CLASS_COST = REGISTRY.counter(
+    "fund_query_class_cost_total", "按复杂度类别统计的模型费用（按配置的单价估算）", ("query_class",))
+SPECULATIVE_CALLS = REGISTRY.counter(
+    "fund_speculative_tool_calls_total", "推测预取的工具调用（被使用、浪费、因预算跳过）", ("outcome",))
+FAN_OUT_SUBTASKS = REGISTRY.counter(
+    "fund_fan_out_subtasks_total", "多基金问题拆分出的子任务数", ("status",))
+FAN_OUT_SUBTASK_DURATION = REGISTRY.histogram(
+    "fund_fan_out_subtask_duration_seconds", "多基金问题拆分出的单个子任务耗时", ("status",))
+FAN_OUT_SUBTASK_ROUNDS = REGISTRY.histogram(
+    "fund_fan_out_subtask_react_rounds", "多基金问题拆分出的子任务的ReAct推理轮数", buckets=COUNT_BUCKETS)
+FAN_OUT_SAVED = REGISTRY.counter(
+    "fund_fan_out_saved_seconds_total", "多基金问题并发处理比依次处理节省的时间（秒）")
+SCHEDULER_RUNNING = REGISTRY.gauge(
+    "fund_scheduler_running", "正在处理的问题数")
+SCHEDULER_QUEUED = REGISTRY.gauge(
+    "fund_scheduler_queued", "排队等待处理的问题数")
+SCHEDULER_REJECTED = REGISTRY.counter(
+    "fund_scheduler_rejected_total", "因排队已满被拒绝的问题数")
+MCP_SESSION_RECONNECTS = REGISTRY.counter(
+    "fund_mcp_session_reconnects_total", "MCP长连接会话断线重连次数")
+MCP_SESSION_STATS = REGISTRY.gauge(
+    "fund_mcp_session_stat", "MCP长连接会话池的统计值", ("stat",))
+CACHE_STATS = REGISTRY.gauge(
+    "fund_cache_stat", "问答缓存、工具结果缓存和并发合并的统计值", ("cache", "stat"))
+POOL_STATS = REGISTRY.gauge(
+    "fund_pool_stat", "基金管理助手预热池的统计值", ("stat",))
+TOOL_RESULT_BYTES_SAVED = REGISTRY.counter(
+    "fund_tool_result_bytes_saved_total", "工具结果精简后少发送给模型的字节数", ("tool",))
+PREFETCH_CALLS = REGISTRY.counter(
+    "fund_prefetch_calls_total", "预取关注基金数据的工具调用次数", ("status",))
+TOOL_ROUTER_SELECTED = REGISTRY.histogram(
+    "fund_tool_router_selected_tools", "每个问题提供给模型的工具数", buckets=(1, 2, 4, 6, 8, 12, 16, 24, 32, 48, 64))
+TOOL_ROUTER_FALLBACKS = REGISTRY.counter(
+    "fund_tool_router_fallbacks_total", "模型调用了未提供的工具、改为提供全部工具的次数")
+TOOL_SCHEMA_TOKENS_SAVED = REGISTRY.counter(
+    "fund_tool_schema_tokens_saved_total", "按问题挑选工具后少发送的工具Schema估算token数（按推理轮次累计）")
+MEMORY_TOKENS = REGISTRY.histogram(
+    "fund_memory_prompt_tokens", "每轮推理发送的对话记忆估算token数（不含系统提示词）", buckets=TOKEN_BUCKETS)
+
+
+def record_cache_stats(cache: str, stats: Dict) -> None:
+    """将缓存的 stats() 结果同步到指标，在输出 /metrics 前调用"""
+    for stat, value in stats.items():
+        if isinstance(value, (int, float)):
+            CACHE_STATS.set(value, cache=cache, stat=stat)
+
+
+def record_pool_stats(stats: Dict) -> None:
+    """将预热池的 stats() 结果同步到指标"""
+    for stat in ("size", "idle", "recycled"):
+        POOL_STATS.set(stats.get(stat, 0), stat=stat)
+
+
+def record_session_pool_stats(stats: Dict) -> None:
+    """将MCP会话池的 stats() 结果同步到指标"""
+    for stat in ("size", "connected", "in_flight", "calls", "health_failures"):
+        MCP_SESSION_STATS.set(stats.get(stat, 0), stat=stat)
+
+
+def record_model_endpoint_stats(stats: Dict) -> None:
+    """将各模型端点的熔断状态同步到指标"""
+    for endpoint, endpoint_stats in stats.items():
+        MODEL_CIRCUIT_OPEN.set(1 if endpoint_stats.get("state") == "open" else 0, endpoint=endpoint)
+
+
+def _on_agent_event(event) -> None:
+    """将ReAct过程事件转换为指标"""
+    data = event.data
+    if event.type == agent_events.REASONING_END:
+        LLM_ROUND_DURATION.observe(data["duration_ms"] / 1000)
+    elif event.type == agent_events.TOOL_END:
+        status = "error" if data["error"] else "ok"
+        TOOL_CALLS.inc(tool=data["name"], status=status)
+        TOOL_DURATION.observe(data["duration_ms"] / 1000, tool=data["name"])
+        TOOL_RESPONSE_BYTES.observe(data["bytes"], tool=data["name"])
+
+
+agent_events.add_listener(_on_agent_event)
@@ -0,0 +1,609 @@
+# -*- coding: utf-8 -*-
+"""
+本地基金净值库
+从MCP净值类工具的返回结果中提取 (基金代码, 日期, 单位净值, 累计净值) 写入SQLite，按日期增量更新。
+- 同一交易日内已同步过的基金，净值查询直接由本地库回答，不再请求MCP服务；
+  回答使用与上游相同的结果结构（按工具和基金保存上游结果的外层结构和原始行），
+  带有本地库无法处理的参数（如页码）的调用仍转发给MCP服务
+- 只有上游结果表明已包含全部数据（总条数、没有下一页或只有一页）时，才记为同步过完整历史
+- days 参数在不同工具中可能是最近N条或最近N个自然日，按上游带 days 的结果判断各工具的含义，判断出之前不由本地库回答
+- 提供按基金代码和日期范围查询的接口，返回NumPy数组，供本地计算使用
+- 净值库按事件循环创建、随应用关闭；连接由锁串行化，工具调用层中的读写放到线程池执行
+"""
+
+import asyncio
+import copy
+import datetime
+import fnmatch
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import numpy as np
+from agentscope.tool import ToolResponse
+
+from answer_cache import current_trading_date
+from loop_local import LoopLocal
+from tool_compaction import parse_date
+
+logger = logging.getLogger(__name__)
+
+# 工具结果中日期、单位净值、累计净值可能使用的字段名
+DATE_FIELDS = ("navDate", "date", "tradeDate", "dt", "日期", "净值日期")
+NAV_FIELDS = ("nav", "unitNav", "netValue", "unitNetValue", "单位净值")
+ACC_NAV_FIELDS = ("accNav", "accumulatedNav", "accNetValue", "accumulatedNetValue", "累计净值")
+# 工具参数中基金代码、最近条数、天数、起止日期可能使用的参数名
+CODE_ARGS = ("fundCode", "fund_code", "code")
+COUNT_ARGS = ("count", "limit", "size", "pageSize")
+DAYS_ARGS = ("days",)
+START_ARGS = ("startDate", "beginDate", "start", "fromDate")
+END_ARGS = ("endDate", "end", "toDate")
+# 本地库能够处理的参数，带有其他参数的调用转发给MCP服务
+MODELED_ARGS = frozenset(CODE_ARGS + COUNT_ARGS + DAYS_ARGS + START_ARGS + END_ARGS)
+# days 参数的含义：最近N条 / 最近N个自然日
+DAYS_AS_ROWS = "rows"
+DAYS_AS_CALENDAR = "calendar"
+# 工具结果中的分页字段：总条数、是否还有下一页、当前页、总页数
+TOTAL_FIELDS = ("total", "totalCount", "totalSize", "totalElements", "totalNum", "totalRecords")
+HAS_MORE_FIELDS = ("hasNext", "hasMore", "hasNextPage")
+PAGE_FIELDS = ("pageNum", "pageNo", "page", "currentPage")
+PAGES_FIELDS = ("pages", "totalPages", "pageCount")
+
+
+def _first(mapping: Dict[str, Any], names) -> Tuple[Optional[str], Any]:
+    for name in names:
+        if mapping.get(name) not in (None, ""):
+            return name, mapping[name]
+    return None, None
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def find_nav_list(data, path=()) -> Optional[Dict[str, Any]]:
+    """
+    在工具返回的JSON中找出净值序列所在的列表
+
+    Returns:
+        dict: {"path": 从根到列表的键/下标, "items": 列表, "container": 包含列表的对象（列表在根部时为None）,
+               "date_field", "nav_field", "acc_field": 各字段名（没有累计净值时为None）}，找不到时返回None
+    """
+    if isinstance(data, list) and data and all(isinstance(item, dict) for item in data):
+        date_field, _ = _first(data[0], DATE_FIELDS)
+        nav_field, _ = _first(data[0], NAV_FIELDS)
+        if date_field and nav_field:
+            return {
+                "path": list(path),
+                "items": data,
+                "container": None,
+                "date_field": date_field,
+                "nav_field": nav_field,
+                "acc_field": _first(data[0], ACC_NAV_FIELDS)[0],
+            }
+    children = data.items() if isinstance(data, dict) else enumerate(data) if isinstance(data, list) else ()
+    for key, child in children:
+        if isinstance(child, (dict, list)):
+            found = find_nav_list(child, path + (key,))
+            if found is not None:
+                if found["container"] is None and len(found["path"]) == len(path) + 1:
+                    found["container"] = data
+                return found
+    return None
+
+
+def _nav_rows(nav_list: Dict[str, Any]) -> List[Tuple[str, float, Optional[float], str]]:
+    rows = []
+    for item in nav_list["items"]:
+        date = parse_date(str(item.get(nav_list["date_field"], "")))
+        nav = _to_float(item.get(nav_list["nav_field"]))
+        if date is not None and nav is not None:
+            acc_nav = _to_float(item.get(nav_list["acc_field"])) if nav_list["acc_field"] else None
+            rows.append((date.isoformat(), nav, acc_nav, json.dumps(item, ensure_ascii=False)))
+    return rows
+
+
+def extract_nav_rows(data) -> List[Tuple[str, float, Optional[float]]]:
+    """
+    从工具返回的JSON中找出净值序列
+
+    Returns:
+        list: [(ISO日期, 单位净值, 累计净值), ...]，找不到时返回空列表
+    """
+    nav_list = find_nav_list(data)
+    if nav_list is None:
+        return []
+    return [row[:3] for row in _nav_rows(nav_list)]
+
+
+def days_unit(days: int, dates: List[datetime.date]) -> Optional[str]:
+    """
+    按带 days 参数的上游结果判断其含义：返回的条数正好为N时为最近N条，
+    条数不是N且都在最新日期之前N个自然日内时为自然日窗口，无法区分时返回None
+    """
+    if days <= 1 or not dates:
+        return None
+    as_rows = len(dates) == days
+    as_calendar = min(dates) >= max(dates) - datetime.timedelta(days=days)
+    if as_rows and not as_calendar:
+        return DAYS_AS_ROWS
+    if as_calendar and not as_rows:
+        return DAYS_AS_CALENDAR
+    return None
+
+
+def is_complete(data, nav_list: Dict[str, Any]) -> bool:
+    """
+    工具结果是否包含了全部数据：总条数不多于返回的行数、明确没有下一页或只有一页；
+    没有分页信息时无法确认，视为不完整
+    """
+    count = len(nav_list["items"])
+    complete = False
+    for mapping in (nav_list["container"], data):
+        if not isinstance(mapping, dict):
+            continue
+        _, has_more = _first(mapping, HAS_MORE_FIELDS)
+        if has_more is not None:
+            if str(has_more).lower() in ("true", "1"):
+                return False
+            complete = True
+        total = _to_float(_first(mapping, TOTAL_FIELDS)[1])
+        if total is not None:
+            if total > count:
+                return False
+            complete = True
+        pages = _to_float(_first(mapping, PAGES_FIELDS)[1])
+        if pages is not None:
+            if pages > 1:
+                return False
+            complete = True
+    return complete
+
+
+class NavStore:
+    """基金净值本地库（SQLite），按 基金代码 + 日期 建立主键索引"""
+
+    def __init__(self, path="cache/nav.db", tools=None, serve_local=True, nav_publish_time="21:00"):
+        """
+        Args:
+            path: SQLite文件路径
+            tools: 写入和代答的净值类工具名（支持通配符*）
+            serve_local: 为True时，当天已同步过的基金由本地库回答净值查询
+            nav_publish_time: 每日净值发布时间，用于判断本地数据是否为最新交易日
+        """
+        self.tools = tools or ["*Nav*", "*nav*"]
+        self.serve_local = serve_local
+        self.nav_publish_time = nav_publish_time
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # raw 为上游结果中的原始行（JSON），本地回答时原样返回
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS nav ("
+            "fund_code TEXT, date TEXT, nav REAL, acc_nav REAL, raw TEXT, "
+            "PRIMARY KEY (fund_code, date)) WITHOUT ROWID"
+        )
+        if "raw" not in {row[1] for row in self._db.execute("PRAGMA table_info(nav)")}:
+            self._db.execute("ALTER TABLE nav ADD COLUMN raw TEXT")
+        # 每只基金最近一次从MCP同步时对应的交易日，以及是否同步过完整历史
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS nav_sync ("
+            "fund_code TEXT PRIMARY KEY, trading_date TEXT, full_history INTEGER)"
+        )
+        # 各工具返回结果的结构（外层对象、净值列表位置、字段名、日期顺序），按工具和基金保存
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS nav_shape ("
+            "tool TEXT, fund_code TEXT, shape TEXT, PRIMARY KEY (tool, fund_code)) WITHOUT ROWID"
+        )
+        # 各工具 days 参数的含义（rows / calendar），由上游结果判断
+        self._db.execute("CREATE TABLE IF NOT EXISTS nav_days (tool TEXT PRIMARY KEY, unit TEXT)")
+        self._db.commit()
+
+        self.local_hits = 0
+        self.upstream_fetches = 0
+        self.rows_written = 0
+
+    @classmethod
+    def from_config(cls, config) -> Optional["NavStore"]:
+        """根据 config["nav_store"] 创建净值库，未启用时返回None"""
+        store_config = (config or {}).get("nav_store", {})
+        if not store_config.get("enabled", True):
+            return None
+        return cls(
+            path=store_config.get("path", "cache/nav.db"),
+            tools=store_config.get("tools"),
+            serve_local=store_config.get("serve_local", True),
+            nav_publish_time=(config or {}).get("tool_cache", {}).get("nav_publish_time", "21:00"),
+        )
+
+    def handles(self, tool_name: str) -> bool:
+        return any(fnmatch.fnmatchcase(tool_name, pattern) for pattern in self.tools)
+
+    def upsert(self, fund_code: str, rows: List[tuple]) -> int:
+        """写入净值 [(ISO日期, 单位净值, 累计净值[, 原始行JSON])]，同一日期的数据以新数据为准，返回写入行数"""
+        if not rows:
+            return 0
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO nav (fund_code, date, nav, acc_nav, raw) VALUES (?, ?, ?, ?, ?)",
+                [(fund_code, *row[:3], row[3] if len(row) > 3 else None) for row in rows],
+            )
+            self._db.commit()
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def mark_synced(self, fund_code: str, full_history: bool) -> None:
+        """记录基金已同步到当前交易日"""
+        trading_date = current_trading_date(datetime.datetime.now(), self.nav_publish_time).isoformat()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO nav_sync (fund_code, trading_date, full_history) VALUES (?, ?, ?) "
+                "ON CONFLICT(fund_code) DO UPDATE SET trading_date = excluded.trading_date, "
+                "full_history = MAX(full_history, excluded.full_history)",
+                (fund_code, trading_date, int(full_history)),
+            )
+            self._db.commit()
+
+    def save_shape(self, tool_name: str, fund_code: str, data, nav_list: Dict[str, Any]) -> None:
+        """保存工具结果的结构，净值列表清空后作为本地回答的外层对象"""
+        envelope = copy.deepcopy(data)
+        if nav_list["path"]:
+            parent = envelope
+            for key in nav_list["path"][:-1]:
+                parent = parent[key]
+            parent[nav_list["path"][-1]] = []
+        else:
+            envelope = []
+        dates = [parse_date(str(item.get(nav_list["date_field"], ""))) for item in nav_list["items"]]
+        dates = [date for date in dates if date is not None]
+        shape = {
+            "envelope": envelope,
+            "path": nav_list["path"],
+            "date_field": nav_list["date_field"],
+            "nav_field": nav_list["nav_field"],
+            "acc_field": nav_list["acc_field"],
+            "descending": len(dates) > 1 and dates[0] > dates[-1],
+        }
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO nav_shape (tool, fund_code, shape) VALUES (?, ?, ?)",
+                (tool_name, fund_code, json.dumps(shape, ensure_ascii=False)),
+            )
+            self._db.commit()
+
+    def _shape(self, tool_name: str, fund_code: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT shape FROM nav_shape WHERE tool = ? AND fund_code = ?", (tool_name, fund_code)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_days_unit(self, tool_name: str, unit: str) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO nav_days (tool, unit) VALUES (?, ?)", (tool_name, unit))
+            self._db.commit()
+
+    def days_unit(self, tool_name: str) -> Optional[str]:
+        """工具 days 参数的含义，尚未判断出时返回None"""
+        with self._lock:
+            row = self._db.execute("SELECT unit FROM nav_days WHERE tool = ?", (tool_name,)).fetchone()
+        return row[0] if row else None
+
+    def is_fresh(self, fund_code: str) -> Tuple[bool, bool]:
+        """
+        Returns:
+            tuple: (是否已同步到当前交易日, 是否同步过完整历史)
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT trading_date, full_history FROM nav_sync WHERE fund_code = ?", (fund_code,)
+            ).fetchone()
+        if row is None:
+            return False, False
+        trading_date = current_trading_date(datetime.datetime.now(), self.nav_publish_time).isoformat()
+        return row[0] >= trading_date, bool(row[1])
+
+    def last_date(self, fund_code: str) -> Optional[str]:
+        """本地库中该基金最新的净值日期"""
+        with self._lock:
+            row = self._db.execute("SELECT MAX(date) FROM nav WHERE fund_code = ?", (fund_code,)).fetchone()
+        return row[0] if row else None
+
+    def first_date(self, fund_code: str) -> Optional[str]:
+        """本地库中该基金最早的净值日期"""
+        with self._lock:
+            row = self._db.execute("SELECT MIN(date) FROM nav WHERE fund_code = ?", (fund_code,)).fetchone()
+        return row[0] if row else None
+
+    def has_acc_nav(self, fund_code: str, start: Optional[str] = None, end: Optional[str] = None) -> bool:
+        """范围内的每条净值是否都有累计净值"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*), COUNT(acc_nav) FROM nav WHERE fund_code = ? AND date >= ? AND date <= ?",
+                (fund_code, start or "0000-00-00", end or "9999-99-99"),
+            ).fetchone()
+        return row[0] > 0 and row[0] == row[1]
+
+    def _select(self, fund_code: str, start: Optional[str], end: Optional[str], limit: Optional[int] = None):
+        sql = "SELECT date, nav, acc_nav, raw FROM nav WHERE fund_code = ? AND date >= ? AND date <= ?"
+        params = [fund_code, start or "0000-00-00", end or "9999-99-99"]
+        with self._lock:
+            if limit:
+                # 最近的N条，再按日期升序返回
+                rows = self._db.execute(sql + " ORDER BY date DESC LIMIT ?", params + [limit]).fetchall()
+                return rows[::-1]
+            return self._db.execute(sql + " ORDER BY date", params).fetchall()
+
+    def query(
+        self,
+        fund_code: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        按日期范围查询净值序列（日期升序）
+
+        Args:
+            fund_code: 基金代码
+            start: 起始日期（含），ISO格式
+            end: 结束日期（含），ISO格式
+            limit: 只返回范围内最近的N条
+
+        Returns:
+            tuple: (日期 datetime64[D] 数组, 单位净值 float64 数组, 累计净值 float64 数组，缺失为NaN)
+        """
+        rows = self._select(fund_code, start, end, limit)
+        dates = np.array([row[0] for row in rows], dtype="datetime64[D]")
+        nav = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        acc_nav = np.fromiter((np.nan if row[2] is None else row[2] for row in rows), dtype=np.float64, count=len(rows))
+        return dates, nav, acc_nav
+
+    def query_matrix(
+        self,
+        fund_codes: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        field: Union[str, List[str]] = "nav",
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        查询多只基金的净值并按日期对齐
+
+        Args:
+            field: "nav"（单位净值）或 "acc_nav"（累计净值），也可以是与基金一一对应的字段列表
+
+        Returns:
+            tuple: (日期数组, 形状为 (日期数, 基金数) 的净值矩阵)，某只基金缺少的日期为NaN
+        """
+        series = [self.query(code, start, end) for code in fund_codes]
+        dates = np.unique(np.concatenate([s[0] for s in series])) if series else np.array([], dtype="datetime64[D]")
+        matrix = np.full((len(dates), len(fund_codes)), np.nan)
+        fields = [field] * len(fund_codes) if isinstance(field, str) else field
+        for column, (fund_dates, nav, acc_nav) in enumerate(series):
+            values = acc_nav if fields[column] == "acc_nav" else nav
+            matrix[np.searchsorted(dates, fund_dates), column] = values
+        return dates, matrix
+
+    def ingest(self, tool_name: str, kwargs: Dict[str, Any], response: ToolResponse) -> int:
+        """
+        从工具结果中提取净值写入本地库，返回写入行数
+
+        查询截止日期早于当前交易日的结果不标记为已同步；只有不带范围、分页参数且结果表明已包含全部数据时，
+        才记为同步过完整历史
+        """
+        for block in response.content or []:
+            if block.get("type") != "text":
+                continue
+            try:
+                data = json.loads(block.get("text", ""))
+            except (TypeError, ValueError):
+                continue
+            nav_list = find_nav_list(data)
+            rows = _nav_rows(nav_list) if nav_list is not None else []
+            if not rows:
+                continue
+            _, fund_code = _first(kwargs, CODE_ARGS)
+            if fund_code is None and isinstance(data, dict):
+                _, fund_code = _first(data, CODE_ARGS)
+            if fund_code is None:
+                return 0
+            fund_code = str(fund_code)
+            written = self.upsert(fund_code, rows)
+            self.save_shape(tool_name, fund_code, data, nav_list)
+            _, days = _first(kwargs, DAYS_ARGS)
+            if days is not None and not is_complete(data, nav_list):
+                try:
+                    unit = days_unit(int(days), [datetime.date.fromisoformat(row[0]) for row in rows])
+                except (TypeError, ValueError):
+                    unit = None
+                if unit is not None:
+                    self.save_days_unit(tool_name, unit)
+
+            _, end = _first(kwargs, END_ARGS)
+            end_date = parse_date(str(end)) if end is not None else None
+            trading_date = current_trading_date(datetime.datetime.now(), self.nav_publish_time)
+            if end is not None and (end_date is None or end_date < trading_date):
+                return written
+            ranged = any(_first(kwargs, names)[0] for names in (COUNT_ARGS, DAYS_ARGS, START_ARGS, END_ARGS)) or any(
+                name not in MODELED_ARGS for name, value in kwargs.items() if value not in (None, "")
+            )
+            self.mark_synced(fund_code, full_history=not ranged and is_complete(data, nav_list))
+            return written
+        return 0
+
+    def answer(self, tool_name: str, kwargs: Dict[str, Any]) -> Optional[ToolResponse]:
+        """
+        由本地库回答净值查询：基金已同步到当前交易日、本地数据覆盖请求的范围、且保存过该工具的结果结构时，
+        按上游结果的结构返回，否则返回None（转发给MCP服务）
+        """
+        if not self.serve_local:
+            return None
+        if any(name not in MODELED_ARGS for name, value in kwargs.items() if value not in (None, "")):
+            return None
+        _, fund_code = _first(kwargs, CODE_ARGS)
+        if fund_code is None:
+            return None
+        fund_code = str(fund_code)
+        fresh, full_history = self.is_fresh(fund_code)
+        if not fresh:
+            return None
+        shape = self._shape(tool_name, fund_code)
+        if shape is None:
+            return None
+
+        _, count = _first(kwargs, COUNT_ARGS)
+        _, days = _first(kwargs, DAYS_ARGS)
+        _, start = _first(kwargs, START_ARGS)
+        _, end = _first(kwargs, END_ARGS)
+        start_date = parse_date(str(start)) if start is not None else None
+        end_date = parse_date(str(end)) if end is not None else None
+        if (start is not None and start_date is None) or (end is not None and end_date is None):
+            return None
+        if days is not None:
+            try:
+                days = int(days)
+            except (TypeError, ValueError):
+                return None
+            unit = self.days_unit(tool_name)
+            if unit is None or count is not None:
+                return None
+            if unit == DAYS_AS_ROWS:
+                count = days
+            else:
+                # 自然日窗口：截止日期（默认当前交易日）之前N天
+                reference = end_date or current_trading_date(datetime.datetime.now(), self.nav_publish_time)
+                window_start = reference - datetime.timedelta(days=days)
+                start_date = max(start_date, window_start) if start_date else window_start
+        start = start_date.isoformat() if start_date else None
+        end = end_date.isoformat() if end_date else None
+
+        if count is not None:
+            try:
+                count = int(count)
+            except (TypeError, ValueError):
+                return None
+            rows = self._select(fund_code, start, end, count)
+            if len(rows) < count and not full_history:
+                return None
+        elif start is not None:
+            first = self.first_date(fund_code)
+            if not full_history and (first is None or first > start):
+                return None
+            rows = self._select(fund_code, start, end)
+        elif full_history:
+            rows = self._select(fund_code, None, end)
+        else:
+            return None
+
+        self.local_hits += 1
+        return ToolResponse(
+            content=[{"type": "text", "text": json.dumps(self._render(shape, rows), ensure_ascii=False)}],
+            metadata={"source": "local_nav_store"},
+        )
+
+    @staticmethod
+    def _render(shape: Dict[str, Any], rows) -> Any:
+        """按保存的结果结构组装本地回答：原始行放回净值列表的位置，分页字段改为只有这一页"""
+        items = []
+        for date, nav, acc_nav, raw in rows:
+            if raw:
+                item = json.loads(raw)
+            else:
+                item = {shape["date_field"]: date, shape["nav_field"]: nav}
+                if shape["acc_field"] and acc_nav is not None:
+                    item[shape["acc_field"]] = acc_nav
+            items.append(item)
+        if shape["descending"]:
+            items.reverse()
+        if not shape["path"]:
+            return items
+
+        envelope = shape["envelope"]
+        container = envelope
+        for key in shape["path"][:-1]:
+            container = container[key]
+        container[shape["path"][-1]] = items
+        for mapping in (container, envelope):
+            if not isinstance(mapping, dict):
+                continue
+            for name in TOTAL_FIELDS:
+                if name in mapping:
+                    mapping[name] = len(items)
+            for name in HAS_MORE_FIELDS:
+                if name in mapping:
+                    mapping[name] = False
+            for name in PAGES_FIELDS + PAGE_FIELDS:
+                if name in mapping:
+                    mapping[name] = 1
+        return envelope
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        with self._lock:
+            funds, rows = self._db.execute("SELECT COUNT(DISTINCT fund_code), COUNT(*) FROM nav").fetchone()
+        return {
+            "funds": funds,
+            "rows": rows,
+            "local_hits": self.local_hits,
+            "upstream_fetches": self.upstream_fetches,
+            "rows_written": self.rows_written,
+        }
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._db.close()
+
+
+def install_nav_store(toolkit, store: Optional[NavStore]) -> None:
+    """为净值类MCP工具套上本地净值库层：能由本地库回答时不请求MCP，否则请求后写入本地库"""
+    if store is None:
+        return
+    for name, tool in toolkit.tools.items():
+        layers = getattr(tool.original_func, "__tool_layers__", set())
+        if tool.mcp_name is None or "nav_store" in layers or not store.handles(name):
+            continue
+        tool.original_func = _wrap(store, name, tool.original_func)
+
+
+def _wrap(store, tool_name, func):
+    async def call_tool(**kwargs):
+        local = await asyncio.to_thread(store.answer, tool_name, kwargs)
+        if local is not None:
+            return local
+        response = await func(**kwargs)
+        store.upstream_fetches += 1
+        try:
+            await asyncio.to_thread(store.ingest, tool_name, kwargs, response)
+        except sqlite3.Error as e:
+            logger.warning(f"写入本地净值库失败 {tool_name}: {str(e)}")
+        return response
+
+    call_tool.__tool_layers__ = getattr(func, "__tool_layers__", set()) | {"nav_store"}
+    return call_tool
+
+
+# 进程内共享的净值库，按 事件循环 + 配置 区分
+_stores = LoopLocal()
+
+
+def get_nav_store(config) -> Optional[NavStore]:
+    """获取当前事件循环中共享的本地净值库"""
+    key = json.dumps((config or {}).get("nav_store", {}), sort_keys=True)
+    return _stores.get(key, lambda: NavStore.from_config(config))
+
+
+def close_nav_stores() -> None:
+    """关闭当前事件循环中的本地净值库"""
+    for store in _stores.pop_all():
+        if store is not None:
+            store.close()
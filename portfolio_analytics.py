@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+基金组合分析
+基于本地净值库的NumPy向量化计算：一次计算N只基金（及加权组合）的累计收益、年化收益、年化波动率、
+最大回撤、夏普比率和收益率相关系数矩阵，作为本地工具注册到 Toolkit，避免模型根据粘贴的数字自行推算
+- 使用累计净值计算（包含分红），本地缺少累计净值的基金改用单位净值，并在结果中注明
+- 本地净值没有覆盖分析区间的基金不计算，提示先获取更早的净值
+"""
+
+import asyncio
+import json
+import logging
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from agentscope.tool import ToolResponse
+
+from nav_store import NavStore
+
+logger = logging.getLogger(__name__)
+
+# 注册到工具集时使用的工具名
+TOOL_NAME = "AnalyzeFundPortfolio"
+
+# 本地净值的首尾日期与分析区间相差不超过该天数时视为覆盖（节假日没有净值）
+COVERAGE_TOLERANCE_DAYS = 10
+
+
+def forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """按列向前填充NaN（停牌、节假日等缺失的净值沿用上一个值），开头的NaN保持不变"""
+    rows = np.arange(matrix.shape[0])[:, None]
+    index = np.where(np.isnan(matrix), 0, rows)
+    np.maximum.accumulate(index, axis=0, out=index)
+    return matrix[index, np.arange(matrix.shape[1])]
+
+
+def compute_metrics(
+    dates: np.ndarray,
+    navs: np.ndarray,
+    risk_free_rate: float = 0.02,
+) -> Dict[str, Any]:
+    """
+    向量化计算多只基金的收益风险指标
+
+    Args:
+        dates: 日期数组（datetime64[D]，升序）
+        navs: 形状为 (日期数, 基金数) 的净值矩阵，缺失为NaN
+        risk_free_rate: 年化无风险利率，用于计算夏普比率
+
+    Returns:
+        dict: {"start", "end", "cumulative_return", "annualized_return", "volatility",
+               "max_drawdown", "sharpe", "correlation"}，各指标为长度等于基金数的数组
+    """
+    navs = forward_fill(navs)
+    # 从所有基金都有净值的日期开始比较
+    valid = ~np.isnan(navs).any(axis=1)
+    if valid.sum() < 2:
+        raise ValueError("共同的净值数据不足两天，无法计算")
+    start = int(np.argmax(valid))
+    dates, navs = dates[start:], navs[start:]
+
+    returns = navs[1:] / navs[:-1] - 1
+    years = (dates[-1] - dates[0]).astype(int) / 365.25
+    periods_per_year = len(returns) / years if years > 0 else 252
+
+    cumulative = navs[-1] / navs[0] - 1
+    annualized = (1 + cumulative) ** (1 / years) - 1 if years > 0 else cumulative
+    volatility = returns.std(axis=0, ddof=1) * np.sqrt(periods_per_year) if len(returns) > 1 else np.zeros(navs.shape[1])
+    drawdown = navs / np.maximum.accumulate(navs, axis=0) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(volatility > 0, (annualized - risk_free_rate) / volatility, np.nan)
+        correlation = np.corrcoef(returns, rowvar=False) if navs.shape[1] > 1 else np.ones((1, 1))
+
+    return {
+        "start": str(dates[0]),
+        "end": str(dates[-1]),
+        "cumulative_return": cumulative,
+        "annualized_return": annualized,
+        "volatility": volatility,
+        "max_drawdown": drawdown.min(axis=0),
+        "sharpe": sharpe,
+        "correlation": np.atleast_2d(correlation),
+    }
+
+
+def portfolio_nav(navs: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """按期初权重买入并持有的组合净值（期初为1）"""
+    navs = forward_fill(navs)
+    start = int(np.argmax(~np.isnan(navs).any(axis=1)))
+    normalized = navs / navs[start]
+    nav = normalized @ (weights / weights.sum())
+    nav[:start] = np.nan
+    return nav
+
+
+def _round(values, decimals=4):
+    return [None if np.isnan(v) else round(float(v), decimals) for v in np.ravel(values)]
+
+
+class PortfolioAnalytics:
+    """从本地净值库读取净值并计算组合指标"""
+
+    def __init__(self, store: NavStore, risk_free_rate=0.02, default_days=365):
+        """
+        Args:
+            store: 本地净值库
+            risk_free_rate: 年化无风险利率
+            default_days: 未指定区间时分析最近多少天
+        """
+        self.store = store
+        self.risk_free_rate = risk_free_rate
+        self.default_days = default_days
+
+    @classmethod
+    def from_config(cls, config, store: Optional[NavStore]) -> Optional["PortfolioAnalytics"]:
+        """根据 config["analytics"] 创建，未启用或没有本地净值库时返回None"""
+        analytics_config = (config or {}).get("analytics", {})
+        if store is None or not analytics_config.get("enabled", True):
+            return None
+        return cls(
+            store,
+            risk_free_rate=analytics_config.get("risk_free_rate", 0.02),
+            default_days=analytics_config.get("default_days", 365),
+        )
+
+    def analyze(self, fund_codes: List[str], weights: Optional[List[float]] = None, days: Optional[int] = None) -> Dict[str, Any]:
+        """
+        计算基金及组合的收益风险指标
+
+        Returns:
+            dict: 计算结果；本地没有净值的基金返回 {"missing": [基金代码]}，
+                  本地净值没有覆盖分析区间的基金返回 {"uncovered": [{"fundCode", "first_date", "last_date"}], "start", "end"}
+
+        Raises:
+            ValueError: 参数错误或净值数据不足
+        """
+        fund_codes = [str(code).strip() for code in fund_codes if str(code).strip()]
+        if not fund_codes:
+            raise ValueError("至少需要一个基金代码")
+        if weights is not None and len(weights) != len(fund_codes):
+            raise ValueError("权重数量与基金数量不一致")
+
+        days = days or self.default_days
+        missing = [code for code in fund_codes if self.store.last_date(code) is None]
+        if missing:
+            return {"missing": missing}
+
+        end = max(self.store.last_date(code) for code in fund_codes)
+        start = str(np.datetime64(end) - np.timedelta64(days, "D"))
+        tolerance = np.timedelta64(COVERAGE_TOLERANCE_DAYS, "D")
+        uncovered = []
+        for code in fund_codes:
+            first_date, last_date = self.store.first_date(code), self.store.last_date(code)
+            # 同步过完整历史的基金，首个净值晚于区间起点是因为成立时间较晚，不算缺失
+            late_start = np.datetime64(first_date) - np.datetime64(start) > tolerance and not self.store.is_fresh(code)[1]
+            if late_start or np.datetime64(end) - np.datetime64(last_date) > tolerance:
+                uncovered.append({"fundCode": code, "first_date": first_date, "last_date": last_date})
+        if uncovered:
+            return {"uncovered": uncovered, "start": start, "end": end}
+
+        fields, notes = [], []
+        for code in fund_codes:
+            if self.store.has_acc_nav(code, start, end):
+                fields.append("acc_nav")
+            else:
+                fields.append("nav")
+                note = f"基金 {code} 本地缺少累计净值，改用单位净值计算，未计入分红"
+                logger.info(note)
+                notes.append(note)
+        dates, navs = self.store.query_matrix(fund_codes, start=start, end=end, field=fields)
+
+        labels = list(fund_codes)
+        if weights is not None:
+            weight_array = np.asarray(weights, dtype=np.float64)
+            if weight_array.sum() <= 0:
+                raise ValueError("权重之和必须大于0")
+            navs = np.column_stack([navs, portfolio_nav(navs, weight_array)])
+            labels.append("组合")
+
+        result = compute_metrics(dates, navs, self.risk_free_rate)
+        analysis = {
+            "start": result["start"],
+            "end": result["end"],
+            "funds": [
+                {
+                    "fundCode": label,
+                    "cumulative_return": cumulative,
+                    "annualized_return": annualized,
+                    "volatility": volatility,
+                    "max_drawdown": drawdown,
+                    "sharpe": sharpe,
+                }
+                for label, cumulative, annualized, volatility, drawdown, sharpe in zip(
+                    labels,
+                    _round(result["cumulative_return"]),
+                    _round(result["annualized_return"]),
+                    _round(result["volatility"]),
+                    _round(result["max_drawdown"]),
+                    _round(result["sharpe"], 2),
+                )
+            ],
+            "correlation": {
+                "labels": labels,
+                "matrix": [_round(row, 2) for row in result["correlation"]],
+            },
+        }
+        for fund, field in zip(analysis["funds"], fields):
+            fund["nav_field"] = field
+        if notes:
+            analysis["notes"] = notes
+        return analysis
+
+    def make_tool_function(self):
+        """创建注册到 Toolkit 的工具函数"""
+        analytics = self
+
+        async def analyze_fund_portfolio(
+            fund_codes: List[str],
+            weights: Optional[List[float]] = None,
+            days: Optional[int] = None,
+        ) -> ToolResponse:
+            """本地计算基金或基金组合的累计收益、年化收益、年化波动率、最大回撤、夏普比率和收益率相关系数矩阵。
+            分析持仓、比较多只基金的收益和风险时调用，不要自行推算这些指标。
+            使用本地净值库中的数据，缺少净值的基金需要先调用净值查询工具获取。
+
+            Args:
+                fund_codes (`List[str]`):
+                    基金代码列表，例如 ["005827", "161725"]
+                weights (`Optional[List[float]]`):
+                    各基金的持仓权重或金额，与基金代码一一对应；提供时额外计算组合的指标
+                days (`Optional[int]`):
+                    分析最近多少天，默认365
+            """
+            try:
+                # SQLite查询和矩阵计算放到线程池，不阻塞事件循环
+                result = await asyncio.to_thread(analytics.analyze, fund_codes, weights, days)
+            except ValueError as e:
+                return ToolResponse(content=[{"type": "text", "text": f"Error: {str(e)}"}])
+            if "missing" in result:
+                text = f"本地没有以下基金的净值数据，请先调用净值查询工具获取后再分析：{', '.join(result['missing'])}"
+            elif "uncovered" in result:
+                funds = "；".join(
+                    f"{item['fundCode']}（本地 {item['first_date']} 至 {item['last_date']}）" for item in result["uncovered"]
+                )
+                text = (
+                    f"以下基金的本地净值没有覆盖分析区间 {result['start']} 至 {result['end']}，"
+                    f"请先调用净值查询工具获取该区间的净值后再分析：{funds}"
+                )
+            else:
+                text = json.dumps(result, ensure_ascii=False)
+            return ToolResponse(content=[{"type": "text", "text": text}])
+
+        return analyze_fund_portfolio
+
+
+def register_portfolio_tool(toolkit, analytics: Optional[PortfolioAnalytics]) -> None:
+    """将组合分析工具注册到工具集，已注册时跳过"""
+    if analytics is None or TOOL_NAME in toolkit.tools:
+        return
+    toolkit.register_tool_function(analytics.make_tool_function(), func_name=TOOL_NAME)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+关注基金数据预取
+晚间净值发布后提问最集中，而此时工具结果缓存刚好全部过期。
+在配置的时间点（默认净值发布后）按调用速率预算依次调用关注基金的关键MCP工具，
+结果经由正常的工具调用层写入工具结果缓存和本地净值库；关注列表来自配置，或 results/ 历史记录中出现最多的基金
+"""
+
+import asyncio
+import datetime
+import glob
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+import metrics
+from fund_resolver import get_fund_resolver
+from history_store import HistoryStore
+from qieman_mcp import QiemanFundManager
+from speculative_prefetch import code_tools, fill_args
+from text_patterns import FUND_CODE, QUESTION_SECTION
+from tool_cache import TTL_UNTIL_NAV, get_tool_cache
+
+logger = logging.getLogger(__name__)
+
+
+def next_run_time(now: datetime.datetime, times: List[str]) -> datetime.datetime:
+    """计算下一次预取时间：配置的时间点中最近的一个，周末顺延到下周一"""
+    candidates = []
+    for value in times:
+        hour, minute = (int(x) for x in value.split(":"))
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= now:
+            candidate += datetime.timedelta(days=1)
+        while candidate.weekday() >= 5:
+            candidate += datetime.timedelta(days=1)
+        candidates.append(candidate)
+    return min(candidates)
+
+
+class PrefetchScheduler:
+    """按时间点预取关注基金数据的后台任务"""
+
+    def __init__(
+        self,
+        config,
+        watchlist=None,
+        top_n=10,
+        history_dir="results",
+        history_files=500,
+        tools=None,
+        times=None,
+        rate_per_minute=30,
+        max_calls_per_run=300,
+        run_on_start=False,
+        history_store: Optional[HistoryStore] = None,
+    ):
+        """
+        Args:
+            config: 配置参数，用于创建专用的基金管理助手
+            watchlist: 关注的基金代码或名称，为空时使用历史记录中出现最多的基金
+            top_n: 从历史记录中选取的基金数
+            history_dir: 历史记录目录
+            history_files: 最多读取的最近历史记录文件数
+            tools: 预取的工具 [{"tool": 工具名, "args": {参数名: 值}}]，值中的 {code} 替换为基金代码；
+                为空时预取所有只需基金代码一个参数的工具
+            times: 每个交易日的预取时间点（HH:MM）
+            rate_per_minute: 每分钟最多调用的工具次数
+            max_calls_per_run: 每次预取最多调用的工具次数
+            run_on_start: 服务启动后是否立即预取一次
+            history_store: 问答历史记录索引，为None时扫描历史记录目录
+        """
+        self.config = config
+        self.watchlist = watchlist or []
+        self.top_n = top_n
+        self.history_dir = history_dir
+        self.history_files = history_files
+        self.tools = tools or []
+        self.times = times or ["21:30"]
+        self.rate_per_minute = rate_per_minute
+        self.max_calls_per_run = max_calls_per_run
+        self.run_on_start = run_on_start
+        self.history_store = history_store
+
+        self._manager: Optional[QiemanFundManager] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running_lock = asyncio.Lock()
+
+        self.next_run: Optional[datetime.datetime] = None
+        self.progress: Dict[str, Any] = {}
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_config(cls, config, history_store: Optional[HistoryStore] = None) -> Optional["PrefetchScheduler"]:
+        """根据 config["prefetch"] 创建，未启用时返回None"""
+        prefetch_config = (config or {}).get("prefetch", {})
+        if not prefetch_config.get("enabled", False):
+            return None
+        return cls(
+            config,
+            watchlist=prefetch_config.get("watchlist"),
+            top_n=prefetch_config.get("top_n", 10),
+            history_files=prefetch_config.get("history_files", 500),
+            tools=prefetch_config.get("tools"),
+            times=prefetch_config.get("times"),
+            rate_per_minute=prefetch_config.get("rate_per_minute", 30),
+            max_calls_per_run=prefetch_config.get("max_calls_per_run", 300),
+            run_on_start=prefetch_config.get("run_on_start", False),
+            history_store=history_store,
+        )
+
+    def start(self) -> None:
+        """启动后台预取任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        """停止后台预取任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._manager is not None:
+            await self._manager.close()
+            self._manager = None
+
+    async def _loop(self) -> None:
+        if self.run_on_start:
+            await self._run_safely()
+        while True:
+            self.next_run = next_run_time(datetime.datetime.now(), self.times)
+            await asyncio.sleep(max((self.next_run - datetime.datetime.now()).total_seconds(), 0))
+            await self._run_safely()
+
+    async def _run_safely(self) -> None:
+        try:
+            await self.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"预取关注基金数据失败: {str(e)}")
+
+    def recent_questions(self) -> List[str]:
+        """最近历史记录中的问题，有历史记录索引时从索引读取"""
+        if self.history_store is not None:
+            return self.history_store.recent_questions(self.history_files)
+        files = sorted(glob.glob(os.path.join(self.history_dir, "*.md")), key=os.path.getmtime, reverse=True)
+        questions = []
+        for path in files[:self.history_files]:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    match = QUESTION_SECTION.search(f.read())
+            except OSError:
+                continue
+            if match is not None:
+                questions.append(match.group(1))
+        return questions
+
+    def history_funds(self) -> List[str]:
+        """统计最近历史记录中出现最多的基金代码"""
+        resolver = get_fund_resolver(self.config)
+        counts = Counter()
+        for question in self.recent_questions():
+            codes = set(FUND_CODE.findall(question))
+            if resolver is not None:
+                codes.update(code for _, code in resolver.find_mentions(question))
+            counts.update(codes)
+        return [code for code, _ in counts.most_common(self.top_n)]
+
+    def fund_codes(self) -> List[str]:
+        """本次预取的基金代码：配置的关注列表，或历史记录中出现最多的基金"""
+        if not self.watchlist:
+            return self.history_funds()
+        resolver = get_fund_resolver(self.config)
+        codes = []
+        for item in self.watchlist:
+            code = str(item) if FUND_CODE.fullmatch(str(item)) else (resolver.resolve(str(item)) if resolver else None)
+            if code is None:
+                logger.warning(f"无法识别关注基金: {item}")
+            elif code not in codes:
+                codes.append(code)
+        return codes
+
+    def tool_calls(self, toolkit, codes: List[str]) -> List[Dict[str, Any]]:
+        """展开为具体的工具调用 [{"tool", "args"}]"""
+        # 默认预取所有只需基金代码一个必填参数的MCP工具
+        templates = self.tools or code_tools(toolkit)
+        calls = []
+        for code in codes:
+            for template in templates:
+                if template["tool"] not in toolkit.tools:
+                    continue
+                args = fill_args(template.get("args", {}), code)
+                calls.append({"tool": template["tool"], "code": code, "args": args})
+        return calls[:self.max_calls_per_run]
+
+    async def run(self) -> Dict[str, Any]:
+        """立即执行一次预取，已在执行时等待其完成"""
+        async with self._running_lock:
+            if self._manager is None:
+                self._manager = QiemanFundManager(self.config)
+                await self._manager.initialize_tools()
+            toolkit = self._manager.toolkit
+
+            codes = self.fund_codes()
+            calls = self.tool_calls(toolkit, codes)
+            interval = 60 / self.rate_per_minute if self.rate_per_minute > 0 else 0
+            self.progress = {
+                "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "funds": codes,
+                "total": len(calls),
+                "done": 0,
+                "failed": 0,
+                "current": None,
+            }
+            logger.info(f"开始预取 {len(codes)} 只基金的数据，共 {len(calls)} 次工具调用")
+            cache = get_tool_cache(self.config)
+            expiring = sorted({
+                call["tool"] for call in calls
+                if cache is not None and cache.ttl_for(call["tool"]) != TTL_UNTIL_NAV
+            })
+            if expiring:
+                logger.warning(
+                    f"以下预取工具未在 tool_cache.tool_ttls 中配置为 \"nav\"，结果会在下次净值发布前过期: {', '.join(expiring)}"
+                )
+
+            start = time.perf_counter()
+            for index, call in enumerate(calls):
+                if index and interval:
+                    await asyncio.sleep(interval)
+                self.progress["current"] = f"{call['tool']}({call['code']})"
+                try:
+                    response = await toolkit.tools[call["tool"]].original_func(**call["args"])
+                    failed = any(
+                        str(block.get("text", "")).startswith("Error")
+                        for block in response.content or [] if block.get("type") == "text"
+                    )
+                except Exception as e:
+                    logger.warning(f"预取失败 {call['tool']}({call['args']}): {str(e)}")
+                    failed = True
+                self.progress["done"] += 1
+                if failed:
+                    self.progress["failed"] += 1
+                metrics.PREFETCH_CALLS.inc(status="error" if failed else "ok")
+
+            self.progress["current"] = None
+            self.progress["elapsed_s"] = round(time.perf_counter() - start, 2)
+            self.last_run = self.progress
+            logger.info(
+                f"预取完成：{self.progress['done']} 次调用，失败 {self.progress['failed']} 次，"
+                f"耗时 {self.progress['elapsed_s']}s"
+            )
+            return self.last_run
+
+    def status(self) -> Dict[str, Any]:
+        """预取状态：是否正在执行、当前进度、上次结果和下次执行时间"""
+        running = self._running_lock.locked()
+        return {
+            "running": running,
+            "progress": self.progress if running else None,
+            "last_run": self.last_run,
+            "next_run": self.next_run.strftime("%Y-%m-%d %H:%M:%S") if self.next_run else None,
+            "times": self.times,
+            "rate_per_minute": self.rate_per_minute,
+        }
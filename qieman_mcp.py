@@ -6,17 +6,51 @@
 
 import asyncio
 import json
-from typing import Dict, Any
-
+import logging
+import time
+from typing import Dict, Any, List, Optional
 
+import mcp.types
 from agentscope.agent import ReActAgent
 from agentscope.formatter import OpenAIChatFormatter
-from agentscope.mcp import HttpStatelessClient
-from agentscope.memory import InMemoryMemory
+from agentscope.mcp import HttpStatelessClient, MCPToolFunction
 from agentscope.message import Msg
-from agentscope.model import OpenAIChatModel
 from agentscope.tool import Toolkit
 
+import agent_events
+import metrics
+from complexity_router import CLASSES, MeteredChatModel, get_complexity_router
+from fan_out import get_fan_out_planner
+from fund_resolver import get_fund_resolver, install_fund_resolver
+from hedged_model import create_chat_model
+from mcp_schema_cache import get_schema_cache
+from mcp_session_pool import PooledMcpToolFunction, get_session_pool
+from nav_store import get_nav_store, install_nav_store
+from portfolio_analytics import PortfolioAnalytics, register_portfolio_tool
+from speculative_prefetch import get_speculative_prefetcher
+from token_budget_memory import TokenBudgetMemory
+from tool_cache import get_tool_cache, get_single_flight, install_tool_cache
+from tool_compaction import get_tool_compactor, install_tool_compaction
+from tool_router import RoutedToolkit, ToolRouter
+
+logger = logging.getLogger(__name__)
+
+# main() 处理失败时返回的错误信息前缀
+ERROR_PREFIX = "处理过程中发生错误"
+
+# 基金管理助手的系统提示词，问题类别可配置替换（见 complexity_router），工具列表附加在后面
+SYS_PROMPT = (
+    "你是一位专业的基金管理顾问，擅长基金分析、投资组合管理和投资建议。\n"
+    "你的任务是：\n"
+    "1. 帮助用户查询基金信息、净值、涨跌幅等数据；\n"
+    "2. 分析用户的基金持仓情况，提供投资建议；\n"
+    "3. 根据市场情况，推荐合适的基金产品；\n"
+    "4. 提供基金投资策略和风险管理建议；\n"
+    "5. 你**必须先调用工具获取最新数据**，再进行分析和建议。\n"
+    "6. 计算收益率、回撤、波动率、夏普比率、相关性等指标时，调用本地组合分析工具，不要自行推算；\n"
+    "7. 输出要求：Markdown格式。"
+)
+
 
 def load_config():
     """加载配置文件 config.json"""
@@ -44,13 +78,46 @@ class QiemanFundManager:
             transport="sse",
             url=self.config["mcp"]["url"],
         )
+        # pooled 模式下工具调用走进程内共享的长连接会话池，在 initialize_tools 中获取
+        self.session_pool = None
 
-        self.toolkit = Toolkit()
+        self.toolkit = RoutedToolkit()
+        self.tool_router = None
+        self.complexity_router = None
+        # 问题类别 -> 模型
+        self.models = {}
         self.agent = None
+        self.tools_hash = None
+        # 后台校验得到的新工具列表 (schemas, hash)，等没有问题在处理时再替换
+        self._pending_tools = None
+        self._running = False
 
     async def initialize_tools(self) -> None:
-        """初始化基金管理MCP工具"""
-        await self.toolkit.register_mcp_client(self.mcp_client)
+        """初始化基金管理MCP工具，优先使用本地缓存的工具Schema"""
+        url = self.config["mcp"]["url"]
+        self.session_pool = get_session_pool(self.config)
+        schema_cache = get_schema_cache(self.config)
+        cached = schema_cache.load(url) if schema_cache else None
+
+        if cached is None:
+            if self.session_pool is None:
+                await self.toolkit.register_mcp_client(self.mcp_client)
+            else:
+                for tool in await self.session_pool.list_tools():
+                    self.toolkit.register_tool_function(self._make_tool_function(tool))
+            if schema_cache:
+                self.tools_hash = schema_cache.save(url, self.toolkit.get_json_schemas())
+            self._install_tool_wrappers()
+            return
+
+        self._register_tool_schemas(cached["schemas"])
+        self.tools_hash = cached["hash"]
+        self._install_tool_wrappers()
+
+        # 缓存已过期：先使用旧数据，在后台重新拉取工具列表
+        if cached["stale"]:
+            task = schema_cache.revalidate(url, self._fetch_tool_schemas)
+            task.add_done_callback(self._on_tools_revalidated)
         #tools = self.toolkit.get_json_schemas()
         # print(f"已注册 {len(tools)} 个基金管理MCP工具")
         # for tool in tools:
@@ -58,58 +125,324 @@ class QiemanFundManager:
         #     desc = tool["function"].get("description", "")
         #     print(f"- {name}: {desc}")
 
+    def _register_tool_schemas(self, schemas: List[Dict[str, Any]]) -> None:
+        """根据缓存的工具Schema注册MCP工具，无需连接MCP服务"""
+        for schema in schemas:
+            function = schema["function"]
+            tool = mcp.types.Tool(
+                name=function["name"],
+                description=function.get("description", ""),
+                inputSchema=function.get("parameters", {"type": "object", "properties": {}}),
+            )
+            self.toolkit.register_tool_function(self._make_tool_function(tool))
+
+    def _make_tool_function(self, tool: mcp.types.Tool) -> MCPToolFunction:
+        """创建MCP工具函数：stateless 模式每次调用新建连接，pooled 模式复用会话池中的长连接"""
+        if self.session_pool is not None:
+            return PooledMcpToolFunction(mcp_name=self.mcp_client.name, tool=tool, pool=self.session_pool)
+        return MCPToolFunction(
+            mcp_name=self.mcp_client.name,
+            tool=tool,
+            wrap_tool_result=True,
+            client_gen=self.mcp_client.get_client,
+        )
+
+    async def _fetch_tool_schemas(self) -> List[Dict[str, Any]]:
+        """从MCP服务拉取最新的工具Schema"""
+        toolkit = Toolkit()
+        if self.session_pool is None:
+            await toolkit.register_mcp_client(self.mcp_client)
+        else:
+            for tool in await self.session_pool.list_tools():
+                toolkit.register_tool_function(self._make_tool_function(tool))
+        return toolkit.get_json_schemas()
+
+    async def check_mcp(self) -> None:
+        """检查MCP服务是否可用，不可用时抛出异常"""
+        if self.session_pool is not None:
+            await self.session_pool.list_tools()
+        else:
+            await self.mcp_client.list_tools()
+
+    def _on_tools_revalidated(self, task) -> None:
+        """
+        后台校验完成：工具发生变化时记录新的工具列表
+        校验可能在问题处理中完成，此时模型正按当前工具集和路由调用工具，替换推迟到问题结束后
+        （下次 initialize_agent / reset_memory）
+        """
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"后台刷新MCP工具列表失败，继续使用缓存: {task.exception()}")
+            return
+
+        schemas, digest = task.result()
+        if digest == self.tools_hash:
+            return
+        self._pending_tools = (schemas, digest)
+        if not self._running:
+            self._apply_pending_tools()
+
+    def _apply_pending_tools(self) -> None:
+        """重新注册后台校验得到的工具，并在下个问题时重建agent"""
+        if self._pending_tools is None or self._running:
+            return
+        schemas, digest = self._pending_tools
+        self._pending_tools = None
+        for name, tool in list(self.toolkit.tools.items()):
+            if tool.mcp_name == self.mcp_client.name:
+                self.toolkit.remove_tool_function(name)
+        self._register_tool_schemas(schemas)
+        self._install_tool_wrappers()
+        self.tools_hash = digest
+        self.agent = None
+        logger.info("MCP工具列表已变化，已重新注册工具")
+
+    def _install_tool_wrappers(self) -> None:
+        """
+        为MCP工具安装本地净值库、基金名称收集、结果缓存、并发合并、事件、结果精简等调用层（后安装的在外层），并重建工具路由索引
+        缓存和事件层处理的是原始结果，精简只影响返回给模型的内容
+        """
+        install_nav_store(self.toolkit, get_nav_store(self.config))
+        install_fund_resolver(self.toolkit, get_fund_resolver(self.config))
+        install_tool_cache(self.toolkit, get_tool_cache(self.config), get_single_flight(self.config))
+        agent_events.install_tool_events(self.toolkit)
+        install_tool_compaction(self.toolkit, get_tool_compactor(self.config))
+        self._register_local_tools()
+        self.tool_router = ToolRouter.from_config(self.config, self.toolkit.full_json_schemas())
+
+    def _register_local_tools(self) -> None:
+        """注册本地计算工具（组合分析），与MCP工具一起提供给模型"""
+        analytics = PortfolioAnalytics.from_config(self.config, get_nav_store(self.config))
+        register_portfolio_tool(self.toolkit, analytics)
+
     async def initialize_agent(self) -> None:
         """初始化基金管理Agent"""
         if not self.toolkit.get_json_schemas():
             await self.initialize_tools()
+        self._apply_pending_tools()
 
         # 如果agent已存在，不需要重新创建
         if self.agent is not None:
             return
         
-        model_config = self.config["model"]
-
         self.agent = ReActAgent(
             name="FundManager",
-            sys_prompt=(
-                "你是一位专业的基金管理顾问，擅长基金分析、投资组合管理和投资建议。\n"
-                "你的任务是：\n"
-                "1. 帮助用户查询基金信息、净值、涨跌幅等数据；\n"
-                "2. 分析用户的基金持仓情况，提供投资建议；\n"
-                "3. 根据市场情况，推荐合适的基金产品；\n"
-                "4. 提供基金投资策略和风险管理建议；\n"
-                "5. 你**必须先调用工具获取最新数据**，再进行分析和建议。\n"
-                "6. 输出要求：Markdown格式。\n"
-                "可用工具：\n"
-                "\n".join([f"- {tool['function']['name']}: {tool['function'].get('description', '')}"
-                           for tool in self.toolkit.get_json_schemas()])
-            ),
-            model=OpenAIChatModel(
-                model_name=model_config["model_name"],
-                api_key=model_config["api_key"],
-                client_args={"base_url": model_config["base_url"]},
-            ),
-            memory=InMemoryMemory(),
+            sys_prompt=self._sys_prompt(SYS_PROMPT),
+            model=self._create_models(),
+            memory=TokenBudgetMemory.from_config(self.config),
             formatter=OpenAIChatFormatter(),
             toolkit=self.toolkit,
             parallel_tool_calls=True,
         )
+        self.agent.register_instance_hook("pre_reasoning", "agent_events", agent_events.pre_reasoning_hook)
+        self.agent.register_instance_hook("post_reasoning", "agent_events", agent_events.post_reasoning_hook)
+        self.agent.register_instance_hook("pre_reasoning", "tool_router", self.toolkit.pre_reasoning_hook)
+
+    def _sys_prompt(self, instructions: str) -> str:
+        """系统提示词：说明 + 可用工具列表"""
+        return (
+            f"{instructions}\n"
+            "可用工具（每轮只提供与问题相关工具的参数说明，需要其他工具时可直接按名称调用）：\n"
+            + "、".join(tool["function"]["name"] for tool in self.toolkit.full_json_schemas())
+        )
+
+    def _create_models(self):
+        """创建各类别问题使用的模型（类别配置相同的模型共用一个实例），返回默认模型"""
+        model_config = self.config["model"]
+        hedging_config = self.config.get("model_hedging")
+        self.complexity_router = get_complexity_router(self.config)
+        if self.complexity_router is None:
+            return create_chat_model(model_config, hedging_config)
+        created = {}
+        for query_class in CLASSES:
+            class_model_config = self.complexity_router.model_config(query_class, model_config)
+            key = json.dumps(class_model_config, sort_keys=True)
+            if key not in created:
+                created[key] = MeteredChatModel(create_chat_model(class_model_config, hedging_config))
+            self.models[query_class] = created[key]
+        return self.models[self.complexity_router.default_class]
 
     async def process_user_query(
         self,
         user_question: str,
+        on_delta=None,
+        on_event=None,
+        query_class: Optional[str] = None,
+        max_iters: Optional[int] = None,
+        subtask: bool = False,
+        memory: Optional[TokenBudgetMemory] = None,
     ) -> Dict[str, Any]:
-        """处理用户关于基金的任何问题"""
-        if self.agent is None:
+        """
+        处理用户关于基金的任何问题
+
+        Args:
+            user_question: 用户问题
+            on_delta: 流式输出回调 on_delta(msg_id, text, reset)，模型每输出一段文本调用一次
+            on_event: ReAct过程事件回调 on_event(AgentEvent)
+            query_class: 指定问题类别（决定模型），为None时按问题复杂度判断
+            max_iters: 指定最大推理轮数，为None时使用问题类别的配置
+            subtask: 作为多基金问题的子任务运行：不再拆分，耗时和轮数计入子任务指标而不是用户问题指标
+            memory: 对话记忆（如Web连接的多轮对话），本次问题使用它代替助手自身的记忆；
+                问题被取消或失败时撤回本次问题加入的消息
+        """
+        if self.agent is None or self._pending_tools is not None:
             await self.initialize_agent()
-            
-        res = await self.agent(
-            Msg("user", user_question, "user"),
-        )
 
-        return {"status": "completed", "response": res.content}
+        # 本次问题只使用开始时的agent；后台工具校验推迟到问题结束后才替换工具和agent
+        agent = self.agent
+        self._running = True
+        original_question = user_question
+        # 按问题类别或参数调整的最大推理轮数只对本次问题生效，结束后还原
+        default_max_iters = agent.max_iters
+        own_memory = agent.memory
+        history_size = len(memory.content) if memory is not None else 0
+        routed_class = model = speculation = stream = None
+        tokens_before = (0, 0)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            if memory is not None:
+                agent.memory = memory
+            if on_delta is not None:
+                agent.register_instance_hook("pre_print", "stream_delta", self._make_delta_hook(on_delta))
+            # 发送给模型的问题另外附加需要核实的候选基金；路由、拆分只使用确定识别的基金代码
+            prompt = user_question
+            resolver = get_fund_resolver(self.config)
+            if resolver is not None:
+                resolver.refresh_in_background(self.toolkit)
+                user_question, prompt = resolver.annotate(user_question)
+            self._route_tools(user_question)
+            routed_class = self._route_model(agent, original_question, user_question, query_class)
+            if max_iters is not None:
+                agent.max_iters = max_iters
+            model = agent.model
+            tokens_before = (getattr(model, "input_tokens", 0), getattr(model, "output_tokens", 0))
+            planner = get_fan_out_planner(self.config) if not subtask else None
+            funds = planner.plan(user_question) if planner is not None else None
+            # 拆分的问题由子任务查询各基金数据，不再推测预取
+            speculation = self._speculate(user_question) if funds is None else None
+            with agent_events.stream_events(on_event if speculation is None else speculation.observe(on_event)) as stream:
+                if funds is not None:
+                    results = await planner.run(original_question, funds, stream.emit)
+                    prompt = planner.synthesis_question(prompt, results)
+                res = await agent(
+                    Msg("user", prompt, "user"),
+                )
+            # agentscope 把取消当作用户中断，返回提示消息而不抛出异常；这里还原为取消，交给调用方处理
+            if (res.metadata or {}).get("_is_interrupted"):
+                status = "cancelled"
+                raise asyncio.CancelledError()
+            status = "completed"
+        finally:
+            self._running = False
+            if on_delta is not None:
+                try:
+                    agent.remove_instance_hook("pre_print", "stream_delta")
+                except ValueError:
+                    pass
+            self.toolkit.set_route(None)
+            agent.max_iters = default_max_iters
+            if memory is not None:
+                agent.memory = own_memory
+                if status != "completed":
+                    memory.truncate(history_size)
+            if speculation is not None:
+                speculation.finish()
+            duration = time.perf_counter() - start
+            rounds = stream.round if stream is not None else 0
+            if subtask:
+                metrics.FAN_OUT_SUBTASK_DURATION.observe(duration, status=status)
+                metrics.FAN_OUT_SUBTASK_ROUNDS.observe(rounds)
+            else:
+                metrics.QUERY_DURATION.observe(duration, status=status)
+                metrics.QUERY_ROUNDS.observe(rounds)
+            if routed_class is not None:
+                self.complexity_router.record(
+                    routed_class, duration, status, rounds,
+                    getattr(model, "input_tokens", 0) - tokens_before[0],
+                    getattr(model, "output_tokens", 0) - tokens_before[1],
+                )
+
+        response = res.get_text_content() or ""
+        if not subtask:
+            metrics.ANSWER_BYTES.observe(len(response.encode("utf-8")))
+        return {"status": "completed", "response": response}
+
+    def _route_tools(self, user_question: str) -> None:
+        """按问题挑选提供给模型的工具子集"""
+        if self.tool_router is None:
+            return
+        tools = self.tool_router.route(user_question)
+        total = len(self.tool_router.tool_names)
+        metrics.TOOL_ROUTER_SELECTED.observe(total if tools is None else len(tools))
+        if tools is None:
+            return
+        saving = self.tool_router.full_tokens - self.tool_router.routed_tokens(tools)
+        self.toolkit.set_route(tools, saving)
+        logger.info(f"工具路由：提供 {len(tools)}/{total} 个工具，每轮推理少发送约 {saving} tokens")
+
+    def _speculate(self, user_question: str):
+        """与第一轮模型请求同时，预取问题中基金的模型大概率会调用的工具"""
+        prefetcher = get_speculative_prefetcher(self.config)
+        if prefetcher is None:
+            return None
+        return prefetcher.start(self.toolkit, user_question)
+
+    def _route_model(self, agent, question: str, annotated: str, query_class: Optional[str] = None):
+        """按问题复杂度（或指定的类别）选择agent的模型和最大推理轮数，返回问题类别（未启用时为None）"""
+        if self.complexity_router is None:
+            return None
+        query_class = query_class or self.complexity_router.classify(question, annotated)
+        agent.model = self.models[query_class]
+        agent.max_iters = self.complexity_router.max_iters(query_class)
+        # agent 的提示词只在构造时传入，按类别替换（每个问题都重新设置，无需还原）
+        agent._sys_prompt = self._sys_prompt(self.complexity_router.sys_prompt(query_class) or SYS_PROMPT)
+        logger.info(f"问题分类：{query_class}，使用模型 {agent.model.model_name}，最多 {agent.max_iters} 轮推理")
+        return query_class
+
+    @staticmethod
+    def _make_delta_hook(on_delta):
+        """创建 pre_print 钩子：将模型流式输出的累计文本转换为增量片段"""
+        streamed: Dict[str, str] = {}
+
+        async def stream_delta(agent, kwargs):
+            msg = kwargs["msg"]
+            if msg.role != "assistant" or (msg.metadata or {}).get("_is_interrupted"):
+                return None
+            text = msg.get_text_content() or ""
+            previous = streamed.get(msg.id, "")
+            if text == previous:
+                return None
+            streamed[msg.id] = text
+            if text.startswith(previous):
+                await on_delta(msg.id, text[len(previous):], False)
+            else:
+                # 累计文本与已发送内容不一致时，整体重发
+                await on_delta(msg.id, text, True)
+            return None
+
+        return stream_delta
 
-async def main(question: str, callback=None, config=None):
+    async def reset_memory(self) -> None:
+        """
+        清空agent记忆和上一个问题遗留的流式输出钩子、工具路由，保证每个问题都从干净的上下文开始
+        上个问题处理中后台校验得到的新工具列表在这里替换
+        """
+        self._apply_pending_tools()
+        if self.agent is not None:
+            await self.agent.memory.clear()
+            try:
+                self.agent.remove_instance_hook("pre_print", "stream_delta")
+            except ValueError:
+                pass
+            self.toolkit.set_route(None)
+
+    async def close(self) -> None:
+        """释放资源"""
+        self.agent = None
+
+async def main(question: str, callback=None, config=None, pool=None, on_delta=None, on_event=None, memory=None):
     """
     处理用户问题并返回结果
     
@@ -117,21 +450,36 @@ async def main(question: str, callback=None, config=None):
         question: 用户问题
         callback: 回调函数，用于接收中间输出
         config: 配置参数
+        pool: 预热的 FundManagerPool，提供时复用池中的管理器，否则新建
+        on_delta: 流式输出回调，用于逐段接收模型生成的文本
+        on_event: ReAct过程事件回调，用于接收推理轮次、工具调用等结构化事件
+        memory: 对话记忆（TokenBudgetMemory），提供时问题在该对话的上下文中回答
     
     Returns:
         str: 最终结果
     """
     try:
-        fund_manager = QiemanFundManager(config)
-        
         # 发送开始处理信号
         if callback:
             await callback("开始分析，请稍等，预测等待2分钟...")
         
-        # 处理用户问题    
-        res = await fund_manager.process_user_query(
-            user_question=question
-            )
+        # 处理用户问题
+        if pool is not None:
+            async with pool.acquire() as fund_manager:
+                res = await fund_manager.process_user_query(
+                    user_question=question,
+                    on_delta=on_delta,
+                    on_event=on_event,
+                    memory=memory,
+                    )
+        else:
+            fund_manager = QiemanFundManager(config)
+            res = await fund_manager.process_user_query(
+                user_question=question,
+                on_delta=on_delta,
+                on_event=on_event,
+                memory=memory,
+                )
         
         # 发送完成信号
         if callback:
@@ -140,7 +488,7 @@ async def main(question: str, callback=None, config=None):
         return res["response"]
         
     except Exception as e:
-        error_msg = f"处理过程中发生错误: {str(e)}"
+        error_msg = f"{ERROR_PREFIX}: {str(e)}"
         if callback:
             await callback(error_msg)
         return error_msg
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+问题调度器
+位于WebSocket层和 main() 之间，限制同时处理的问题数；超出的问题按客户端轮转排队，
+队列满时拒绝并提示重试时间，排队中的客户端会收到当前位置和预计等待时间
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """排队已满，需要稍后重试"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"当前提问人数较多，请{retry_after}秒后重试")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """排队中的一个问题"""
+
+    def __init__(self, client_id, on_position):
+        self.client_id = client_id
+        self.on_position = on_position
+        self.granted = asyncio.get_running_loop().create_future()
+        self.position = None
+
+
+class QuestionScheduler:
+    """带并发上限和按客户端公平排队的问题调度器"""
+
+    def __init__(self, max_concurrent=2, max_queue=20, max_queue_per_client=3, expected_duration=60):
+        """
+        Args:
+            max_concurrent: 同时处理的问题数上限
+            max_queue: 排队问题总数上限，超出时拒绝
+            max_queue_per_client: 单个客户端最多排队的问题数
+            expected_duration: 没有历史数据时，单个问题的预计处理时间（秒）
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        # 按处理耗时的滑动平均估计等待时间
+        self.avg_duration = float(expected_duration)
+
+        self._running = 0
+        # client_id -> 该客户端的排队问题，按客户端轮转出队
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._notify_tasks = set()
+
+        self.admitted = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, config) -> "QuestionScheduler":
+        """根据 config["scheduler"] 创建调度器，并发上限默认与预热池大小一致"""
+        scheduler_config = (config or {}).get("scheduler", {})
+        pool_size = (config or {}).get("pool", {}).get("size", 2)
+        return cls(
+            max_concurrent=scheduler_config.get("max_concurrent", pool_size),
+            max_queue=scheduler_config.get("max_queue", 20),
+            max_queue_per_client=scheduler_config.get("max_queue_per_client", 3),
+            expected_duration=scheduler_config.get("expected_duration", 60),
+        )
+
+    @asynccontextmanager
+    async def slot(self, client_id: str, on_position=None, reject_when_full: bool = True):
+        """
+        获取一个处理名额，退出上下文时归还
+
+        Args:
+            client_id: 客户端标识，同一客户端的问题在队列中轮流获得名额
+            on_position: 排队位置变化时的异步回调 on_position(position, estimated_wait)
+            reject_when_full: 为False时不受排队上限限制，一直排队到获得名额（批量问答自行限制排队数量）
+
+        Raises:
+            QueueFullError: 队列已满或该客户端排队过多
+        """
+        start = time.perf_counter()
+        if self._running < self.max_concurrent and self._queued == 0:
+            self._running += 1
+        else:
+            await self._wait_in_queue(client_id, on_position, reject_when_full)
+        self.admitted += 1
+        self._update_gauges()
+        metrics.QUEUE_WAIT.observe(time.perf_counter() - start, stage="scheduler")
+
+        run_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - run_start
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+            self._running -= 1
+            self._dispatch()
+            self._update_gauges()
+
+    async def _wait_in_queue(self, client_id, on_position, reject_when_full=True) -> None:
+        queue = self._queues.get(client_id)
+        if reject_when_full and (
+            self._queued >= self.max_queue or (queue is not None and len(queue) >= self.max_queue_per_client)
+        ):
+            self.rejected += 1
+            metrics.SCHEDULER_REJECTED.inc()
+            raise QueueFullError(self.estimate_wait(self._queued + 1))
+
+        waiter = _Waiter(client_id, on_position)
+        if queue is None:
+            queue = self._queues[client_id] = deque()
+        queue.append(waiter)
+        self._queued += 1
+        self._notify_positions()
+        try:
+            await waiter.granted
+        except asyncio.CancelledError:
+            if waiter.granted.done() and not waiter.granted.cancelled():
+                # 已分配名额但等待方被取消，归还名额
+                self._running -= 1
+                self._dispatch()
+            else:
+                self._remove(waiter)
+                self._notify_positions()
+            raise
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.client_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[waiter.client_id]
+
+    def _dispatch(self) -> None:
+        """有空闲名额时按客户端轮转唤醒排队的问题"""
+        dispatched = False
+        while self._running < self.max_concurrent and self._queues:
+            client_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            # 该客户端移到队尾，其他客户端优先
+            del self._queues[client_id]
+            if queue:
+                self._queues[client_id] = queue
+            if waiter.granted.done():
+                # 等待方已被取消（如批量问答整批取消时同时取消多个排队的问题）
+                continue
+            self._running += 1
+            waiter.granted.set_result(None)
+            dispatched = True
+        if dispatched:
+            self._notify_positions()
+
+    def _dispatch_order(self) -> List[_Waiter]:
+        """按轮转规则排列的出队顺序"""
+        order = []
+        queues = [list(queue) for queue in self._queues.values()]
+        depth = 0
+        while True:
+            layer = [queue[depth] for queue in queues if depth < len(queue)]
+            if not layer:
+                return order
+            order.extend(layer)
+            depth += 1
+
+    def estimate_wait(self, position: int) -> int:
+        """估计排在第 position 位的问题需要等待的秒数"""
+        rounds = math.ceil(position / max(self.max_concurrent, 1))
+        return int(math.ceil(rounds * self.avg_duration))
+
+    def _notify_positions(self) -> None:
+        """向位置发生变化的排队方推送新位置"""
+        self._update_gauges()
+        for position, waiter in enumerate(self._dispatch_order(), start=1):
+            if waiter.position == position or waiter.on_position is None:
+                continue
+            waiter.position = position
+            task = asyncio.ensure_future(self._send_position(waiter, position))
+            self._notify_tasks.add(task)
+            task.add_done_callback(self._notify_tasks.discard)
+
+    def _update_gauges(self) -> None:
+        metrics.SCHEDULER_QUEUED.set(self._queued)
+        metrics.SCHEDULER_RUNNING.set(self._running)
+
+    async def _send_position(self, waiter: _Waiter, position: int) -> None:
+        try:
+            await waiter.on_position(position, self.estimate_wait(position))
+        except Exception as e:
+            logger.warning(f"发送排队位置失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回调度器运行状态"""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self._running,
+            "queued": self._queued,
+            "clients_waiting": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_duration": round(self.avg_duration, 1),
+        }
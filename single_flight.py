@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+相同请求并发合并（single-flight）
+多个用户同时询问同一只基金时，相同的工具调用只向上游发起一次，结果分发给所有等待方
+"""
+
+import asyncio
+from typing import Dict, Any
+
+
+class SingleFlight:
+    """按键合并进行中的异步调用"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: str, func):
+        """
+        执行 func()，若相同key的调用正在进行则等待其结果
+
+        上游调用的异常会传递给所有等待方；单个等待方被取消不会影响其他等待方，
+        只有所有等待方都取消后才会取消上游调用，并立即移除该键，之后的调用重新发起而不是等待被取消的调用
+
+        Args:
+            key: 合并键，相同key的并发调用共享一次执行
+            func: 无参协程函数
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.leaders += 1
+        else:
+            self.shared += 1
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0:
+                    if self._calls.get(key) is task:
+                        del self._calls[key]
+                        del self._waiters[key]
+                    task.cancel()
+            raise
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        # 所有等待方都已取消时，避免出现未读取异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回合并统计"""
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+        }
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+工具调用推测预取
+问题中的基金代码确定后，模型第一轮推理大概率会调用基本信息、净值、业绩等工具，
+但这些调用要等第一轮推理结束才开始。回答问题时与第一轮模型请求同时发起这些调用，
+结果写入工具结果缓存，模型真正调用时直接命中（仍在进行中的调用由并发合并层共享）。
+- 每个工具被调用的概率按历史问题中模型实际的调用情况统计，只预取概率足够高的工具
+- 统计预取结果被使用/浪费的次数；按每个问题和每分钟的调用次数上限控制预取开销
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Set
+
+import metrics
+from agent_events import TOOL_START, detached_events
+from nav_store import CODE_ARGS
+from text_patterns import find_fund_codes
+from tool_cache import ToolResultCache, get_tool_cache
+
+logger = logging.getLogger(__name__)
+
+
+def code_tools(toolkit) -> List[Dict[str, Any]]:
+    """只需基金代码一个必填参数的MCP工具，返回 [{"tool": 工具名, "args": {参数名: "{code}"}}]"""
+    templates = []
+    for name, tool in toolkit.tools.items():
+        required = tool.json_schema["function"].get("parameters", {}).get("required", [])
+        if tool.mcp_name is not None and len(required) == 1 and required[0] in CODE_ARGS:
+            templates.append({"tool": name, "args": {required[0]: "{code}"}})
+    return templates
+
+
+def fill_args(args: Dict[str, Any], code: str) -> Dict[str, Any]:
+    """将参数值中的 {code} 替换为基金代码"""
+    return {key: value.replace("{code}", code) if isinstance(value, str) else value for key, value in args.items()}
+
+
+class Speculation:
+    """单个问题的推测预取：发起的调用，以及模型实际调用了哪些"""
+
+    def __init__(self, prefetcher: "SpeculativePrefetcher", codes: List[str]):
+        self.prefetcher = prefetcher
+        self.codes = codes
+        # 缓存键 -> 工具名
+        self.issued: Dict[str, str] = {}
+        self.used: Set[str] = set()
+        # 模型以单个基金代码为参数调用过的工具
+        self.called_tools: Set[str] = set()
+        # 进行中的预取调用，问题结束时取消
+        self.tasks: Set[asyncio.Future] = set()
+
+    def observe(self, callback=None):
+        """包装ReAct事件回调，记录模型实际调用的工具"""
+        async def on_event(event):
+            if event.type == TOOL_START:
+                name, args = event.data["name"], event.data.get("args") or {}
+                key = ToolResultCache.make_key(name, args)
+                if key in self.issued:
+                    self.used.add(key)
+                if len(args) == 1 and str(next(iter(args.values()))) in self.codes:
+                    self.called_tools.add(name)
+            if callback is not None:
+                await callback(event)
+
+        return on_event
+
+    def finish(self) -> None:
+        """问题处理结束，取消仍在进行的预取，记录预取的使用情况并更新工具调用概率"""
+        for task in list(self.tasks):
+            task.cancel()
+        self.prefetcher.finish(self)
+
+
+class SpeculativePrefetcher:
+    """按问题中的基金代码预取模型大概率会调用的工具"""
+
+    def __init__(
+        self,
+        cache: ToolResultCache,
+        tools=None,
+        max_funds=3,
+        max_calls_per_question=4,
+        budget_per_minute=60,
+        min_probability=0.3,
+        max_in_flight=8,
+    ):
+        """
+        Args:
+            cache: 工具结果缓存，预取结果写入其中
+            tools: 候选工具 [{"tool": 工具名, "args": {参数名: 值}}]，值中的 {code} 替换为基金代码；
+                为空时为所有只需基金代码一个参数的工具
+            max_funds: 每个问题最多为几只基金预取
+            max_calls_per_question: 每个问题最多预取的调用次数
+            budget_per_minute: 每分钟最多预取的调用次数（所有问题合计）
+            min_probability: 只预取被调用概率不低于该值的工具
+            max_in_flight: 同时进行中的预取调用上限
+        """
+        self.cache = cache
+        self.tools = tools or []
+        self.max_funds = max_funds
+        self.max_calls_per_question = max_calls_per_question
+        self.budget_per_minute = budget_per_minute
+        self.min_probability = min_probability
+        self.max_in_flight = max_in_flight
+
+        # 有基金代码的问题数，以及其中模型调用了各工具的问题数
+        self.questions = 0
+        self.tool_calls: Dict[str, int] = {}
+        self._issued_at = deque()
+        self._in_flight = 0
+
+        self.issued = 0
+        self.used = 0
+        self.wasted = 0
+        self.skipped_budget = 0
+
+    @classmethod
+    def from_config(cls, config) -> Optional["SpeculativePrefetcher"]:
+        """根据 config["speculation"] 创建，未启用或没有工具结果缓存时返回None"""
+        speculation_config = (config or {}).get("speculation", {})
+        cache = get_tool_cache(config)
+        if cache is None or not speculation_config.get("enabled", True):
+            return None
+        return cls(
+            cache,
+            tools=speculation_config.get("tools"),
+            max_funds=speculation_config.get("max_funds", 3),
+            max_calls_per_question=speculation_config.get("max_calls_per_question", 4),
+            budget_per_minute=speculation_config.get("budget_per_minute", 60),
+            min_probability=speculation_config.get("min_probability", 0.3),
+            max_in_flight=speculation_config.get("max_in_flight", 8),
+        )
+
+    def probability(self, tool_name: str) -> float:
+        """有基金代码的问题中模型调用该工具的概率（拉普拉斯平滑，没有数据时为0.5）"""
+        return (self.tool_calls.get(tool_name, 0) + 1) / (self.questions + 2)
+
+    def _take_budget(self) -> bool:
+        now = time.monotonic()
+        while self._issued_at and now - self._issued_at[0] > 60:
+            self._issued_at.popleft()
+        if len(self._issued_at) >= self.budget_per_minute or self._in_flight >= self.max_in_flight:
+            return False
+        self._issued_at.append(now)
+        return True
+
+    def start(self, toolkit, question: str) -> Optional[Speculation]:
+        """
+        按问题中的基金代码在后台发起预取，问题中没有基金代码时返回None
+
+        Args:
+            toolkit: 基金管理助手的工具集，按工具路由限定的子集挑选候选工具
+            question: 附加了已识别基金代码的问题
+        """
+        codes = find_fund_codes(question)[:self.max_funds]
+        if not codes:
+            return None
+        speculation = Speculation(self, codes)
+
+        route = getattr(toolkit, "route", None)
+        templates = [
+            template for template in (self.tools or code_tools(toolkit))
+            if template["tool"] in toolkit.tools
+            and (route is None or template["tool"] in route)
+            and self.cache.ttl_for(template["tool"])
+            and self.probability(template["tool"]) >= self.min_probability
+        ]
+        templates.sort(key=lambda template: self.probability(template["tool"]), reverse=True)
+
+        for template in templates:
+            for code in codes:
+                if len(speculation.issued) >= self.max_calls_per_question:
+                    break
+                args = fill_args(template.get("args", {}), code)
+                key = ToolResultCache.make_key(template["tool"], args)
+                if key in speculation.issued or self.cache.contains(key):
+                    continue
+                if not self._take_budget():
+                    self.skipped_budget += 1
+                    metrics.SPECULATIVE_CALLS.inc(outcome="skipped")
+                    continue
+                speculation.issued[key] = template["tool"]
+                self._launch(speculation, toolkit.tools[template["tool"]].original_func, template["tool"], args)
+
+        if speculation.issued:
+            logger.info(f"推测预取 {len(speculation.issued)} 次工具调用: {', '.join(sorted(set(speculation.issued.values())))}")
+        return speculation
+
+    def _launch(self, speculation: Speculation, func, tool_name: str, args: Dict[str, Any]) -> None:
+        self.issued += 1
+        self._in_flight += 1
+
+        async def call():
+            # 任务会复制发起时的上下文：子任务中发起的预取仍处于用户问题的事件流内，需要显式脱离，
+            # 否则预取的工具调用事件会推送给用户，并被当作模型的调用
+            with detached_events():
+                return await func(**args)
+
+        def done(task: asyncio.Task) -> None:
+            self._in_flight -= 1
+            speculation.tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.debug(f"推测预取失败 {tool_name}({args}): {str(task.exception())}")
+
+        # 预取结果经由工具调用层写入缓存
+        task = asyncio.ensure_future(call())
+        speculation.tasks.add(task)
+        task.add_done_callback(done)
+
+    def finish(self, speculation: Speculation) -> None:
+        self.questions += 1
+        for tool_name in speculation.called_tools:
+            self.tool_calls[tool_name] = self.tool_calls.get(tool_name, 0) + 1
+        used = len(speculation.used)
+        wasted = len(speculation.issued) - used
+        self.used += used
+        self.wasted += wasted
+        if used:
+            metrics.SPECULATIVE_CALLS.inc(used, outcome="used")
+        if wasted:
+            metrics.SPECULATIVE_CALLS.inc(wasted, outcome="wasted")
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息：预取、使用、浪费次数和浪费比例"""
+        finished = self.used + self.wasted
+        return {
+            "questions": self.questions,
+            "issued": self.issued,
+            "used": self.used,
+            "wasted": self.wasted,
+            "skipped_budget": self.skipped_budget,
+            "waste_rate": self.wasted / finished if finished else 0.0,
+            "in_flight": self._in_flight,
+        }
+
+
+# 进程内共享的预取器，所有基金管理助手共用调用概率和预算
+_prefetchers: Dict[str, Optional[SpeculativePrefetcher]] = {}
+
+
+def get_speculative_prefetcher(config) -> Optional[SpeculativePrefetcher]:
+    """获取进程内共享的推测预取器"""
+    key = json.dumps(
+        [(config or {}).get("speculation", {}), (config or {}).get("tool_cache", {})],
+        sort_keys=True,
+    )
+    if key not in _prefetchers:
+        _prefetchers[key] = SpeculativePrefetcher.from_config(config)
+    return _prefetchers[key]
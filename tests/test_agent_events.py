@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from types import SimpleNamespace
+
+import agent_events
+
+
+def test_tool_calls_outside_a_question_still_reach_listeners():
+    events = []
+    agent_events.add_listener(events.append)
+    received = []
+
+    async def tool(**kwargs):
+        return SimpleNamespace(content=[{"type": "text", "text": "ok"}])
+
+    toolkit = SimpleNamespace(tools={"GetFundDetail": SimpleNamespace(mcp_name="qieman_mcp", original_func=tool)})
+    agent_events.install_tool_events(toolkit)
+    call = toolkit.tools["GetFundDetail"].original_func
+
+    async def on_event(event):
+        received.append(event.type)
+
+    async def scenario():
+        with agent_events.stream_events(on_event):
+            with agent_events.detached_events():
+                await call(fundCode="005827")
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        agent_events._listeners.remove(events.append)
+    assert [event.type for event in events] == [agent_events.TOOL_START, agent_events.TOOL_END]
+    assert events[1].data["name"] == "GetFundDetail" and events[1].data["bytes"] > 0
+    assert received == []
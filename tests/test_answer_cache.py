@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from answer_cache import AnswerCache, current_trading_date, normalize_question
+
+
+def test_width_punctuation_whitespace_and_aliases_normalize_to_one_key():
+    aliases = {"易方达蓝筹": "005827", "易方达蓝筹精选": "005827"}
+    variants = ["易方达蓝筹精选 最近 净值？", "易方达蓝筹精选最近净值?", "易方达蓝筹精选最近净值。。", "005827最近净值"]
+    assert {normalize_question(q, aliases) for q in variants} == {"005827最近净值"}
+
+
+def test_trading_date_rolls_back_before_publish_and_on_weekends():
+    friday = datetime.datetime(2025, 1, 3, 20, 0)
+    assert current_trading_date(friday) == datetime.date(2025, 1, 2)
+    assert current_trading_date(friday.replace(hour=21)) == datetime.date(2025, 1, 3)
+    assert current_trading_date(datetime.datetime(2025, 1, 5, 23, 0)) == datetime.date(2025, 1, 3)
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = AnswerCache(max_entries=2, max_bytes=10)
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    assert cache.get("a") is not None
+    cache.put("c", "1")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    cache.put("d", "x" * 11)
+    assert cache.get("d") is None
+    assert cache.stats()["bytes"] <= 10
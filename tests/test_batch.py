@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("agentscope")
+
+import batch
+from scheduler import QuestionScheduler
+
+
+def test_batch_questions_take_scheduler_slots(monkeypatch):
+    scheduler = QuestionScheduler(max_concurrent=1)
+    peak = []
+
+    async def fake_main(question, websocket, config, pool=None):
+        peak.append(scheduler.stats()["running"])
+        await asyncio.sleep(0.01)
+        return f"回答：{question}"
+
+    monkeypatch.setattr(batch, "main", fake_main)
+
+    async def scenario():
+        questions = batch.parse_questions(["问题1", "问题2", "问题3"])
+        return [result async for result in batch.run_batch(questions, {}, None, concurrency=3, scheduler=scheduler)]
+
+    results = asyncio.run(scenario())
+    assert [result["status"] for result in results[:-1]] == ["ok"] * 3
+    assert results[-1]["succeeded"] == 3
+    assert max(peak) == 1 and scheduler.stats()["running"] == 0
+
+
+def test_closing_batch_waits_for_cancelled_questions(monkeypatch):
+    scheduler = QuestionScheduler(max_concurrent=1)
+
+    async def fake_main(question, websocket, config, pool=None):
+        if question == "慢问题":
+            await asyncio.sleep(10)
+        return "回答"
+
+    monkeypatch.setattr(batch, "main", fake_main)
+
+    async def scenario():
+        questions = batch.parse_questions(["快问题", "慢问题", "慢问题"])
+        results = batch.run_batch(questions, {}, None, concurrency=3, scheduler=scheduler)
+        await results.__anext__()
+        await results.aclose()
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["running"] == 0 and stats["queued"] == 0
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip("agentscope")
+
+from complexity_router import ANALYSIS, COMPARE, LOOKUP, ComplexityRouter
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("005827的最新净值", LOOKUP),
+    ("易方达蓝筹精选的规模和基金经理", LOOKUP),
+    ("005827和110011哪个好", COMPARE),
+    ("帮我分析一下005827的持仓", ANALYSIS),
+    # 泛用的查询用语不再把多方面的问题分到简单查询
+    ("查询一下这只基金是什么情况", ANALYSIS),
+    ("005827的净值、规模、费率和基金经理", ANALYSIS),
+])
+def test_classify(question, expected):
+    assert ComplexityRouter().classify(question) == expected
+
+
+def test_lookup_uses_a_lighter_prompt_unless_overridden():
+    assert "简洁" in ComplexityRouter().sys_prompt(LOOKUP)
+    assert ComplexityRouter().sys_prompt(ANALYSIS) is None
+    router = ComplexityRouter(classes={LOOKUP: {"sys_prompt": ""}, COMPARE: {"sys_prompt": "只对比数据"}})
+    assert router.sys_prompt(LOOKUP) is None
+    assert router.sys_prompt(COMPARE) == "只对比数据"
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("agentscope")
+
+import fan_out
+from fan_out import FanOutPlanner
+
+
+@pytest.fixture
+def planner(monkeypatch):
+    monkeypatch.setattr(fan_out, "get_fund_resolver", lambda config: None)
+    return FanOutPlanner({}, concurrency=2)
+
+
+def test_sub_question_mentions_only_its_own_fund(planner):
+    funds = [("005827", "易方达蓝筹精选"), ("161725", "招商中证白酒")]
+    focus = planner.focus_question("对比易方达蓝筹精选和161725近一年的收益和回撤", funds)
+    assert focus == "对比该基金近一年的收益和回撤"
+    question = planner.sub_question(focus, *funds[0])
+    assert "005827" in question and "161725" not in question and "招商中证白酒" not in question
+
+
+def test_semaphore_and_idle_managers_are_per_event_loop(planner):
+    async def grab():
+        planner._idle().append(object())
+        return planner._semaphore(), len(planner._idle())
+
+    first, idle_first = asyncio.run(grab())
+    second, idle_second = asyncio.run(grab())
+    assert first is not second
+    assert idle_first == idle_second == 1
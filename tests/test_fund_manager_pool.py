@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("agentscope")
+
+import fund_manager_pool
+from fund_manager_pool import FundManagerPool
+
+
+class FakeManager:
+    def __init__(self, config):
+        self.agent = object()
+        self.resets = 0
+        self.closed = False
+
+    async def initialize_agent(self):
+        pass
+
+    async def reset_memory(self):
+        self.resets += 1
+
+    async def close(self):
+        await asyncio.sleep(0.01)
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_manager(monkeypatch):
+    monkeypatch.setattr(fund_manager_pool, "QiemanFundManager", FakeManager)
+
+
+def test_cancelled_question_returns_manager_without_recycling():
+    async def scenario():
+        pool = FundManagerPool({}, size=1)
+        await pool.start()
+
+        async def ask():
+            async with pool.acquire():
+                await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(ask())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        manager = pool._managers[0]
+        stats = pool.stats()
+        await pool.close()
+        return manager, stats
+
+    manager, stats = asyncio.run(scenario())
+    assert stats["recycled"] == 0 and stats["idle"] == 1
+    # 借出时清空一次，取消后再清理一次
+    assert manager.resets == 2
+
+
+def test_close_waits_for_background_recycling():
+    async def scenario():
+        pool = FundManagerPool({}, size=1)
+        await pool.start()
+        old = pool._managers[0]
+        with pytest.raises(RuntimeError):
+            async with pool.acquire():
+                raise RuntimeError("boom")
+        await pool.close()
+        return old, pool
+
+    old, pool = asyncio.run(scenario())
+    assert old.closed and pool._recycled == 1 and not pool._recycle_tasks
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from fund_resolver import FundResolver, core_name
+
+
+@pytest.fixture
+def resolver():
+    resolver = FundResolver(path=None, aliases={"蓝筹": "005827"})
+    resolver.add("009051", "易方达中证红利ETF联接A")
+    resolver.add("005827", "易方达蓝筹精选混合")
+    resolver.add("003095", "中欧医疗健康混合A")
+    return resolver
+
+
+def test_core_name_strips_share_class_and_type_suffixes():
+    assert core_name("中欧医疗健康混合A") == "中欧医疗健康"
+    assert core_name("易方达中证红利ETF联接A") == "易方达中证红利"
+
+
+@pytest.mark.parametrize("question", ["易方达蓝筹精选混合的净值", "易方达蓝筹精选最近怎么样", "蓝筹的持仓"])
+def test_full_name_core_name_and_alias_resolve(resolver, question):
+    assert [code for _, code in resolver.find_mentions(question)] == ["005827"]
+    annotated, prompt = resolver.annotate(question)
+    assert "005827" in annotated and "无需再搜索" in annotated
+    assert prompt == annotated
+
+
+@pytest.mark.parametrize("question", [
+    # 只有前缀 “易方达中” 与 易方达中证红利ETF联接A 相同
+    "易方达中小盘混合的净值",
+    # 名称片段部分重合的模糊匹配
+    "中证红利指数最近表现",
+    # 核心名称相同但份额类别不同
+    "中欧医疗健康混合C的净值",
+    "易方达中证红利ETF联接C",
+])
+def test_near_miss_names_are_only_candidates(resolver, question):
+    assert resolver.find_mentions(question) == []
+    annotated, prompt = resolver.annotate(question)
+    assert annotated == question
+    assert "请核实" in prompt
+    assert "无需再搜索" not in prompt
+
+
+def test_candidates_are_not_added_for_unrelated_questions(resolver):
+    question = "今天A股大盘怎么样"
+    assert resolver.annotate(question) == (question, question)
+
+
+def test_codes_already_in_question_are_not_repeated(resolver):
+    question = "005827 易方达蓝筹精选混合的净值"
+    assert resolver.annotate(question) == (question, question)
+
+
+def test_resolve_accepts_only_codes_and_complete_names(resolver):
+    assert resolver.resolve("009051") == "009051"
+    assert resolver.resolve("易方达中证红利ETF联接A") == "009051"
+    assert resolver.resolve("易方达中证") is None
+    assert resolver.resolve("中证红利") is None
+
+
+def test_shared_core_name_is_ambiguous():
+    resolver = FundResolver(path=None)
+    resolver.add("003095", "中欧医疗健康混合A")
+    resolver.add("003096", "中欧医疗健康混合C")
+    assert resolver.find_mentions("中欧医疗健康最近怎么样") == []
+    assert resolver.find_mentions("中欧医疗健康混合C怎么样") == [("中欧医疗健康混合c", "003096")]
+
+
+def test_replace_mentions_only_uses_confirmed_matches(resolver):
+    assert resolver.replace_mentions("易方达蓝筹精选净值") == "005827净值"
+    assert resolver.replace_mentions("易方达中小盘净值") == "易方达中小盘净值"
+
+
+def test_background_refresh_is_detached_per_loop_and_saved(tmp_path):
+    ToolResponse = pytest.importorskip("agentscope.tool").ToolResponse
+    import agent_events
+
+    path = tmp_path / "fund_names.json"
+    resolver = FundResolver(path=str(path), list_tool="ListFunds", refresh_interval=0)
+    streams = []
+
+    async def list_funds():
+        streams.append(agent_events.current_stream())
+        payload = [{"fundCode": "005827", "fundName": "易方达蓝筹精选混合"}]
+        return ToolResponse(content=[{"type": "text", "text": json.dumps(payload, ensure_ascii=False)}])
+
+    toolkit = SimpleNamespace(tools={"ListFunds": SimpleNamespace(original_func=list_funds)})
+
+    async def ask():
+        with agent_events.stream_events():
+            resolver.refresh_in_background(toolkit)
+        await asyncio.sleep(0.05)
+
+    # GUI重启服务后在新的事件循环中仍会刷新
+    asyncio.run(ask())
+    asyncio.run(ask())
+    assert streams == [None, None]
+    assert json.loads(path.read_text(encoding="utf-8"))["funds"] == {"005827": "易方达蓝筹精选混合"}
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("agentscope")
+
+from hedged_model import HALF_OPEN, EndpointState, HedgedChatModel
+
+
+class FakeModel:
+    model_name = "fake"
+
+    def __init__(self, delay, answer, error_on_cancel=False):
+        self.delay = delay
+        self.answer = answer
+        self.error_on_cancel = error_on_cancel
+
+    async def __call__(self, *args, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            if self.error_on_cancel:
+                # 部分客户端在取消时抛出连接错误而不是 CancelledError
+                raise RuntimeError("connection closed")
+            raise
+        return self.answer
+
+
+def half_open(state):
+    state.opened_at = time.monotonic() - state.reset_timeout
+    state._trial = True
+    assert state.state == HALF_OPEN
+
+
+def test_probe_is_sent_when_every_endpoint_is_half_open():
+    primary, backup = EndpointState("a"), EndpointState("b")
+    half_open(primary)
+    half_open(backup)
+    model = HedgedChatModel([(FakeModel(0, "a"), primary), (FakeModel(0, "b"), backup)], stream=False)
+    assert asyncio.run(model()) == "a"
+    assert primary.state == "closed"
+
+
+def test_cancelled_hedge_loser_is_not_a_failure():
+    slow, fast = EndpointState("slow"), EndpointState("fast")
+    model = HedgedChatModel(
+        [(FakeModel(10, "slow", error_on_cancel=True), slow), (FakeModel(0, "fast"), fast)],
+        min_hedge_delay=0.01,
+        max_hedge_delay=0.01,
+        stream=False,
+    )
+    assert asyncio.run(model()) == "fast"
+    assert slow.errors == 0 and slow.failures == 0
+    assert fast.wins == 1
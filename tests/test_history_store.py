@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from history_store import HistoryStore, decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def store(tmp_path):
+    results_dir = tmp_path / "results"
+    results_dir.mkdir()
+    store = HistoryStore(results_dir=str(results_dir), path=str(tmp_path / "history.db"))
+    yield store
+    store.close()
+
+
+def add(store, index, day="2024-05-01", size=100):
+    store.add(f"{index:03d}.md", f"{day} 10:00:{index:02d}", size, f"问题{index}", f"回答{index}")
+
+
+def test_page_walks_all_records_with_cursor(store):
+    for index in range(7):
+        add(store, index)
+    seen, cursor = [], None
+    while True:
+        page = store.page(limit=3, cursor=cursor)
+        seen += [item["filename"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"{index:03d}.md" for index in reversed(range(7))]
+
+
+def test_page_sorts_by_size_and_filters_by_date(store):
+    add(store, 1, day="2024-05-01", size=300)
+    add(store, 2, day="2024-05-02", size=100)
+    add(store, 3, day="2024-05-03", size=200)
+    page = store.page(sort="size", order="asc", start_date="2024-05-02", end_date="2024-05-03")
+    assert [item["filename"] for item in page["items"]] == ["002.md", "003.md"]
+    assert page["next_cursor"] is None
+
+
+def test_page_rejects_unknown_sort_and_bad_cursor(store):
+    with pytest.raises(ValueError):
+        store.page(sort="name")
+    with pytest.raises(ValueError):
+        store.page(cursor="not-a-cursor")
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("2024-05-01 10:00:00", "a.md")) == ("2024-05-01 10:00:00", "a.md")
+
+
+def test_sync_indexes_new_files_and_drops_missing(store, tmp_path):
+    add(store, 1)
+    (tmp_path / "results" / "new.md").write_text(
+        "# 问答记录\n\n**时间**: 2024-05-02 09:00:00\n\n**问题**:\n\n净值多少\n\n**答案**:\n\n1.23\n\n",
+        encoding="utf-8",
+    )
+    store.sync()
+    assert store.filenames() == ["new.md"]
+    assert store.recent_questions(1) == ["净值多少"]
+
+
+def test_store_can_be_used_from_another_thread(store):
+    # Web服务停止后再启动时在新线程中运行
+    errors = []
+
+    def worker():
+        try:
+            add(store, 1)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert errors == []
+    assert store.count() == 1
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from loop_local import LoopLocal
+
+
+def test_instances_are_separate_per_event_loop():
+    registry = LoopLocal()
+
+    async def get():
+        return registry.get("key", object)
+
+    async def get_twice():
+        return await get(), await get()
+
+    first, again = asyncio.run(get_twice())
+    assert first is again
+    assert asyncio.run(get()) is not first
+
+
+def test_pop_all_only_returns_current_loop_instances():
+    registry = LoopLocal()
+    outside = registry.get("key", object)
+
+    async def run():
+        inside = registry.get("key", object)
+        return inside, registry.pop_all()
+
+    inside, popped = asyncio.run(run())
+    assert popped == [inside]
+    assert registry.get("key", object) is outside
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+
+import pytest
+
+pytest.importorskip("agentscope")
+from agentscope.tool import ToolResponse
+
+from answer_cache import current_trading_date
+from nav_store import NavStore
+
+TOOL = "GetFundNavHistory"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NavStore(path=str(tmp_path / "nav.db"), tools=[TOOL])
+    yield store
+    store.close()
+
+
+def response(payload):
+    return ToolResponse(content=[{"type": "text", "text": json.dumps(payload, ensure_ascii=False)}])
+
+
+def nav_page(dates, **paging):
+    items = [{"navDate": date, "nav": "1.0%d" % index, "accNav": "2.0%d" % index, "dailyReturn": "0.1"}
+             for index, date in enumerate(dates)]
+    return {"code": 0, "data": {"fundCode": "005827", "list": items, **paging}}
+
+
+def test_unpaged_response_is_not_full_history(store):
+    store.ingest(TOOL, {"fundCode": "005827"}, response(nav_page(["2024-05-02", "2024-05-01"])))
+    assert store.is_fresh("005827") == (True, False)
+    assert store.answer(TOOL, {"fundCode": "005827"}) is None
+
+
+def test_response_with_more_pages_is_not_full_history(store):
+    store.ingest(TOOL, {"fundCode": "005827"}, response(nav_page(["2024-05-02", "2024-05-01"], total=300)))
+    assert store.is_fresh("005827") == (True, False)
+    store.ingest(TOOL, {"fundCode": "005827"}, response(nav_page(["2024-05-02", "2024-05-01"], hasNext=True)))
+    assert store.is_fresh("005827") == (True, False)
+
+
+def test_complete_response_answers_with_upstream_shape(store):
+    upstream = nav_page(["2024-05-03", "2024-05-02", "2024-05-01"], total=3, hasNext=False)
+    store.ingest(TOOL, {"fundCode": "005827"}, response(upstream))
+    assert store.is_fresh("005827") == (True, True)
+
+    local = store.answer(TOOL, {"fundCode": "005827"})
+    assert local.metadata == {"source": "local_nav_store"}
+    assert json.loads(local.content[0]["text"]) == upstream
+
+    recent = json.loads(store.answer(TOOL, {"fundCode": "005827", "count": 2}).content[0]["text"])
+    assert [item["navDate"] for item in recent["data"]["list"]] == ["2024-05-03", "2024-05-02"]
+    assert recent["data"]["total"] == 2
+
+
+def test_unmodeled_arguments_are_forwarded(store):
+    store.ingest(TOOL, {"fundCode": "005827"}, response(nav_page(["2024-05-01"], total=1)))
+    assert store.answer(TOOL, {"fundCode": "005827"}) is not None
+    assert store.answer(TOOL, {"fundCode": "005827", "pageNum": 2}) is None
+    assert store.answer(TOOL, {"fundCode": "005827", "adjust": "dividend"}) is None
+
+
+def test_past_range_does_not_mark_fresh(store):
+    store.ingest(
+        TOOL,
+        {"fundCode": "005827", "startDate": "2024-05-01", "endDate": "2024-05-02"},
+        response(nav_page(["2024-05-02", "2024-05-01"], total=2)),
+    )
+    assert store.is_fresh("005827") == (False, False)
+    assert store.last_date("005827") == "2024-05-02"
+
+
+def weekdays(end, count):
+    dates, day = [], end
+    while len(dates) < count:
+        if day.weekday() < 5:
+            dates.append(day)
+        day -= datetime.timedelta(days=1)
+    return dates
+
+
+def test_days_is_not_answered_until_its_meaning_is_known(store):
+    store.ingest(TOOL, {"fundCode": "005827"}, response(nav_page(["2024-05-03", "2024-05-02"], total=2)))
+    assert store.answer(TOOL, {"fundCode": "005827", "days": 2}) is None
+
+
+def test_days_as_row_count_is_learnt_from_upstream(store):
+    dates = [date.isoformat() for date in weekdays(datetime.date.today(), 30)]
+    store.ingest(TOOL, {"fundCode": "005827", "days": 30}, response(nav_page(dates)))
+    assert store.days_unit(TOOL) == "rows"
+    store.ingest(TOOL, {"fundCode": "005827"}, response(nav_page(dates, total=30)))
+    local = json.loads(store.answer(TOOL, {"fundCode": "005827", "days": 10}).content[0]["text"])
+    assert len(local["data"]["list"]) == 10
+
+
+def test_days_as_calendar_window_is_learnt_from_upstream(store):
+    today = datetime.date.today()
+    window = [date for date in weekdays(today, 40) if date > today - datetime.timedelta(days=30)]
+    store.ingest(TOOL, {"fundCode": "005827", "days": 30}, response(nav_page([d.isoformat() for d in window])))
+    assert store.days_unit(TOOL) == "calendar"
+    store.ingest(TOOL, {"fundCode": "005827"}, response(nav_page([d.isoformat() for d in weekdays(today, 40)], total=40)))
+    local = json.loads(store.answer(TOOL, {"fundCode": "005827", "days": 14}).content[0]["text"])
+    reference = current_trading_date(datetime.datetime.now())
+    assert {item["navDate"] for item in local["data"]["list"]} == {
+        d.isoformat() for d in weekdays(today, 40) if reference - datetime.timedelta(days=14) <= d <= reference
+    }
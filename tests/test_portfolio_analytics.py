@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+import pytest
+
+pytest.importorskip("agentscope")
+
+from nav_store import NavStore
+from portfolio_analytics import PortfolioAnalytics
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NavStore(path=str(tmp_path / "nav.db"))
+    yield store
+    store.close()
+
+
+def daily_rows(start, count, with_acc=True):
+    day = datetime.date.fromisoformat(start)
+    return [
+        ((day + datetime.timedelta(days=index)).isoformat(), 1 + index / 100, 2 + index / 50 if with_acc else None)
+        for index in range(count)
+    ]
+
+
+def test_uses_acc_nav_and_falls_back_to_unit_nav(store):
+    store.upsert("000001", daily_rows("2024-01-01", 60))
+    store.upsert("000002", daily_rows("2024-01-01", 60, with_acc=False))
+    result = PortfolioAnalytics(store).analyze(["000001", "000002"], days=30)
+    assert [fund["nav_field"] for fund in result["funds"]] == ["acc_nav", "nav"]
+    assert len(result["notes"]) == 1 and "000002" in result["notes"][0]
+
+
+def test_rejects_history_that_does_not_cover_the_window(store):
+    store.upsert("000001", daily_rows("2024-01-01", 400))
+    store.upsert("000002", daily_rows("2025-01-01", 34))
+    result = PortfolioAnalytics(store).analyze(["000001", "000002"], days=365)
+    assert [item["fundCode"] for item in result["uncovered"]] == ["000002"]
+
+
+def test_full_history_counts_as_covered(store):
+    store.upsert("000001", daily_rows("2024-01-01", 400))
+    store.upsert("000002", daily_rows("2025-01-01", 34))
+    store.mark_synced("000002", full_history=True)
+    result = PortfolioAnalytics(store).analyze(["000001", "000002"], days=365)
+    assert "uncovered" not in result
+    assert result["start"] == "2025-01-01"
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("agentscope")
+
+from agentscope.message import Msg
+
+from qieman_mcp import QiemanFundManager
+from token_budget_memory import TokenBudgetMemory
+
+CONFIG = {
+    "mcp": {"url": "http://127.0.0.1:1/sse"},
+    "fund_resolver": {"enabled": False},
+    "fan_out": {"enabled": False},
+    "speculation": {"enabled": False},
+}
+
+
+class FakeAgent:
+    def __init__(self, error):
+        self.max_iters = 10
+        self.model = object()
+        self.memory = None
+        self.error = error
+        self.hooks = {}
+
+    def register_instance_hook(self, hook_type, name, hook):
+        self.hooks[name] = hook
+
+    def remove_instance_hook(self, hook_type, name):
+        if name not in self.hooks:
+            raise ValueError(name)
+        del self.hooks[name]
+
+    async def __call__(self, msg):
+        raise self.error
+
+
+@pytest.mark.parametrize("error", [RuntimeError("boom"), asyncio.CancelledError()])
+def test_failed_query_restores_agent_state(error):
+    manager = QiemanFundManager(CONFIG)
+    manager.agent = FakeAgent(error)
+
+    async def scenario():
+        await manager.process_user_query("问题", on_delta=lambda *args: None, max_iters=3)
+
+    with pytest.raises(type(error)):
+        asyncio.run(scenario())
+    assert manager.agent.max_iters == 10
+    assert manager.agent.hooks == {}
+
+
+class FakeRevalidation:
+    def __init__(self, schemas, digest):
+        self.value = (schemas, digest)
+
+    def cancelled(self):
+        return False
+
+    def exception(self):
+        return None
+
+    def result(self):
+        return self.value
+
+
+def test_tool_revalidation_during_a_question_waits_for_it_to_finish(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = QiemanFundManager(CONFIG)
+    schema = {
+        "type": "function",
+        "function": {
+            "name": "GetFundDetail",
+            "description": "查询基金基本信息",
+            "parameters": {"type": "object", "properties": {"fundCode": {"type": "string"}}, "required": ["fundCode"]},
+        },
+    }
+    revalidation = FakeRevalidation([schema], "new")
+
+    class RevalidatingAgent(FakeAgent):
+        async def __call__(self, msg):
+            manager._on_tools_revalidated(revalidation)
+            # 问题处理中工具集和agent保持不变
+            assert manager.agent is self
+            assert "GetFundDetail" not in manager.toolkit.tools
+            return Msg("assistant", "回答", "assistant")
+
+    agent = RevalidatingAgent(None)
+    manager.agent = agent
+
+    async def scenario():
+        res = await manager.process_user_query("问题", on_delta=lambda *args: None, max_iters=3)
+        await manager.reset_memory()
+        return res
+
+    assert asyncio.run(scenario())["response"] == "回答"
+    assert agent.max_iters == 10 and agent.hooks == {}
+    assert "GetFundDetail" in manager.toolkit.tools
+    assert manager.tools_hash == "new" and manager.agent is None
+
+
+def test_conversation_memory_is_used_and_rolled_back_on_failure():
+    manager = QiemanFundManager(CONFIG)
+    conversation = TokenBudgetMemory()
+    own_memory = TokenBudgetMemory()
+
+    class ConversationAgent(FakeAgent):
+        async def __call__(self, msg):
+            await self.memory.add(msg)
+            if self.error is not None:
+                raise self.error
+            await self.memory.add(Msg("FundManager", "回答", "assistant"))
+            return Msg("FundManager", "回答", "assistant")
+
+    manager.agent = ConversationAgent(None)
+    manager.agent.memory = own_memory
+    asyncio.run(manager.process_user_query("第一个问题", memory=conversation))
+    assert len(conversation.content) == 2 and own_memory.content == []
+    assert manager.agent.memory is own_memory
+
+    manager.agent.error = RuntimeError("boom")
+    with pytest.raises(RuntimeError):
+        asyncio.run(manager.process_user_query("追问", memory=conversation))
+    assert [msg.get_text_content() for msg, _ in conversation.content] == ["第一个问题", "回答"]
+    assert manager.agent.memory is own_memory
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from scheduler import QuestionScheduler, QueueFullError
+
+
+async def hold(scheduler, client_id, release, **kwargs):
+    async with scheduler.slot(client_id, **kwargs):
+        await release.wait()
+
+
+def test_limits_running_and_rejects_when_queue_full():
+    async def scenario():
+        scheduler = QuestionScheduler(max_concurrent=1, max_queue=2, max_queue_per_client=1)
+        release = asyncio.Event()
+        tasks = [asyncio.ensure_future(hold(scheduler, client, release)) for client in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["running"] == 1 and scheduler.stats()["queued"] == 2
+
+        with pytest.raises(QueueFullError):
+            async with scheduler.slot("d"):
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        assert scheduler.stats()["running"] == 0 and scheduler.rejected == 1
+
+    asyncio.run(scenario())
+
+
+def test_per_client_limit_and_waiting_without_rejection():
+    async def scenario():
+        scheduler = QuestionScheduler(max_concurrent=1, max_queue=10, max_queue_per_client=1)
+        release = asyncio.Event()
+        tasks = [asyncio.ensure_future(hold(scheduler, "a", release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            async with scheduler.slot("a"):
+                pass
+
+        # 批量问答不受排队上限限制，一直等到获得名额
+        batch = [asyncio.ensure_future(hold(scheduler, "batch", release, reject_when_full=False)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 4
+        release.set()
+        await asyncio.gather(*tasks, *batch)
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        scheduler = QuestionScheduler(max_concurrent=1)
+        release = asyncio.Event()
+        running = asyncio.ensure_future(hold(scheduler, "a", release))
+        waiting = asyncio.ensure_future(hold(scheduler, "b", release))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert scheduler.stats()["queued"] == 0
+        release.set()
+        await running
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("agentscope")
+
+import agent_events
+from speculative_prefetch import Speculation, SpeculativePrefetcher
+
+
+def test_finish_cancels_in_flight_prefetches_outside_the_event_stream():
+    seen_streams = []
+
+    async def scenario():
+        running = asyncio.Event()
+
+        async def slow_tool(**kwargs):
+            seen_streams.append(agent_events.current_stream())
+            running.set()
+            await asyncio.sleep(10)
+
+        prefetcher = SpeculativePrefetcher(cache=None)
+        with agent_events.stream_events():
+            speculation = Speculation(prefetcher, ["005827"])
+            prefetcher._launch(speculation, slow_tool, "GetFundNav", {"fundCode": "005827"})
+            await running.wait()
+        task = next(iter(speculation.tasks))
+        speculation.finish()
+        await asyncio.gather(task, return_exceptions=True)
+        return task, speculation, prefetcher
+
+    task, speculation, prefetcher = asyncio.run(scenario())
+    assert seen_streams == [None]
+    assert task.cancelled() and not speculation.tasks
+    assert prefetcher.stats()["in_flight"] == 0
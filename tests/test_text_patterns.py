@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from text_patterns import FUND_CODE, find_fund_codes
+
+
+def test_fund_codes_are_six_digit_runs_in_first_seen_order():
+    text = "对比110011和000001，再看110011；电话13800138000、日期20250101不算"
+    assert find_fund_codes(text) == ["110011", "000001"]
+    assert find_fund_codes(None) == []
+
+
+def test_fund_code_fullmatch_rejects_longer_numbers():
+    assert FUND_CODE.fullmatch("000001")
+    assert not FUND_CODE.fullmatch("0000012")
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import datetime
+import threading
+
+import pytest
+
+pytest.importorskip("agentscope")
+from agentscope.tool import ToolResponse
+
+from tool_cache import TTL_UNTIL_NAV, ToolResultCache, canonical_args, next_nav_publish_time
+
+
+def response(text="ok"):
+    return ToolResponse(content=[{"type": "text", "text": text}])
+
+
+def test_canonical_args_ignores_order_whitespace_and_none():
+    assert canonical_args({"b": " 1 ", "a": 2, "c": None}) == canonical_args({"a": 2, "b": "1"})
+    assert ToolResultCache.make_key("GetNav", {"fundCode": "005827 "}) == ToolResultCache.make_key(
+        "GetNav", {"fundCode": "005827"}
+    )
+
+
+def test_tool_ttls_match_patterns_and_zero_disables_caching():
+    cache = ToolResultCache(default_ttl=60, tool_ttls={"*Nav*": TTL_UNTIL_NAV, "Search*": 0})
+    assert cache.ttl_for("GetFundNavHistory") == TTL_UNTIL_NAV
+    assert cache.ttl_for("GetFundProfile") == 60
+    cache.put("SearchFunds", "k", response())
+    assert cache.lookup("SearchFunds", "k") is None
+    assert cache.misses == 0
+
+
+def test_entries_expire_and_errors_are_not_cached(monkeypatch):
+    cache = ToolResultCache(default_ttl=10)
+    now = [1000.0]
+    monkeypatch.setattr("tool_cache.time.time", lambda: now[0])
+    cache.put("GetFundProfile", "ok", response())
+    cache.put("GetFundProfile", "bad", response("Error: timeout"))
+    assert cache.get("ok").content[0]["text"] == "ok"
+    assert cache.get("bad") is None
+    now[0] += 11
+    assert cache.get("ok") is None
+
+
+def test_lru_evicts_oldest_entry():
+    cache = ToolResultCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put("GetFundProfile", key, response(key))
+    assert cache.get("a") is None
+    assert cache.evictions == 1
+
+
+def test_next_nav_publish_time_skips_weekend():
+    friday_night = datetime.datetime(2024, 5, 3, 22, 0)
+    assert next_nav_publish_time(friday_night) == datetime.datetime(2024, 5, 6, 21, 0)
+
+
+def test_sqlite_layer_is_shared_across_threads(tmp_path):
+    path = str(tmp_path / "tool_results.db")
+    cache = ToolResultCache(sqlite_path=path)
+    asyncio.run(cache.put_async("GetFundProfile", "k", response("persisted")))
+
+    errors = []
+
+    def read():
+        try:
+            fresh = ToolResultCache(sqlite_path=path)
+            assert fresh.get("k").content[0]["text"] == "persisted"
+            assert cache.get("k") is not None
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join()
+    assert errors == []
+
+
+def test_single_flight_is_per_event_loop():
+    from tool_cache import get_single_flight
+
+    async def grab():
+        return get_single_flight({})
+
+    first, second = asyncio.run(grab()), asyncio.run(grab())
+    assert first is not None and first is not second
+    assert get_single_flight({"tool_cache": {"coalesce": False}}) is None
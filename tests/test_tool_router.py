@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("agentscope")
+
+import metrics
+from tool_router import RoutedToolkit
+
+
+def make_tool(name):
+    def tool() -> None:
+        pass
+    tool.__name__ = name
+    tool.__doc__ = f"{name} 工具"
+    return tool
+
+
+def test_full_schemas_ignore_route():
+    toolkit = RoutedToolkit()
+    for name in ("GetFundNav", "GetFundProfile", "SearchFund"):
+        toolkit.register_tool_function(make_tool(name))
+    toolkit.set_route({"GetFundNav"}, saving=100)
+    assert [schema["function"]["name"] for schema in toolkit.get_json_schemas()] == ["GetFundNav"]
+    assert len(toolkit.full_json_schemas()) == 3
+
+
+def test_schema_saving_is_counted_once_per_reasoning_round():
+    toolkit = RoutedToolkit()
+    for name in ("GetFundNav", "GetFundProfile"):
+        toolkit.register_tool_function(make_tool(name))
+    toolkit.set_route({"GetFundNav"}, saving=100)
+    before = metrics.TOOL_SCHEMA_TOKENS_SAVED.value()
+    toolkit.get_json_schemas()
+    toolkit.get_json_schemas()
+    asyncio.run(toolkit.pre_reasoning_hook(None, {}))
+    assert metrics.TOOL_SCHEMA_TOKENS_SAVED.value() - before == 100
+    toolkit.set_route(None)
+    asyncio.run(toolkit.pre_reasoning_hook(None, {}))
+    assert metrics.TOOL_SCHEMA_TOKENS_SAVED.value() - before == 100
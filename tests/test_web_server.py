@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("agentscope")
+from aiohttp.test_utils import TestClient, TestServer, make_mocked_request
+
+import metrics
+import web_server
+from web_server import client_identity
+
+
+def request(headers=None):
+    return make_mocked_request("GET", "/ws", headers=headers or {})
+
+
+def test_client_identity_uses_remote_by_default():
+    req = request({"X-Forwarded-For": "1.1.1.1"})
+    assert client_identity(req, {}) == req.remote
+
+
+def test_client_identity_uses_the_proxy_appended_forwarded_address():
+    config = {"web_server": {"client_id_header": "X-Forwarded-For"}}
+    assert client_identity(request({"X-Forwarded-For": "6.6.6.6, 10.0.0.7"}), config) == "10.0.0.7"
+    assert client_identity(request({"X-Real-IP": "10.0.0.8"}), {"web_server": {"client_id_header": "X-Real-IP"}}) == "10.0.0.8"
+    missing = request()
+    assert client_identity(missing, config) == missing.remote
+
+
+
+def test_disconnect_counts_only_questions_running_the_agent(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    started = asyncio.Event()
+
+    async def slow_main(question, *args, **kwargs):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def no_warmup(self):
+        pass
+
+    monkeypatch.setattr(web_server, "main", slow_main)
+    monkeypatch.setattr(web_server.FundManagerPool, "start", no_warmup)
+    config = {
+        "answer_cache": {"enabled": False},
+        "history": {"enabled": False},
+        "web_server": {"host": "127.0.0.1", "port": 0},
+    }
+
+    async def scenario():
+        app, _ = web_server.create_app(config)
+        async with TestClient(TestServer(app)) as client:
+            ws = await client.ws_connect("/ws")
+            for question in ("第一个问题", "第二个问题"):
+                await ws.send_str(json.dumps({"question": question}))
+            await asyncio.wait_for(started.wait(), 5)
+            # 第二个问题等待同一连接的第一个问题处理完，还没有运行agent
+            await asyncio.sleep(0.1)
+            await ws.close()
+            for _ in range(100):
+                if metrics.AGENT_RUNS_CANCELLED.value(reason="disconnect") != before:
+                    break
+                await asyncio.sleep(0.01)
+
+    before = metrics.AGENT_RUNS_CANCELLED.value(reason="disconnect")
+    asyncio.run(scenario())
+    assert metrics.AGENT_RUNS_CANCELLED.value(reason="disconnect") - before == 1
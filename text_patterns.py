@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+问题文本和问答记录的公共匹配规则
+基金代码、问答记录文件（results/*.md）各部分的正则在工具路由、复杂度路由、多基金拆分、预取和历史记录索引中共用
+"""
+
+import re
+from typing import List
+
+# 文本中的6位基金代码（前后不是数字）
+FUND_CODE = re.compile(r"(?<!\d)\d{6}(?!\d)")
+
+# 问答记录文件中的时间、问题和答案部分
+TIME_SECTION = re.compile(r"\*\*时间\*\*:\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})")
+QUESTION_SECTION = re.compile(r"\*\*问题\*\*:\s*(.*?)\s*\*\*答案\*\*", re.S)
+ANSWER_SECTION = re.compile(r"\*\*答案\*\*:\s*(.*)", re.S)
+
+
+def find_fund_codes(text: str) -> List[str]:
+    """文本中出现的基金代码，按首次出现的顺序去重"""
+    return list(dict.fromkeys(FUND_CODE.findall(text or "")))
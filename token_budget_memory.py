@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+按token预算裁剪的对话记忆
+- 最近K轮对话（从用户提问开始算一轮）原样保留，当前轮无论多长都不裁剪
+- 更早轮次中的工具结果折叠为简短摘要（工具名 + 截断的结果）
+- 折叠后仍超出预算时，从最早的轮次开始整轮丢弃，只保留问题和回答开头作为摘要
+- 每条消息的token数只估算一次并按消息id缓存，每轮推理取记忆时不重新计算整段历史
+
+系统提示词由 ReActAgent 在记忆之外单独拼接，始终完整发送。
+预热池中的助手每个问题前都会清空自身记忆，Web服务为每个连接保存一份对话记忆，回答该连接的问题时交给助手使用
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from agentscope.memory import InMemoryMemory
+from agentscope.message import Msg
+
+import metrics
+
+# 中日韩文字和全角标点，大致每个字符一个token
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+# 每条消息的角色、分隔符等固定开销
+_MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数：中文按每字1个，其余按每4个字符1个
+    不依赖具体模型的分词器，用于预算控制足够
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _block_text(output) -> str:
+    """提取工具结果中的文本"""
+    if isinstance(output, str):
+        return output
+    if isinstance(output, list):
+        return "\n".join(
+            block.get("text", "") if isinstance(block, dict) else str(block)
+            for block in output
+        )
+    return json.dumps(output, ensure_ascii=False, default=str)
+
+
+class TokenBudgetMemory(InMemoryMemory):
+    """按token预算裁剪历史的对话记忆，接口与 InMemoryMemory 一致"""
+
+    def __init__(self, max_tokens=8000, keep_turns=3, tool_result_chars=300, summary_chars=80):
+        """
+        Args:
+            max_tokens: 发送给模型的记忆token预算（不含系统提示词和工具定义）
+            keep_turns: 原样保留的最近轮数（含当前轮）
+            tool_result_chars: 更早轮次中每个工具结果保留的字符数
+            summary_chars: 被丢弃的轮次在摘要中保留的问题/回答字符数
+        """
+        super().__init__()
+        self.max_tokens = max_tokens
+        self.keep_turns = max(keep_turns, 1)
+        self.tool_result_chars = tool_result_chars
+        self.summary_chars = summary_chars
+
+        # 消息id -> token数，原样消息和折叠后的消息分别缓存
+        self._tokens: Dict[str, int] = {}
+        self._compact: Dict[str, Tuple[Msg, int]] = {}
+
+        self.compacted = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_config(cls, config) -> "TokenBudgetMemory":
+        """根据 config["memory"] 创建记忆"""
+        memory_config = (config or {}).get("memory", {})
+        return cls(
+            max_tokens=memory_config.get("max_tokens", 8000),
+            keep_turns=memory_config.get("keep_turns", 3),
+            tool_result_chars=memory_config.get("tool_result_chars", 300),
+            summary_chars=memory_config.get("summary_chars", 80),
+        )
+
+    @staticmethod
+    def _count(msg: Msg) -> int:
+        content = msg.content if isinstance(msg.content, str) else json.dumps(msg.content, ensure_ascii=False, default=str)
+        return estimate_tokens(content) + _MESSAGE_OVERHEAD
+
+    def _tokens_of(self, msg: Msg) -> int:
+        tokens = self._tokens.get(msg.id)
+        if tokens is None:
+            tokens = self._tokens[msg.id] = self._count(msg)
+        return tokens
+
+    def _compacted(self, msg: Msg) -> Tuple[Msg, int]:
+        """折叠消息中的工具结果，返回 (折叠后的消息, token数)，没有工具结果时原样返回"""
+        cached = self._compact.get(msg.id)
+        if cached is not None:
+            return cached
+
+        if isinstance(msg.content, str) or not any(
+            block.get("type") == "tool_result" for block in msg.content
+        ):
+            result = (msg, self._tokens_of(msg))
+        else:
+            blocks = []
+            for block in msg.content:
+                if block.get("type") == "tool_result":
+                    text = _block_text(block.get("output"))
+                    if len(text) > self.tool_result_chars:
+                        text = f"{text[:self.tool_result_chars]}…（已省略{len(text) - self.tool_result_chars}字）"
+                    block = {**block, "output": f"[{block.get('name', '')} 结果摘要] {text}"}
+                blocks.append(block)
+            compact = Msg(msg.name, blocks, msg.role, metadata=msg.metadata, timestamp=msg.timestamp)
+            compact.id = msg.id
+            result = (compact, self._count(compact))
+        self._compact[msg.id] = result
+        return result
+
+    def _split_turns(self, content: List[Tuple[Msg, List[str]]]) -> Tuple[List[Msg], List[List[Msg]]]:
+        """
+        按用户提问切分轮次
+
+        Returns:
+            tuple: (固定保留的系统消息, 各轮消息列表)
+        """
+        pinned: List[Msg] = []
+        turns: List[List[Msg]] = []
+        for msg, marks in content:
+            is_tool_result = not isinstance(msg.content, str) and any(
+                block.get("type") == "tool_result" for block in msg.content
+            )
+            if msg.role == "system" and not is_tool_result:
+                pinned.append(msg)
+            elif msg.role == "user" and not marks:
+                # 带标记的用户消息（如推理提示）属于当前轮，不开始新的一轮
+                turns.append([msg])
+            elif turns:
+                turns[-1].append(msg)
+            else:
+                turns.append([msg])
+        return pinned, turns
+
+    def _summarize(self, turns: List[List[Msg]]) -> str:
+        """被丢弃轮次的摘要：每轮保留问题和最终回答的开头"""
+        lines = []
+        for turn in turns:
+            question = turn[0].get_text_content() or ""
+            answer = next((m.get_text_content() for m in reversed(turn) if m.role == "assistant" and m.get_text_content()), "")
+            line = f"- 问：{question[:self.summary_chars]}"
+            if answer:
+                line += f" / 答：{answer[:self.summary_chars]}"
+            lines.append(line)
+        return "以下是更早对话的摘要：\n" + "\n".join(lines)
+
+    async def get_memory(
+        self,
+        mark: Optional[str] = None,
+        exclude_mark: Optional[str] = None,
+        prepend_summary: bool = True,
+        **kwargs: Any,
+    ) -> List[Msg]:
+        """
+        获取记忆：按标记查询时返回全部匹配消息，否则按token预算裁剪后返回
+        """
+        if mark is not None:
+            return await super().get_memory(mark=mark, exclude_mark=exclude_mark, prepend_summary=prepend_summary, **kwargs)
+
+        content = [(msg, marks) for msg, marks in self.content if exclude_mark is None or exclude_mark not in marks]
+        pinned, turns = self._split_turns(content)
+        recent, older = turns[-self.keep_turns:], turns[:-self.keep_turns]
+
+        budget = self.max_tokens - sum(self._tokens_of(m) for m in pinned)
+        budget -= sum(self._tokens_of(m) for turn in recent for m in turn)
+
+        # 从最近的旧轮次往前，折叠工具结果后能放下就保留，放不下则连同更早的轮次一起丢弃
+        kept: List[List[Msg]] = []
+        dropped: List[List[Msg]] = []
+        self.compacted = 0
+        for index in range(len(older) - 1, -1, -1):
+            compacted = [self._compacted(m) for m in older[index]]
+            cost = sum(tokens for _, tokens in compacted)
+            if cost > budget:
+                dropped = older[:index + 1]
+                break
+            budget -= cost
+            kept.insert(0, [m for m, _ in compacted])
+            self.compacted += sum(1 for original, (m, _) in zip(older[index], compacted) if m is not original)
+        self.dropped = len(dropped)
+
+        messages: List[Msg] = list(pinned)
+        summary = "\n".join(s for s in (self._compressed_summary, self._summarize(dropped) if dropped else "") if s)
+        if prepend_summary and summary:
+            messages.append(Msg("user", summary, "user"))
+        for turn in kept + recent:
+            messages.extend(turn)
+
+        metrics.MEMORY_TOKENS.observe(self.max_tokens - budget)
+        return messages
+
+    def _prune(self) -> None:
+        """清理已删除消息的token缓存"""
+        ids = {msg.id for msg, _ in self.content}
+        self._tokens = {k: v for k, v in self._tokens.items() if k in ids}
+        self._compact = {k: v for k, v in self._compact.items() if k in ids}
+
+    async def delete(self, msg_ids: List[str], **kwargs: Any) -> int:
+        removed = await super().delete(msg_ids, **kwargs)
+        self._prune()
+        return removed
+
+    async def delete_by_mark(self, mark, **kwargs: Any) -> int:
+        removed = await super().delete_by_mark(mark, **kwargs)
+        self._prune()
+        return removed
+
+    async def clear(self) -> None:
+        await super().clear()
+        self._tokens.clear()
+        self._compact.clear()
+
+    def truncate(self, size: int) -> None:
+        """只保留前 size 条消息，用于撤回被取消或失败的问题留下的不完整一轮"""
+        if len(self.content) > size:
+            del self.content[size:]
+            self._prune()
+
+    async def remember(self, question: str, answer: str) -> None:
+        """把未经agent得到的回答（如命中问答缓存）记为一轮对话，后续追问可以引用"""
+        await self.add([Msg("user", question, "user"), Msg("FundManager", answer, "assistant")])
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息：当前消息数、已估算的总token数、最近一次取记忆时折叠的消息数和丢弃的轮数"""
+        return {
+            "messages": len(self.content),
+            "tokens": sum(self._tokens_of(msg) for msg, _ in self.content),
+            "compacted": self.compacted,
+            "dropped_turns": self.dropped,
+        }
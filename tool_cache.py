@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+MCP工具调用结果缓存
+基金净值、规模、持有人结构等数据每个交易日最多更新一次，按 工具名+规范化参数 缓存调用结果，
+内存LRU层 + 可选SQLite持久层，节省响应时间和MCP调用额度。
+SQLite连接可在多个线程中使用（由锁串行化），工具调用层写入持久层时放到线程池执行，不阻塞事件循环
+"""
+
+import asyncio
+import datetime
+import fnmatch
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Dict, Any, Optional
+
+from agentscope.tool import ToolResponse
+
+from loop_local import LoopLocal
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# 特殊TTL：有效期到下一次净值发布时间
+TTL_UNTIL_NAV = "nav"
+
+
+def canonical_args(kwargs: Dict[str, Any]) -> str:
+    """规范化工具参数：去掉空值、去除字符串首尾空白、按键排序"""
+    def normalize(value):
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, dict):
+            return {k: normalize(v) for k, v in value.items() if v is not None}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+
+    return json.dumps(
+        normalize(kwargs or {}),
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+
+
+def next_nav_publish_time(now: datetime.datetime, publish_time: str = "21:00") -> datetime.datetime:
+    """计算下一次净值发布时间（交易日晚间，周末顺延到下周一）"""
+    hour, minute = (int(x) for x in publish_time.split(":"))
+    candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if candidate <= now:
+        candidate += datetime.timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate += datetime.timedelta(days=1)
+    return candidate
+
+
+def _is_error_response(response: ToolResponse) -> bool:
+    """调用失败的结果不缓存"""
+    for block in response.content or []:
+        if block.get("type") == "text" and str(block.get("text", "")).startswith("Error"):
+            return True
+    return False
+
+
+class ToolResultCache:
+    """MCP工具调用结果缓存，支持按工具配置TTL"""
+
+    def __init__(
+        self,
+        max_entries=1000,
+        default_ttl=600,
+        tool_ttls=None,
+        nav_publish_time="21:00",
+        sqlite_path=None,
+    ):
+        """
+        Args:
+            max_entries: 内存LRU层最多缓存的条目数
+            default_ttl: 未单独配置的工具使用的TTL（秒）
+            tool_ttls: 按工具名（支持通配符）配置的TTL，值为秒数、"nav"（到下一次净值发布）或0（不缓存）
+            nav_publish_time: 每日净值发布时间，格式 HH:MM
+            sqlite_path: SQLite持久层路径，为空时只使用内存缓存
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.tool_ttls = tool_ttls or {}
+        self.nav_publish_time = nav_publish_time
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._db = None
+        self._lock = threading.Lock()
+        if sqlite_path:
+            self._db = self._open_db(sqlite_path)
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config) -> Optional["ToolResultCache"]:
+        """根据 config["tool_cache"] 创建缓存，未启用时返回None"""
+        cache_config = (config or {}).get("tool_cache", {})
+        if not cache_config.get("enabled", True):
+            return None
+        return cls(
+            max_entries=cache_config.get("max_entries", 1000),
+            default_ttl=cache_config.get("default_ttl", 600),
+            tool_ttls=cache_config.get("tool_ttls"),
+            nav_publish_time=cache_config.get("nav_publish_time", "21:00"),
+            sqlite_path=cache_config.get("sqlite_path"),
+        )
+
+    @staticmethod
+    def _open_db(path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Web服务每次启动都在新的线程中运行，写入也在线程池中执行，连接不绑定创建它的线程
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS tool_results ("
+            "key TEXT PRIMARY KEY, tool TEXT, expires_at REAL, value TEXT)"
+        )
+        db.execute("DELETE FROM tool_results WHERE expires_at <= ?", (time.time(),))
+        db.commit()
+        return db
+
+    def ttl_for(self, tool_name: str):
+        """返回工具的TTL配置"""
+        for pattern, ttl in self.tool_ttls.items():
+            if fnmatch.fnmatchcase(tool_name, pattern):
+                return ttl
+        return self.default_ttl
+
+    def expires_at(self, tool_name: str) -> Optional[float]:
+        """计算结果的过期时间戳，返回None表示该工具不缓存"""
+        ttl = self.ttl_for(tool_name)
+        if ttl == TTL_UNTIL_NAV:
+            now = datetime.datetime.now()
+            return next_nav_publish_time(now, self.nav_publish_time).timestamp()
+        if not ttl or ttl <= 0:
+            return None
+        return time.time() + ttl
+
+    @staticmethod
+    def make_key(tool_name: str, kwargs: Dict[str, Any]) -> str:
+        return f"{tool_name}:{canonical_args(kwargs)}"
+
+    def lookup(self, tool_name: str, key: str) -> Optional[ToolResponse]:
+        """查询缓存，不缓存的工具直接返回None且不计入未命中"""
+        if not self.ttl_for(tool_name):
+            return None
+        return self.get(key)
+
+    def get(self, key: str) -> Optional[ToolResponse]:
+        """查询缓存，先查内存层，再查SQLite层"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._to_response(value)
+            del self._memory[key]
+
+        if self._db is not None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT expires_at, value FROM tool_results WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+            if row is not None:
+                value = json.loads(row[1])
+                self._remember(key, row[0], value)
+                self.hits += 1
+                self.persistent_hits += 1
+                return self._to_response(value)
+
+        self.misses += 1
+        return None
+
+    def contains(self, key: str) -> bool:
+        """缓存中是否有未过期的结果，不计入命中统计"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None and entry[0] > now:
+            return True
+        if self._db is not None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT 1 FROM tool_results WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            return row is not None
+        return False
+
+    def put(self, tool_name: str, key: str, response: ToolResponse) -> None:
+        """写入缓存，失败结果和不缓存的工具会被忽略"""
+        entry = self._put_memory(tool_name, key, response)
+        if entry is not None and self._db is not None:
+            self._persist(tool_name, key, *entry)
+
+    async def put_async(self, tool_name: str, key: str, response: ToolResponse) -> None:
+        """同 put，SQLite持久层的写入在线程池中执行，写入失败只记录日志"""
+        entry = self._put_memory(tool_name, key, response)
+        if entry is None or self._db is None:
+            return
+        try:
+            await asyncio.to_thread(self._persist, tool_name, key, *entry)
+        except sqlite3.Error as e:
+            logger.warning(f"写入工具结果持久缓存失败 {tool_name}: {str(e)}")
+
+    def _put_memory(self, tool_name: str, key: str, response: ToolResponse) -> Optional[tuple]:
+        """写入内存层，返回 (过期时间, 缓存值)；不缓存时返回None"""
+        expires_at = self.expires_at(tool_name)
+        if expires_at is None or _is_error_response(response):
+            return None
+        value = {
+            "content": deepcopy(response.content),
+            "metadata": deepcopy(response.metadata),
+        }
+        self._remember(key, expires_at, value)
+        return expires_at, value
+
+    def _persist(self, tool_name: str, key: str, expires_at: float, value: Dict[str, Any]) -> None:
+        text = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tool_results (key, tool, expires_at, value) VALUES (?, ?, ?, ?)",
+                (key, tool_name, expires_at, text),
+            )
+            self._db.commit()
+
+    def _remember(self, key, expires_at, value) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _to_response(value) -> ToolResponse:
+        return ToolResponse(
+            content=deepcopy(value["content"]),
+            metadata=deepcopy(value["metadata"]),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def install_tool_cache(toolkit, cache: Optional[ToolResultCache], flight: Optional[SingleFlight] = None) -> None:
+    """
+    为工具集中已注册的MCP工具套上结果缓存和并发合并层，重复调用不会重复包装
+
+    Args:
+        toolkit: 工具集
+        cache: 工具结果缓存，为None时不缓存
+        flight: 并发合并表，为None时不合并相同的并发调用
+    """
+    if cache is None and flight is None:
+        return
+    for name, tool in toolkit.tools.items():
+        layers = getattr(tool.original_func, "__tool_layers__", set())
+        if tool.mcp_name is None or "cache" in layers:
+            continue
+        tool.original_func = _wrap(cache, flight, name, tool.original_func)
+
+
+def _wrap(cache, flight, tool_name, func):
+    async def call_tool(**kwargs):
+        key = ToolResultCache.make_key(tool_name, kwargs)
+        if cache is not None:
+            cached = cache.lookup(tool_name, key)
+            if cached is not None:
+                return cached
+
+        async def fetch():
+            response = await func(**kwargs)
+            if cache is not None:
+                await cache.put_async(tool_name, key, response)
+            return response
+
+        if flight is None:
+            return await fetch()
+        # 合并后的结果由多个等待方共享，各自返回独立的副本
+        response = await flight.do(key, fetch)
+        return ToolResponse(content=deepcopy(response.content), metadata=deepcopy(response.metadata))
+
+    call_tool.__tool_layers__ = getattr(func, "__tool_layers__", set()) | {"cache"}
+    return call_tool
+
+
+# 进程内共享的缓存实例，所有基金管理助手共用；并发合并表持有进行中的任务，按事件循环区分
+_caches: Dict[str, ToolResultCache] = {}
+_flights = LoopLocal()
+
+
+def get_tool_cache(config) -> Optional[ToolResultCache]:
+    """获取进程内共享的工具结果缓存"""
+    cache_config = (config or {}).get("tool_cache", {})
+    key = json.dumps(cache_config, sort_keys=True)
+    if key not in _caches:
+        _caches[key] = ToolResultCache.from_config(config)
+    return _caches[key]
+
+
+def get_single_flight(config) -> Optional[SingleFlight]:
+    """获取当前事件循环共享的工具调用并发合并表，config["tool_cache"]["coalesce"] 为false时关闭"""
+    if not (config or {}).get("tool_cache", {}).get("coalesce", True):
+        return None
+    return _flights.get("tool_calls", SingleFlight)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+MCP工具结果精简
+完整持仓列表、长净值序列、持有人结构表等JSON结果原样进入下一轮推理会显著增加提示词长度。
+工具结果返回给模型前按工具配置做字段投影、行数限制（超出部分用统计摘要代替）和数值取整；
+原始结果保存在 ToolResponse.metadata["raw_content"] 中，工具结果缓存中保存的也是原始结果，可供本地计算使用
+"""
+
+import datetime
+import fnmatch
+import json
+import logging
+import math
+from copy import deepcopy
+from typing import Dict, Any, List, Optional
+
+from agentscope.tool import ToolResponse
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_DATE_FORMATS = ("%Y-%m-%d", "%Y%m%d", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S")
+
+
+def parse_date(value) -> Optional[datetime.date]:
+    """解析常见格式的日期字符串，无法解析时返回None"""
+    if not isinstance(value, str):
+        return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _text_bytes(content) -> int:
+    return sum(len(str(block.get("text", "")).encode("utf-8")) for block in content or [] if block.get("type") == "text")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def series_stats(rows: List[Dict[str, Any]], decimals: int = 4) -> Dict[str, Any]:
+    """
+    统计行列表中各数值列：最小、最大、首个、最后、区间变化，有日期列时按日期排序并计算年化增长率
+
+    Returns:
+        dict: {"date_field", "start", "end", "columns": {列名: {...}}}
+    """
+    date_field = None
+    for key, value in rows[0].items():
+        if parse_date(value) is not None:
+            date_field = key
+            break
+
+    stats: Dict[str, Any] = {}
+    years = None
+    if date_field is not None:
+        dated = [(row, parse_date(row.get(date_field))) for row in rows]
+        dated = [(row, date) for row, date in dated if date is not None]
+        dated.sort(key=lambda item: item[1])
+        rows = [row for row, _ in dated]
+        if dated:
+            stats.update(date_field=date_field, start=dated[0][1].isoformat(), end=dated[-1][1].isoformat())
+            years = (dated[-1][1] - dated[0][1]).days / 365.25
+
+    columns = {}
+    for key in rows[0] if rows else ():
+        values = [row.get(key) for row in rows if _is_number(row.get(key))]
+        if not values or key == date_field:
+            continue
+        column = {
+            "min": round(min(values), decimals),
+            "max": round(max(values), decimals),
+            "first": round(values[0], decimals),
+            "last": round(values[-1], decimals),
+        }
+        if values[0] > 0:
+            column["change"] = round(values[-1] / values[0] - 1, decimals)
+            if years and years >= 0.1 and values[-1] > 0:
+                column["cagr"] = round((values[-1] / values[0]) ** (1 / years) - 1, decimals)
+        columns[key] = column
+    stats["columns"] = columns
+    return stats
+
+
+class ToolResultCompactor:
+    """按工具配置精简工具返回的JSON结果"""
+
+    def __init__(self, max_rows=20, decimals=4, min_bytes=2048, tools=None):
+        """
+        Args:
+            max_rows: 列表最多保留的行数，超出部分用统计摘要代替
+            decimals: 小数保留位数
+            min_bytes: 结果小于该字节数时不精简
+            tools: 按工具名（支持通配符*）的单独配置：{"fields": [...], "max_rows": n, "decimals": n}
+        """
+        self.max_rows = max_rows
+        self.decimals = decimals
+        self.min_bytes = min_bytes
+        self.tools = tools or {}
+
+        self.compacted = 0
+        self.bytes_saved = 0
+
+    @classmethod
+    def from_config(cls, config) -> Optional["ToolResultCompactor"]:
+        """根据 config["tool_compaction"] 创建，未启用时返回None"""
+        compaction_config = (config or {}).get("tool_compaction", {})
+        if not compaction_config.get("enabled", True):
+            return None
+        return cls(
+            max_rows=compaction_config.get("max_rows", 20),
+            decimals=compaction_config.get("decimals", 4),
+            min_bytes=compaction_config.get("min_bytes", 2048),
+            tools=compaction_config.get("tools"),
+        )
+
+    def rule_for(self, tool_name: str) -> Dict[str, Any]:
+        """返回工具的精简配置，未单独配置的使用默认值"""
+        rule = {"fields": None, "max_rows": self.max_rows, "decimals": self.decimals}
+        for pattern, override in self.tools.items():
+            if fnmatch.fnmatchcase(tool_name, pattern):
+                rule.update(override)
+                break
+        return rule
+
+    def compact_value(self, value, rule: Dict[str, Any]):
+        """递归精简JSON值：字段投影、行数限制、数值取整"""
+        fields = rule.get("fields")
+        if isinstance(value, dict):
+            return {
+                key: self.compact_value(item, rule)
+                for key, item in value.items()
+                if not fields or key in fields
+            }
+        if isinstance(value, list):
+            items = [self.compact_value(item, rule) for item in value]
+            max_rows = rule.get("max_rows")
+            if not max_rows or len(items) <= max_rows:
+                return items
+            result = {"total_rows": len(items), "shown_rows": max_rows}
+            rows = items[:max_rows]
+            if all(isinstance(item, dict) for item in items):
+                result["stats"] = series_stats(items, rule.get("decimals", self.decimals))
+                # 按日期升序排列的序列保留最近的行
+                date_field = result["stats"].get("date_field")
+                if date_field is not None:
+                    first, last = parse_date(items[0].get(date_field)), parse_date(items[-1].get(date_field))
+                    if first and last and last > first:
+                        rows = items[-max_rows:]
+            result["rows"] = rows
+            return result
+        if isinstance(value, float) and rule.get("decimals") is not None:
+            return round(value, rule["decimals"])
+        return value
+
+    def compact(self, tool_name: str, response: ToolResponse) -> ToolResponse:
+        """
+        精简工具结果，非JSON文本和较小的结果原样返回
+
+        Returns:
+            ToolResponse: 精简后的结果，metadata["raw_content"] 为原始结果
+        """
+        raw_size = _text_bytes(response.content)
+        if raw_size < self.min_bytes:
+            return response
+
+        rule = self.rule_for(tool_name)
+        content = []
+        changed = False
+        for block in response.content or []:
+            if block.get("type") != "text":
+                content.append(block)
+                continue
+            try:
+                data = json.loads(block.get("text", ""))
+            except (TypeError, ValueError):
+                content.append(block)
+                continue
+            text = json.dumps(self.compact_value(data, rule), ensure_ascii=False, separators=(",", ":"))
+            content.append({**block, "text": text})
+            changed = True
+
+        if not changed:
+            return response
+
+        compacted_size = _text_bytes(content)
+        if compacted_size >= raw_size:
+            return response
+        self.compacted += 1
+        self.bytes_saved += raw_size - compacted_size
+        metrics.TOOL_RESULT_BYTES_SAVED.inc(raw_size - compacted_size, tool=tool_name)
+        logger.debug(f"工具结果精简 {tool_name}: {raw_size} -> {compacted_size} 字节")
+
+        metadata = dict(response.metadata or {})
+        metadata["raw_content"] = deepcopy(response.content)
+        return ToolResponse(content=content, metadata=metadata)
+
+    def stats(self) -> Dict[str, Any]:
+        """精简统计"""
+        return {"compacted": self.compacted, "bytes_saved": self.bytes_saved}
+
+
+def install_tool_compaction(toolkit, compactor: Optional[ToolResultCompactor]) -> None:
+    """为MCP工具套上结果精简层，重复调用不会重复包装"""
+    if compactor is None:
+        return
+    for name, tool in toolkit.tools.items():
+        layers = getattr(tool.original_func, "__tool_layers__", set())
+        if tool.mcp_name is None or "compact" in layers:
+            continue
+        tool.original_func = _wrap(compactor, name, tool.original_func)
+
+
+def _wrap(compactor, tool_name, func):
+    async def call_tool(**kwargs):
+        return compactor.compact(tool_name, await func(**kwargs))
+
+    call_tool.__tool_layers__ = getattr(func, "__tool_layers__", set()) | {"compact"}
+    return call_tool
+
+
+# 进程内共享的精简器，所有基金管理助手共用
+_compactors: Dict[str, Optional[ToolResultCompactor]] = {}
+
+
+def get_tool_compactor(config) -> Optional[ToolResultCompactor]:
+    """获取进程内共享的工具结果精简器"""
+    compaction_config = (config or {}).get("tool_compaction", {})
+    key = json.dumps(compaction_config, sort_keys=True)
+    if key not in _compactors:
+        _compactors[key] = ToolResultCompactor.from_config(config)
+    return _compactors[key]
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+按问题挑选相关工具
+qieman-mcp 提供的工具较多，全部工具的Schema每轮推理都会发送给模型。
+回答问题前根据工具名称和描述建立的关键词索引、分类索引，只向模型提供与问题相关的工具；
+模型调用了未提供的工具时，本次问题余下的推理改为提供全部工具
+"""
+
+import logging
+import math
+import re
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Set
+
+from agentscope.tool import Toolkit
+
+import metrics
+from text_patterns import FUND_CODE
+from token_budget_memory import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 工具分类及其关键词：问题命中分类关键词时，优先提供描述中含有这些关键词的工具
+DEFAULT_CATEGORIES = {
+    "净值": ["净值", "涨跌", "涨幅", "跌幅", "走势", "收益", "nav"],
+    "业绩": ["业绩", "收益率", "回报", "排名", "年化", "performance", "return"],
+    "风险": ["风险", "回撤", "波动", "夏普", "risk"],
+    "持仓": ["持仓", "重仓", "股票", "债券", "行业", "资产配置", "holding", "position"],
+    "持有人": ["持有人", "机构", "个人投资者", "份额", "holder"],
+    "经理": ["经理", "基金公司", "管理人", "manager"],
+    "规模": ["规模", "资产", "scale"],
+    "费率": ["费率", "费用", "申购", "赎回", "fee"],
+    "分红": ["分红", "拆分", "dividend"],
+    "搜索": ["搜索", "查找", "查询基金", "代码", "名称", "search"],
+    "推荐": ["推荐", "筛选", "选基", "对比", "比较", "recommend"],
+}
+
+_ASCII_WORD = re.compile(r"[a-z0-9]+")
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]+")
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+# 问题中没有基金代码时需要先按名称搜索基金
+SEARCH_CATEGORY = "搜索"
+
+
+def extract_terms(text: str) -> Set[str]:
+    """提取检索词：英文按单词（拆分驼峰命名），中文按相邻两字"""
+    text = _CAMEL.sub(" ", text or "").lower()
+    terms = {word for word in _ASCII_WORD.findall(text) if len(word) > 1}
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.add(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class ToolRouter:
+    """根据工具描述建立索引，为每个问题挑选相关的工具子集"""
+
+    def __init__(self, schemas: List[Dict[str, Any]], max_tools=12, always_include=None, categories=None):
+        """
+        Args:
+            schemas: 全部工具的JSON Schema
+            max_tools: 每个问题最多提供的工具数
+            always_include: 始终提供的工具名
+            categories: 分类名 -> 关键词列表，与默认分类合并
+        """
+        self.max_tools = max_tools
+        self.always_include = [name for name in (always_include or []) if name]
+        self.categories = {**DEFAULT_CATEGORIES, **(categories or {})}
+
+        self.tool_names: List[str] = []
+        self.schema_tokens: Dict[str, int] = {}
+        # 检索词 -> 工具名；分类名 -> 工具名
+        self.term_index: Dict[str, Set[str]] = defaultdict(set)
+        self.category_index: Dict[str, Set[str]] = defaultdict(set)
+
+        for schema in schemas:
+            function = schema["function"]
+            name = function["name"]
+            text = f"{name} {function.get('description', '')}"
+            self.tool_names.append(name)
+            self.schema_tokens[name] = estimate_tokens(str(schema))
+            for term in extract_terms(text):
+                self.term_index[term].add(name)
+            lowered = text.lower()
+            for category, keywords in self.categories.items():
+                if any(keyword.lower() in lowered for keyword in keywords):
+                    self.category_index[category].add(name)
+
+        self.full_tokens = sum(self.schema_tokens.values())
+
+    @classmethod
+    def from_config(cls, config, schemas: List[Dict[str, Any]]) -> Optional["ToolRouter"]:
+        """根据 config["tool_router"] 创建路由，未启用时返回None"""
+        router_config = (config or {}).get("tool_router", {})
+        if not router_config.get("enabled", True):
+            return None
+        return cls(
+            schemas,
+            max_tools=router_config.get("max_tools", 12),
+            always_include=router_config.get("always_include"),
+            categories=router_config.get("categories"),
+        )
+
+    def route(self, question: str) -> Optional[Set[str]]:
+        """
+        挑选与问题相关的工具
+
+        Returns:
+            set: 工具名集合；工具数不超过上限或没有匹配到任何工具时返回None，表示提供全部工具
+        """
+        if len(self.tool_names) <= self.max_tools:
+            return None
+
+        scores: Dict[str, float] = defaultdict(float)
+        # 关键词：越少工具含有的词权重越高
+        for term in extract_terms(question):
+            names = self.term_index.get(term)
+            if names:
+                weight = math.log(1 + len(self.tool_names) / len(names))
+                for name in names:
+                    scores[name] += weight
+        # 分类：问题命中分类关键词时，该分类下的工具加分
+        lowered = (question or "").lower()
+        for category, keywords in self.categories.items():
+            if any(keyword.lower() in lowered for keyword in keywords):
+                for name in self.category_index.get(category, ()):
+                    scores[name] += 1.0
+
+        if not scores:
+            return None
+        if not FUND_CODE.search(question):
+            for name in self.category_index.get(SEARCH_CATEGORY, ()):
+                scores[name] += 1.0
+
+        selected = [name for name in self.always_include if name in self.schema_tokens]
+        for name in sorted(scores, key=lambda n: (-scores[n], self.tool_names.index(n))):
+            if len(selected) >= self.max_tools:
+                break
+            if name not in selected:
+                selected.append(name)
+        return set(selected)
+
+    def routed_tokens(self, tools: Optional[Set[str]]) -> int:
+        """工具子集的Schema估算token数，None表示全部工具"""
+        if tools is None:
+            return self.full_tokens
+        return sum(self.schema_tokens.get(name, 0) for name in tools)
+
+
+class RoutedToolkit(Toolkit):
+    """
+    支持按问题限定工具子集的工具集
+    设置 route 后 get_json_schemas 只返回子集中的工具；模型调用子集外的工具时照常执行，
+    并取消限定，之后的推理轮次提供全部工具
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.route: Optional[Set[str]] = None
+        self.route_saving = 0
+        self.route_fallbacks = 0
+
+    def set_route(self, tools: Optional[Set[str]], saving: int = 0) -> None:
+        """
+        限定提供给模型的工具
+
+        Args:
+            tools: 工具名集合，None表示提供全部工具
+            saving: 与提供全部工具相比，每轮推理少发送的估算token数
+        """
+        self.route = tools
+        self.route_saving = saving if tools is not None else 0
+
+    def full_json_schemas(self) -> List[dict]:
+        """不受 route 限定的全部工具Schema，用于建立工具路由索引"""
+        return super().get_json_schemas()
+
+    def get_json_schemas(self) -> List[dict]:
+        schemas = self.full_json_schemas()
+        if self.route is None:
+            return schemas
+        return [schema for schema in schemas if schema["function"]["name"] in self.route]
+
+    async def pre_reasoning_hook(self, agent, kwargs):
+        """pre_reasoning 钩子：每轮推理累计一次按路由少发送的Schema token数"""
+        if self.route is not None:
+            metrics.TOOL_SCHEMA_TOKENS_SAVED.inc(self.route_saving)
+        return None
+
+    async def call_tool_function(self, tool_call):
+        if self.route is not None and tool_call["name"] in self.tools and tool_call["name"] not in self.route:
+            logger.info(f"模型调用了未提供的工具 {tool_call['name']}，本次问题改为提供全部工具")
+            self.set_route(None)
+            self.route_fallbacks += 1
+            metrics.TOOL_ROUTER_FALLBACKS.inc()
+        return await super().call_tool_function(tool_call)
@@ -2,6 +2,7 @@
 """
 基金管理助手Web界面
 """
+import asyncio
 import json
 import sys
 import os
@@ -10,7 +11,23 @@ from aiohttp.web import middleware
 import logging
 import argparse
 
-from qieman_mcp import main
+from qieman_mcp import main, ERROR_PREFIX
+from fund_manager_pool import FundManagerPool
+from answer_cache import AnswerCache
+from token_budget_memory import TokenBudgetMemory
+from scheduler import QuestionScheduler, QueueFullError
+from mcp_session_pool import get_session_pool, close_session_pools
+from batch import parse_questions, parse_jsonl, run_batch
+from tool_cache import get_tool_cache, get_single_flight
+from nav_store import get_nav_store, close_nav_stores
+from fund_resolver import get_fund_resolver
+from hedged_model import endpoint_stats
+from complexity_router import get_complexity_router
+from fan_out import get_fan_out_planner, close_fan_out_planners
+from history_store import HistoryStore
+from speculative_prefetch import get_speculative_prefetcher
+from prefetch import PrefetchScheduler
+import metrics
 
 
 def load_config():
@@ -88,6 +105,24 @@ logger = setup_logging()
 # 存储WebSocket连接
 active_connections = set()
 
+# 基金管理助手预热池
+fund_pool_key = web.AppKey("fund_pool", FundManagerPool)
+
+# 应用配置
+config_key = web.AppKey("config", dict)
+
+# 问答结果缓存
+answer_cache_key = web.AppKey("answer_cache", AnswerCache)
+
+# 问题调度器
+scheduler_key = web.AppKey("scheduler", QuestionScheduler)
+# 同时处理的批量问答请求数上限
+batch_slots_key = web.AppKey("batch_slots", asyncio.Semaphore)
+# 关注基金数据预取任务，未启用时为None
+prefetch_key = web.AppKey("prefetch", PrefetchScheduler)
+# 问答历史记录索引，未启用时为None
+history_store_key = web.AppKey("history_store", HistoryStore)
+
 @middleware
 async def cors_middleware(request, handler):
     """处理CORS跨域请求"""
@@ -97,66 +132,201 @@ async def cors_middleware(request, handler):
     response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
     return response
 
+def client_identity(request, config):
+    """
+    调度器按客户端轮转排队使用的客户端标识
+    部署在反向代理之后时 request.remote 都是代理的地址，配置 web_server.client_id_header 后改用代理写入的请求头；
+    X-Forwarded-For 取最后一个地址（由可信代理追加，客户端无法伪造）。请求头缺失时仍使用 request.remote
+    """
+    header = config.get('web_server', {}).get('client_id_header')
+    if header:
+        value = request.headers.get(header, '')
+        if header.lower() == 'x-forwarded-for':
+            value = value.split(',')[-1]
+        value = value.strip()
+        if value:
+            return value
+    return request.remote
+
 async def websocket_handler(request, config):
     """处理WebSocket连接"""
-    ws = web.WebSocketResponse()
+    server_config = config.get('web_server', {})
+    # 单个问题的处理时限（秒），不含排队时间；0表示不限制
+    question_timeout = server_config.get('question_timeout', 300) or None
+    # 心跳用于及时发现已断开但未正常关闭的连接
+    ws = web.WebSocketResponse(heartbeat=server_config.get('ws_heartbeat', 30) or None)
     await ws.prepare(request)
     
     active_connections.add(ws)
+    metrics.WS_CONNECTIONS.inc()
     logger.info("WebSocket连接已建立")
     
+    # 同一连接的问题按收到的顺序依次处理
+    connection_lock = asyncio.Lock()
+    # 正在处理或排队的问题，连接断开时取消
+    pending = set()
+    # 已获得处理名额、正在运行agent的问题任务（排队中的问题不算）
+    agent_runs = set()
+    # 连接内的多轮对话记忆，按token预算裁剪；助手每个问题前会清空自身记忆，对话上下文由连接保存
+    conversation = (
+        TokenBudgetMemory.from_config(config)
+        if config.get('memory', {}).get('per_connection', True) else None
+    )
+    
+    async def answer_question(question, force_refresh):
+        """回答一个问题，结果通过连接推送"""
+        async with connection_lock:
+            answer_cache = request.app[answer_cache_key]
+            # 追问依赖本连接之前的对话，回答不能与其他连接共用，不读写问答缓存
+            if conversation is not None and conversation.content:
+                answer_cache = None
+            cached = None
+            if answer_cache is not None and not force_refresh:
+                cached = answer_cache.get(question)
+
+            if cached is not None:
+                # 命中问答缓存，直接返回
+                logger.info(f"命中问答缓存，缓存时间: {cached['cached_at']}")
+                metrics.WS_QUESTIONS.inc(outcome='cached')
+                if conversation is not None:
+                    await conversation.remember(question, cached['answer'])
+                if ws in active_connections:
+                    await ws.send_str(json.dumps({
+                        'type': 'result',
+                        'response': cached['answer'],
+                        'cached_at': cached['cached_at']
+                    }))
+            else:
+                # 发送开始处理信号
+                if ws in active_connections:
+                    await ws.send_str(json.dumps({
+                        'type': 'intermediate',
+                        'message': '开始处理问题...'
+                    }))
+
+                # 创建回调函数用于发送中间输出
+                async def send_intermediate_output(message):
+                    logger.info(f"中间输出: {message}")
+                    if ws in active_connections:
+                        try:
+                            await ws.send_str(json.dumps({
+                                'type': 'intermediate',
+                                'message': message
+                            }))
+                        except Exception as e:
+                            logger.error(f"发送中间输出失败: {str(e)}")
+
+                # 创建回调函数用于流式发送模型输出
+                async def send_delta(msg_id, text, reset):
+                    if ws in active_connections:
+                        try:
+                            await ws.send_str(json.dumps({
+                                'type': 'delta',
+                                'id': msg_id,
+                                'text': text,
+                                'reset': reset
+                            }))
+                        except Exception as e:
+                            logger.error(f"发送流式输出失败: {str(e)}")
+
+                # 创建回调函数用于发送ReAct过程事件（推理轮次、工具调用等）
+                async def send_event(event):
+                    logger.info(f"ReAct事件: {event.type} {json.dumps(event.data, ensure_ascii=False)}")
+                    if ws in active_connections:
+                        try:
+                            await ws.send_str(json.dumps({
+                                'type': event.type,
+                                'timestamp': event.timestamp,
+                                **event.data
+                            }))
+                        except Exception as e:
+                            logger.error(f"发送ReAct事件失败: {str(e)}")
+
+                # 创建回调函数用于推送排队位置和预计等待时间
+                async def send_queue_position(position, estimated_wait):
+                    if ws in active_connections:
+                        await ws.send_str(json.dumps({
+                            'type': 'queued',
+                            'position': position,
+                            'estimated_wait': estimated_wait
+                        }))
+
+                # 处理用户问题（经调度器排队，限制同时处理的问题数）
+                try:
+                    logger.info("开始调用main函数处理问题")
+                    client_id = client_identity(request, config) or str(id(ws))
+                    async with request.app[scheduler_key].slot(client_id, send_queue_position):
+                        agent_runs.add(asyncio.current_task())
+                        try:
+                            # 超过处理时限时取消agent运行，中止进行中的模型和MCP请求
+                            result = await asyncio.wait_for(
+                                main(question, send_intermediate_output, config,
+                                     pool=request.app[fund_pool_key], on_delta=send_delta,
+                                     on_event=send_event, memory=conversation),
+                                timeout=question_timeout)
+                        finally:
+                            agent_runs.discard(asyncio.current_task())
+                    logger.info(f"main函数返回结果: {result}")
+
+                    # 保存问答记录到文件
+                    await save_qa_record(question, result, request.app[history_store_key])
+
+                    # 写入问答缓存（失败的回答不缓存）
+                    failed = str(result).startswith(ERROR_PREFIX)
+                    metrics.WS_QUESTIONS.inc(outcome='error' if failed else 'answered')
+                    if answer_cache is not None and not failed:
+                        answer_cache.put(question, result)
+
+                    # 发送最终结果
+                    if ws in active_connections:
+                        await ws.send_str(json.dumps({
+                            'type': 'result',
+                            'response': result
+                        }))
+                except QueueFullError as e:
+                    logger.warning(f"排队已满，拒绝问题: {question}")
+                    metrics.WS_QUESTIONS.inc(outcome='rejected')
+                    if ws in active_connections:
+                        await ws.send_str(json.dumps({
+                            'type': 'busy',
+                            'message': str(e),
+                            'retry_after': e.retry_after
+                        }))
+                except asyncio.TimeoutError:
+                    logger.warning(f"问题处理超时（{question_timeout}秒），已取消: {question}")
+                    metrics.WS_QUESTIONS.inc(outcome='timeout')
+                    metrics.AGENT_RUNS_CANCELLED.inc(reason='timeout')
+                    if ws in active_connections:
+                        await ws.send_str(json.dumps({
+                            'type': 'error',
+                            'message': f"处理超时（超过{question_timeout}秒），请简化问题后重试"
+                        }))
+                except Exception as e:
+                    logger.error(f"处理问题时发生错误: {str(e)}", exc_info=True)
+                    metrics.WS_QUESTIONS.inc(outcome='error')
+                    if ws in active_connections:
+                        await ws.send_str(json.dumps({
+                            'type': 'error',
+                            'message': f"处理问题时发生错误: {str(e)}"
+                        }))
+    
     try:
         async for msg in ws:
             if msg.type == WSMsgType.TEXT:
                 try:
                     data = json.loads(msg.data)
                     question = data.get('question', '')
+                    force_refresh = bool(data.get('force_refresh', False))
                     logger.info(f"收到问题: {question}")
                     
                     if question:
-                        # 发送开始处理信号
-                        if ws in active_connections:
-                            await ws.send_str(json.dumps({
-                                'type': 'intermediate',
-                                'message': '开始处理问题...'
-                            }))
-                        
-                        # 创建回调函数用于发送中间输出
-                        async def send_intermediate_output(message):
-                            logger.info(f"中间输出: {message}")
-                            if ws in active_connections:
-                                try:
-                                    await ws.send_str(json.dumps({
-                                        'type': 'intermediate',
-                                        'message': message
-                                    }))
-                                except Exception as e:
-                                    logger.error(f"发送中间输出失败: {str(e)}")
-                        
-                        # 处理用户问题
-                        try:
-                            logger.info("开始调用main函数处理问题")
-                            result = await main(question, send_intermediate_output, config)
-                            logger.info(f"main函数返回结果: {result}")
-                            
-                            # 保存问答记录到文件
-                            await save_qa_record(question, result)
-                            
-                            # 发送最终结果
-                            if ws in active_connections:
-                                await ws.send_str(json.dumps({
-                                    'type': 'result',
-                                    'response': result
-                                }))
-                        except Exception as e:
-                            logger.error(f"处理问题时发生错误: {str(e)}", exc_info=True)
-                            if ws in active_connections:
-                                await ws.send_str(json.dumps({
-                                    'type': 'error',
-                                    'message': f"处理问题时发生错误: {str(e)}"
-                                }))
+                        # 问题在单独的任务中处理，同时继续读取连接，客户端断开时可以及时取消
+                        task = asyncio.create_task(answer_question(question, force_refresh))
+                        pending.add(task)
+                        task.add_done_callback(pending.discard)
                     else:
                         logger.warning("收到空问题")
+                        metrics.WS_QUESTIONS.inc(outcome='empty')
                         
                 except json.JSONDecodeError as e:
                     logger.error(f"JSON解析错误: {str(e)}")
@@ -171,12 +341,24 @@ async def websocket_handler(request, config):
     
     finally:
         active_connections.discard(ws)
+        if pending:
+            # 客户端已断开，取消未完成的问题，避免继续消耗模型token和MCP调用额度
+            unfinished = list(pending)
+            for task in unfinished:
+                task.cancel()
+            # 排队中或直接返回缓存的问题没有运行agent，不计入取消的agent运行
+            running = sum(1 for task in unfinished if task in agent_runs)
+            if running:
+                metrics.AGENT_RUNS_CANCELLED.inc(running, reason='disconnect')
+            logger.info(f"客户端已断开，取消 {len(unfinished)} 个未完成的问题")
+            await asyncio.gather(*unfinished, return_exceptions=True)
+        metrics.WS_CONNECTIONS.dec()
         logger.info("WebSocket连接已关闭")
     
     return ws
 
-async def save_qa_record(question, answer):
-    """保存问答记录到Markdown文件"""
+async def save_qa_record(question, answer, history_store=None):
+    """保存问答记录到Markdown文件，并写入历史记录索引"""
     # 创建results目录（如果不存在）
     results_dir = 'results'
     if not os.path.exists(results_dir):
@@ -184,17 +366,27 @@ async def save_qa_record(question, answer):
     
     # 生成文件名（使用时间戳）
     import datetime
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    now = datetime.datetime.now()
+    timestamp = now.strftime("%Y%m%d_%H%M%S")
     filename = f"{timestamp}.md"
     filepath = os.path.join(results_dir, filename)
+    created_at = now.strftime('%Y-%m-%d %H:%M:%S')
     
     # 写入问答记录
     with open(filepath, 'w', encoding='utf-8') as f:
         f.write(f"# 问答记录\n\n")
-        f.write(f"**时间**: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        f.write(f"**时间**: {created_at}\n\n")
         f.write(f"**问题**:\n\n{question}\n\n")
         f.write(f"**答案**:\n\n{answer}\n\n")
     
+    if history_store is not None:
+        # 索引写入失败不影响本次回答，下次启动时核对 results/ 目录会补录
+        try:
+            await asyncio.to_thread(
+                history_store.add, filename, created_at, os.path.getsize(filepath), str(question), str(answer)
+            )
+        except Exception as e:
+            logger.error(f"写入历史记录索引失败: {str(e)}")
     logger.info(f"问答记录已保存: {filepath}")
 
 async def index_handler(request):
@@ -206,6 +398,126 @@ async def health_check(request):
     """健康检查接口"""
     return web.Response(text='OK', status=200)
 
+async def cache_stats_handler(request):
+    """返回问答缓存和工具结果缓存的命中统计"""
+    answer_cache = request.app[answer_cache_key]
+    tool_cache = get_tool_cache(request.app[config_key])
+    complexity_router = get_complexity_router(request.app[config_key])
+    speculation = get_speculative_prefetcher(request.app[config_key])
+    fan_out = get_fan_out_planner(request.app[config_key])
+    return web.json_response({
+        'answer_cache': answer_cache.stats() if answer_cache is not None else None,
+        'tool_cache': tool_cache.stats() if tool_cache is not None else None,
+        'model_endpoints': endpoint_stats(),
+        'query_classes': complexity_router.stats() if complexity_router is not None else None,
+        'speculation': speculation.stats() if speculation is not None else None,
+        'fan_out': fan_out.stats() if fan_out is not None else None,
+    })
+
+async def batch_handler(request):
+    """
+    批量问答接口
+    
+    请求体为JSON {"questions": [...], "concurrency": 4, "force_refresh": false}，
+    或JSONL（每行一个问题，concurrency/force_refresh 通过查询参数指定）。
+    按完成顺序以NDJSON逐条返回每个问题的结果，最后一行为汇总
+    """
+    config = request.app[config_key]
+    batch_config = config.get('batch', {})
+    
+    try:
+        if request.content_type == 'application/json':
+            data = await request.json()
+            if not isinstance(data, dict):
+                raise ValueError('请求体应为JSON对象')
+            questions = parse_questions(data.get('questions', []))
+            options = data
+        else:
+            questions = parse_jsonl(await request.text())
+            options = request.query
+        concurrency = int(options.get('concurrency', batch_config.get('concurrency', 4)))
+        force_refresh = str(options.get('force_refresh', False)).lower() in ('true', '1')
+    except ValueError as e:
+        return web.json_response({'success': False, 'message': f"请求格式错误: {str(e)}"}, status=400)
+    
+    if not questions:
+        return web.json_response({'success': False, 'message': '未提供问题'}, status=400)
+    max_questions = batch_config.get('max_questions', 500)
+    if len(questions) > max_questions:
+        return web.json_response({'success': False, 'message': f"单次最多提交{max_questions}个问题"}, status=400)
+    concurrency = max(1, min(concurrency, batch_config.get('max_concurrency', 8)))
+    batch_slots = request.app[batch_slots_key]
+    if batch_slots.locked():
+        return web.json_response({'success': False, 'message': '批量任务较多，请稍后重试'}, status=429)
+    
+    async with batch_slots:
+        return await _stream_batch(request, questions, concurrency, force_refresh)
+
+async def _stream_batch(request, questions, concurrency, force_refresh):
+    """按完成顺序以NDJSON逐条写出批量问答结果"""
+    config = request.app[config_key]
+    logger.info(f"开始批量处理 {len(questions)} 个问题，并发数: {concurrency}")
+    response = web.StreamResponse(headers={
+        'Content-Type': 'application/x-ndjson; charset=utf-8',
+        'Access-Control-Allow-Origin': '*'
+    })
+    await response.prepare(request)
+    # 每个问题都从调度器获取名额，与WebSocket提问共用预热池的并发上限
+    results = run_batch(questions, config, request.app[fund_pool_key], concurrency=concurrency,
+                        answer_cache=request.app[answer_cache_key], force_refresh=force_refresh,
+                        scheduler=request.app[scheduler_key], client_id=f"batch:{client_identity(request, config)}")
+    try:
+        async for result in results:
+            if result['type'] == 'summary':
+                logger.info(f"批量处理完成: {json.dumps(result, ensure_ascii=False)}")
+            await response.write((json.dumps(result, ensure_ascii=False) + '\n').encode('utf-8'))
+    finally:
+        # 客户端断开时立即取消未完成的问题
+        await results.aclose()
+    await response.write_eof()
+    return response
+
+async def metrics_handler(request):
+    """以Prometheus文本格式返回运行指标"""
+    config = request.app[config_key]
+    answer_cache = request.app[answer_cache_key]
+    tool_cache = get_tool_cache(config)
+    single_flight = get_single_flight(config)
+    if answer_cache is not None:
+        metrics.record_cache_stats('answer', answer_cache.stats())
+    if tool_cache is not None:
+        metrics.record_cache_stats('tool', tool_cache.stats())
+    if single_flight is not None:
+        metrics.record_cache_stats('single_flight', single_flight.stats())
+    nav_store = get_nav_store(config)
+    if nav_store is not None:
+        metrics.record_cache_stats('nav_store', nav_store.stats())
+    fund_resolver = get_fund_resolver(config)
+    if fund_resolver is not None:
+        metrics.record_cache_stats('fund_resolver', fund_resolver.stats())
+    speculation = get_speculative_prefetcher(config)
+    if speculation is not None:
+        metrics.record_cache_stats('speculation', speculation.stats())
+    fan_out = get_fan_out_planner(config)
+    if fan_out is not None:
+        metrics.record_cache_stats('fan_out', fan_out.stats())
+    metrics.record_model_endpoint_stats(endpoint_stats())
+    metrics.record_pool_stats(request.app[fund_pool_key].stats())
+    session_pool = get_session_pool(config)
+    if session_pool is not None:
+        metrics.record_session_pool_stats(session_pool.stats())
+    return web.Response(
+        text=metrics.REGISTRY.render(),
+        headers={'Content-Type': metrics.CONTENT_TYPE}
+    )
+
+async def prefetch_status_handler(request):
+    """返回关注基金数据预取的状态和进度"""
+    prefetcher = request.app[prefetch_key]
+    if prefetcher is None:
+        return web.json_response({'enabled': False})
+    return web.json_response({'enabled': True, **prefetcher.status()})
+
 async def history_handler(request):
     """返回历史记录页面"""
     with open('templates/history.html', 'r', encoding='utf-8') as f:
@@ -233,8 +545,29 @@ async def history_content_handler(request):
             return web.Response(text=content, content_type='text/markdown')
         else:
             return web.Response(status=404, text="File not found")
+    
+    history_store = request.app[history_store_key]
+    if history_store is not None:
+        if not any(name in request.query for name in ('limit', 'cursor', 'sort', 'order', 'start', 'end')):
+            # 不带分页参数时保持原有格式：全部文件名，最新的在前
+            return web.json_response({'files': await asyncio.to_thread(history_store.filenames)})
+        page_size = request.app[config_key].get('history', {}).get('page_size', 50)
+        try:
+            page = await asyncio.to_thread(
+                history_store.page,
+                limit=max(1, min(int(request.query.get('limit', page_size)), 500)),
+                cursor=request.query.get('cursor') or None,
+                sort=request.query.get('sort', 'time'),
+                order=request.query.get('order', 'desc'),
+                start_date=request.query.get('start') or None,
+                end_date=request.query.get('end') or None,
+            )
+        except ValueError as e:
+            return web.json_response({'success': False, 'message': f"请求参数错误: {str(e)}"}, status=400)
+        page['files'] = [item['filename'] for item in page['items']]
+        return web.json_response(page)
     else:
-        # 返回所有历史记录文件列表
+        # 未启用历史记录索引时扫描目录，返回所有历史记录文件列表
         pattern = os.path.join(results_dir, '*.md')
         files = glob.glob(pattern)
         # 按修改时间排序，最新的在前
@@ -265,6 +598,8 @@ async def delete_history_handler(request):
         results_dir = 'results'
         deleted_files = []
         failed_files = []
+        # 需要从历史记录索引中移除的文件（已删除或已不存在）
+        unindexed_files = []
         
         for filename in filenames:
             # 验证文件名格式
@@ -282,17 +617,23 @@ async def delete_history_handler(request):
             # 检查文件是否存在
             if not os.path.exists(filepath):
                 failed_files.append({'filename': filename, 'reason': '文件不存在'})
+                unindexed_files.append(filename)
                 continue
                 
             # 删除文件
             try:
                 os.remove(filepath)
                 deleted_files.append(filename)
+                unindexed_files.append(filename)
                 logger.info(f"已删除历史记录文件: {filepath}")
             except Exception as e:
                 failed_files.append({'filename': filename, 'reason': str(e)})
                 logger.error(f"删除历史记录文件失败: {filepath}, 错误: {str(e)}")
         
+        history_store = request.app[history_store_key]
+        if history_store is not None and unindexed_files:
+            await asyncio.to_thread(history_store.remove, unindexed_files)
+        
         return web.json_response({
             'success': True,
             'deleted_files': deleted_files,
@@ -315,13 +656,58 @@ def create_app(config=None):
     
     app = web.Application(middlewares=[cors_middleware])
     
+    # 创建基金管理助手预热池，随应用启动预热、随应用关闭释放
+    fund_pool = FundManagerPool.from_config(config)
+    app[fund_pool_key] = fund_pool
+
+    # 历史记录索引随应用创建、随应用关闭
+    history_store = HistoryStore.from_config(config)
+    app[history_store_key] = history_store
+
+    prefetcher = PrefetchScheduler.from_config(config, history_store)
+    app[prefetch_key] = prefetcher
+
+    async def start_fund_pool(app):
+        # pooled 模式下先建立MCP长连接会话
+        session_pool = get_session_pool(config)
+        if session_pool is not None:
+            await session_pool.start()
+        await fund_pool.start()
+        # 与 results/ 目录核对历史记录索引
+        if history_store is not None:
+            await asyncio.to_thread(history_store.sync)
+        if prefetcher is not None:
+            prefetcher.start()
+
+    async def close_fund_pool(app):
+        if prefetcher is not None:
+            await prefetcher.close()
+        await fund_pool.close()
+        await close_fan_out_planners()
+        await close_session_pools()
+        close_nav_stores()
+        if history_store is not None:
+            history_store.close()
+
+    app.on_startup.append(start_fund_pool)
+    app.on_cleanup.append(close_fund_pool)
+    
+    app[config_key] = config
+    app[answer_cache_key] = AnswerCache.from_config(config)
+    app[scheduler_key] = QuestionScheduler.from_config(config)
+    app[batch_slots_key] = asyncio.Semaphore(max(config.get('batch', {}).get('max_running', 1), 1))
+    
     # 添加路由
     app.router.add_get('/', index_handler)
     app.router.add_get('/health', health_check)
+    app.router.add_get('/cache-stats', cache_stats_handler)
+    app.router.add_get('/metrics', metrics_handler)
+    app.router.add_get('/prefetch-status', prefetch_status_handler)
     app.router.add_get('/ws', lambda req: websocket_handler(req, config))
     app.router.add_get('/history', history_handler)
     app.router.add_get('/history-content', history_content_handler)
     app.router.add_post('/delete-history', delete_history_handler)
+    app.router.add_post('/batch', batch_handler)
 
     # 从配置或默认值获取端口
     port = config["web_server"]["port"]